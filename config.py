@@ -6,6 +6,15 @@ DATA_DIR = ROOT / "data"
 
 DENMARK_DW_DIR = DATA_DIR / "DenmarkDynamicWorld"
 
+# Parquet results of DBMS reads, see src/query_cache.py
+QUERY_CACHE_DIR = DATA_DIR / "query_cache"
+
+# LSIB country boundaries fetched from Earth Engine, see src/boundary_store.py
+BOUNDARY_DIR = DATA_DIR / "boundaries"
+
+# Drive exports that failed to ingest, see src/ingestion.py
+INGESTION_RETRY_PATH = DATA_DIR / "ingestion_retry.jsonl"
+
 # Data directories
 DYNAMIC_WORLD_DIR = DATA_DIR / "Dynamic_World"
 TIFS_DIR = DATA_DIR / "TIFs"
@@ -162,4 +171,15 @@ CLUSTER_COLORS = {
     "3": "#ff7979",
     "4": "#6ab04c",
     "unassigned": "#535c68",
-}
\ No newline at end of file
+}
+# Database backend used by DBMS: "postgres" (the thesis server) or "embedded" (a local
+# DuckDB file, experimental, see src/backends/embedded.py). Can be overridden with
+# LULC_DB_BACKEND.
+DB_BACKEND = "postgres"
+EMBEDDED_DB_PATH = DATA_DIR / "lulc.duckdb"
+
+# Per-chip (years, H, W) Dynamic World rasters, one Zarr store per area, see
+# src/cube_store.py
+CUBE_STORE_DIR = DATA_DIR / "cubes"
+# The years the lulc partitions are created for (migration 0006), fixed per store
+CUBE_YEARS = list(range(2015, 2026))
@@ -0,0 +1,111 @@
+"""
+Dynamicity kernel (src/dynamicity.py) against the per-pixel loop change_sequences.main
+used to run.
+
+Synthetic 8-year chips are generated where most pixels keep their class and a share
+changes, with some no data. Both implementations compute the changes raster, the
+summary stats and the sequence counts, and the results are checked to be equal. The
+kernel counts sequences with a SequenceCounter over the packed sequences.
+
+    python -m scripts.benchmarks.change_sequences --chips 2 --size 1000
+"""
+
+import argparse
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from src.dynamicity import SequenceCounter, dynamics, stack_years
+
+YEARS = list(range(2016, 2024))
+
+
+def synthetic_chip(size: int, seed: int):
+    rng = np.random.default_rng(seed)
+    base = rng.integers(1, 9, (size, size), dtype=np.uint8)
+    chip_data = {}
+    for year in YEARS:
+        image = base.copy()
+        changed = rng.random((size, size)) < 0.1
+        image[changed] = rng.integers(0, 9, changed.sum(), dtype=np.uint8)
+        chip_data[year] = image
+    return chip_data
+
+
+def legacy(chip_data):
+    """The loop of change_sequences.main and make_sequence_df before the kernel."""
+    shape = chip_data[YEARS[0]].shape
+    changes = defaultdict(list)
+    raster_array = [[] for _ in range(shape[0] * shape[1])]
+    for rgdf in chip_data.values():
+        for ix, i in enumerate(rgdf.flatten()):
+            changes[ix].append(i)
+            raster_array[ix].append(i)
+
+    raster_array_, raster_array_stats = [], []
+    for sublist in raster_array:
+        if 0 in sublist:
+            raster_array_.append(-99)
+        else:
+            raster_array_.append(len(set(sublist)) - 1)
+            raster_array_stats.append(len(set(sublist)) - 1)
+
+    summary = {
+        "num_changed_tiles": sum(raster_array_stats),
+        "median": np.median(raster_array_stats),
+        "max": np.max(raster_array_stats),
+    }
+
+    sequence_dict = defaultdict(int)
+    for change_sequence in changes.values():
+        sequence_dict["|".join([str(i) for i in change_sequence])] += 1
+
+    return np.array(raster_array_).reshape(shape), summary, dict(sequence_dict)
+
+
+def kernel(chip_data):
+    stack = stack_years(chip_data, YEARS)
+    raster_array, summary = dynamics(stack, chip_data[YEARS[0]].shape)
+
+    counter = SequenceCounter(YEARS)
+    counter.add("chip", stack)
+
+    frame = counter.to_frame()
+    sequence_dict = {
+        "|".join([str(i) for i in sequence]): int(count)
+        for sequence, count in zip(
+            frame[[str(year) for year in YEARS]].to_numpy(), frame["num_tiles"]
+        )
+    }
+    return raster_array, summary, sequence_dict
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chips", type=int, default=2)
+    parser.add_argument("--size", type=int, default=1000)
+    args = parser.parse_args()
+
+    chips = [synthetic_chip(args.size, seed) for seed in range(args.chips)]
+
+    results = {}
+    for name, function in [("legacy", legacy), ("kernel", kernel)]:
+        start_time = time.time()
+        results[name] = [function(chip_data) for chip_data in chips]
+        duration = time.time() - start_time
+        print(f"{name:>7}: {duration / args.chips:8.3f} s per chip")
+
+    for (legacy_raster, legacy_summary, legacy_sequences), (
+        raster,
+        summary,
+        sequences,
+    ) in zip(results["legacy"], results["kernel"]):
+        assert np.array_equal(legacy_raster, raster)
+        assert legacy_summary == summary
+        assert legacy_sequences == sequences
+    print("Rasters, summaries and sequence counts are equal")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+In-memory rasterization of a chip's years (src/chip_raster.py) against the GeoTIFF
+round trip change_sequences.main used to make.
+
+The old path rasterized every year to a GeoTIFF on its own bounds, read it back, and
+when the shapes differed padded all years to their combined bounds on disk and read
+them again. Synthetic chips are generated with landcover polygons whose bounds shift
+slightly between years, as the polygonized Drive exports do.
+
+    python -m scripts.benchmarks.chip_rasterize --chips 3 --blocks 40
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import geopandas as gpd
+import numpy as np
+import rasterio
+import shapely
+from rasterio.features import rasterize
+from rasterio.transform import from_bounds
+from rasterio.windows import Window
+
+from src.chip_raster import rasterize_years
+
+YEARS = list(range(2016, 2024))
+
+
+def synthetic_chip(blocks: int, seed: int):
+    """year -> blocks x blocks grid of class polygons of about 100 m, in EPSG:4326."""
+    rng = np.random.default_rng(seed)
+    step = 0.0015
+    landcover = {}
+    for year in YEARS:
+        x0, y0 = 9.5 + rng.random() * step, 55.5 + rng.random() * step
+        geometries = [
+            shapely.box(x0 + i * step, y0 + j * step, x0 + (i + 1) * step, y0 + (j + 1) * step)
+            for i in range(blocks)
+            for j in range(blocks)
+        ]
+        landcover[year] = gpd.GeoDataFrame(
+            {"category_id": rng.integers(1, 9, len(geometries))},
+            geometry=geometries,
+            crs="EPSG:4326",
+        )
+    return landcover
+
+
+def legacy(landcover, directory):
+    """polygon_to_raster, read_and_pad_geotiffs and replace_tif as they were."""
+    paths = [os.path.join(directory, f"{year}.tif") for year in YEARS]
+    shapes = []
+    for year, path in zip(YEARS, paths):
+        gdf = landcover[year].to_crs(landcover[year].estimate_utm_crs())
+        bounds = gdf.total_bounds
+        width = int((bounds[2] - bounds[0]) / 10)
+        height = int((bounds[3] - bounds[1]) / 10)
+        transform = from_bounds(*bounds, width=width, height=height)
+        image = rasterize(
+            zip(gdf.geometry, gdf["category_id"]),
+            out_shape=(height, width),
+            transform=transform,
+            fill=0,
+            all_touched=True,
+            dtype=rasterio.uint8,
+        )
+        with rasterio.open(
+            path, "w", driver="GTiff", height=height, width=width, count=1,
+            dtype="uint8", crs=gdf.crs, transform=transform,
+        ) as dataset:
+            dataset.write(image, 1)
+        with rasterio.open(path) as dataset:
+            shapes.append(dataset.read(1).shape)
+
+    if len(set(shapes)) > 1:
+        datasets = [rasterio.open(path) for path in paths]
+        left = min(ds.bounds.left for ds in datasets)
+        bottom = min(ds.bounds.bottom for ds in datasets)
+        right = max(ds.bounds.right for ds in datasets)
+        top = max(ds.bounds.top for ds in datasets)
+        size_x = min(ds.res[0] for ds in datasets)
+        size_y = min(ds.res[1] for ds in datasets)
+        out_width = int(round((right - left) / size_x))
+        out_height = int(round((top - bottom) / size_y))
+        meta = datasets[0].meta.copy()
+        meta.update(
+            height=out_height,
+            width=out_width,
+            transform=from_bounds(left, bottom, right, top, out_width, out_height),
+        )
+        for dataset, path in zip(datasets, paths):
+            data = dataset.read(1)
+            off_x = int(round((dataset.bounds.left - left) / size_x))
+            off_y = int(round((top - dataset.bounds.top) / size_y))
+            dataset.close()
+            with rasterio.open(path, "w", **meta) as out:
+                out.write(np.zeros((out_height, out_width), dtype=meta["dtype"]), 1)
+                window = Window(
+                    off_x,
+                    off_y,
+                    min(data.shape[1], out_width - off_x),
+                    min(data.shape[0], out_height - off_y),
+                )
+                out.write(data, 1, window=window)
+
+    images = []
+    for path in paths:
+        with rasterio.open(path) as dataset:
+            images.append(dataset.read(1))
+    return np.stack(images)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chips", type=int, default=3)
+    parser.add_argument("--blocks", type=int, default=40)
+    args = parser.parse_args()
+
+    chips = [synthetic_chip(args.blocks, seed) for seed in range(args.chips)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        start_time = time.time()
+        legacy_cubes = [legacy(landcover, directory) for landcover in chips]
+        print(f" legacy: {(time.time() - start_time) / args.chips:8.3f} s per chip")
+
+    start_time = time.time()
+    cubes = [rasterize_years(landcover, YEARS)[0] for landcover in chips]
+    print(f"in-mem.: {(time.time() - start_time) / args.chips:8.3f} s per chip")
+
+    for legacy_cube, cube in zip(legacy_cubes, cubes):
+        print(
+            f"legacy {legacy_cube.shape}, {(legacy_cube > 0).sum()} pixels with data; "
+            f"in-memory {cube.shape}, {(cube > 0).sum()} pixels with data"
+        )
+
+
+if __name__ == "__main__":
+    main()
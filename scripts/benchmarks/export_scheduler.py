@@ -0,0 +1,128 @@
+"""
+The export scheduler (src/export_scheduler.py) against a fake ee.batch module.
+
+The fake queue starts tasks in order, runs a limited number at a time for a fixed
+duration and fails a share of them. Time is simulated, so a day of exports runs in
+seconds. The old loop listed the whole task queue for every chip and never listed it
+again while waiting, so it is compared by the number of Task.list calls only.
+
+    python -m scripts.benchmarks.export_scheduler --exports 5000 --max-in-flight 3000
+"""
+
+import argparse
+import itertools
+from types import SimpleNamespace
+
+import numpy as np
+
+from src.export_scheduler import ExportScheduler
+
+
+class SimulatedClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeTask:
+    def __init__(self, batch, params):
+        self.batch = batch
+        self.params = params
+        self.id = None
+        self.state = "UNSUBMITTED"
+
+    def start(self):
+        self.id = f"task-{next(self.batch.ids)}"
+        self.state = "READY"
+        self.batch.tasks.append(self)
+
+
+class FakeBatch:
+    """
+    Earth Engine runs `workers` tasks at a time for `duration` seconds each, and a
+    task fails with probability `failure_rate`.
+    """
+
+    def __init__(self, clock, workers=50, duration=120.0, failure_rate=0.05, seed=0):
+        self.clock = clock
+        self.workers = workers
+        self.duration = duration
+        self.failure_rate = failure_rate
+        self.rng = np.random.default_rng(seed)
+        self.ids = itertools.count()
+        self.tasks = []
+        self.started_at = {}
+        self.list_calls = 0
+        self.peak_active = 0
+
+        batch = self
+        self.Export = SimpleNamespace(
+            image=SimpleNamespace(toDrive=lambda **params: FakeTask(batch, params))
+        )
+        self.Task = SimpleNamespace(list=self.list)
+
+    def advance(self):
+        now = self.clock()
+        running = [task for task in self.tasks if task.state == "RUNNING"]
+        for task in running:
+            if now - self.started_at[task.id] >= self.duration:
+                task.state = "FAILED" if self.rng.random() < self.failure_rate else "COMPLETED"
+
+        free = self.workers - sum(task.state == "RUNNING" for task in self.tasks)
+        for task in self.tasks:
+            if free <= 0:
+                break
+            if task.state == "READY":
+                task.state = "RUNNING"
+                self.started_at[task.id] = now
+                free -= 1
+
+    def list(self):
+        self.list_calls += 1
+        self.advance()
+        active = sum(task.state in ("READY", "RUNNING") for task in self.tasks)
+        self.peak_active = max(self.peak_active, active)
+        return list(self.tasks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--exports", type=int, default=5000)
+    parser.add_argument("--max-in-flight", type=int, default=3000)
+    parser.add_argument("--poll-interval", type=float, default=30.0)
+    parser.add_argument("--failure-rate", type=float, default=0.05)
+    args = parser.parse_args()
+
+    clock = SimulatedClock()
+    batch = FakeBatch(clock, failure_rate=args.failure_rate)
+    scheduler = ExportScheduler(
+        batch,
+        max_in_flight=args.max_in_flight,
+        poll_interval=args.poll_interval,
+        clock=clock,
+        sleep=clock.sleep,
+    )
+
+    for ix in range(args.exports):
+        scheduler.submit(f"chip_{ix}", {"fileNamePrefix": f"chip_{ix}"})
+        # Building and submitting an export takes a moment
+        clock.sleep(0.5)
+    scheduler.drain()
+
+    states = [task.state for task in batch.tasks]
+    assert states.count("COMPLETED") + len(scheduler.failed) == args.exports
+    assert batch.peak_active <= args.max_in_flight
+    print(
+        f"{args.exports} exports in {clock.now / 3600:.1f} simulated hours, "
+        f"{batch.list_calls} Task.list calls (the old loop made {args.exports}), "
+        f"{len(scheduler.failed)} failed for good"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Throughput of data_handlers.polygonize against the old per-shape loop.
+
+Synthetic Dynamic World-like chips are generated: 1000 x 1000 pixels of 10 m in
+EPSG:25832, made of class patches with noisy edges. Both implementations convert them
+to EPSG:4326 polygons, and the results are checked to cover the same area per class.
+
+With --workers, the chips are also written to GeoTIFF bytes like a DriveManager page
+and converted by raster_dict2geo with 1 and with the given number of processes.
+
+    python -m scripts.benchmarks.polygonize --chips 5
+    python -m scripts.benchmarks.polygonize --chips 16 --workers 8
+"""
+
+import argparse
+import time
+
+import geopandas as gpd
+import numpy as np
+from rasterio.features import shapes
+from rasterio.io import MemoryFile
+from rasterio.transform import from_origin
+from shapely.geometry import shape
+
+from config import EPSG_MAPPING
+from src.data_handlers import polygonize, raster_dict2geo
+
+CRS = f"EPSG:{EPSG_MAPPING['Denmark']}"
+
+
+def synthetic_chip(size: int = 1000, patch: int = 25, seed: int = 0) -> np.ndarray:
+    """Blocky landcover patches with 10 % noisy pixels, classes 1-8 (0 is nodata)."""
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(1, 9, (size // patch + 1, size // patch + 1), dtype=np.uint8)
+    image = np.kron(coarse, np.ones((patch, patch), dtype=np.uint8))[:size, :size]
+
+    noise = rng.random((size, size)) < 0.1
+    image[noise] = rng.integers(1, 9, noise.sum(), dtype=np.uint8)
+    return image
+
+
+def chip_to_tif(image, transform) -> bytes:
+    with MemoryFile() as memfile:
+        with memfile.open(
+            driver="GTiff",
+            height=image.shape[0],
+            width=image.shape[1],
+            count=1,
+            dtype=image.dtype,
+            crs=CRS,
+            transform=transform,
+        ) as dataset:
+            dataset.write(image, 1)
+        return memfile.read()
+
+
+def legacy_polygonize(image, transform, crs):
+    """The loop rasterfile2geo, raster2geo and scripts/raster2geometry used to run."""
+    mask = image != 0
+    polygons = []
+    values = []
+    for geom, value in shapes(image, mask=mask, transform=transform):
+        polygons.append(shape(geom))
+        values.append(value)
+
+    gdf = gpd.GeoDataFrame({"landcover": values, "geometry": polygons})
+    gdf["landcover"] = gdf["landcover"].astype(int)
+    gdf.crs = crs
+    return gdf.to_crs(epsg=4326)
+
+
+def area_per_class(gdf):
+    return gdf.to_crs(CRS).assign(area=lambda df: df.area).groupby("landcover")["area"].sum()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chips", type=int, default=5)
+    parser.add_argument("--size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    transform = from_origin(500_000, 6_200_000, 10, 10)
+    chips = [synthetic_chip(args.size, seed=seed) for seed in range(args.chips)]
+
+    results = {}
+    for name, function in [("legacy", legacy_polygonize), ("polygonize", polygonize)]:
+        start_time = time.time()
+        frames = [function(chip, transform, CRS) for chip in chips]
+        duration = time.time() - start_time
+
+        results[name] = frames
+        print(
+            f"{name:>10}: {args.chips / duration:6.2f} chips/s  "
+            f"({sum(frame.shape[0] for frame in frames) / args.chips:.0f} polygons per chip)"
+        )
+
+    legacy_area = area_per_class(results["legacy"][0])
+    new_area = area_per_class(results["polygonize"][0])
+    print(
+        "Max relative area difference per class:",
+        float(((legacy_area - new_area).abs() / legacy_area).max()),
+    )
+
+    if args.workers is None:
+        return
+
+    # Named like the Drive exports: {chipid}_{year}_...
+    page = {
+        f"{ix}_0_0_{2016 + ix % 8}_DW.tif": chip_to_tif(chip, transform)
+        for ix, chip in enumerate(chips)
+    }
+    for workers in sorted({1, args.workers}):
+        start_time = time.time()
+        raster_dict2geo(page, workers=workers)
+        duration = time.time() - start_time
+        print(f"raster_dict2geo, {workers:>2} workers: {args.chips / duration:6.2f} chips/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@ from sys import path
 #path.append('../')
 from src.DataBaseManager import DBMS
 import numpy as np
-from src.verify_DW_crops import create_chip_chunks,sql_list_strings
+from src.verify_DW_crops import create_chip_chunks
 from tqdm import tqdm
 import time
 import os
@@ -11,9 +11,7 @@ import sys
 
 import geopandas as gpd
 import rasterio
-from rasterio.windows import Window
-from rasterio.features import rasterize
-from rasterio.transform import from_origin,from_bounds
+from rasterio.transform import from_origin
 from rasterio.io import MemoryFile
 
 from typing import List, Dict
@@ -22,178 +20,25 @@ import pandas as pd
 
 from collections import defaultdict
 import json
+import argparse
+from pathlib import Path
 
 from config import LAND_COVER_LEGEND
+from src.boundary_store import BoundaryStore
+from src.chip_raster import grid_from_chip_id, rasterize_years, write_raster
+from src.chip_runner import DONE, ChipManifest, run_chips
+from src.dynamicity import NODATA_DYNAMICS, SequenceCounter, dynamics
 numeric_legend = {v:k for k,v in LAND_COVER_LEGEND.items()}
 
-def replace_tif(path):
-    # Read the first band back from the saved file to return
-    with rasterio.open(path) as dataset:
-        band1 = dataset.read(1)
-    
-    return band1
-
-def merge_df(df1,df2):
-    # Merging DataFrames on multiple columns with an outer join
-    merged_df = pd.merge(df1, df2, on=['2016', '2017', '2018', '2019', '2020', '2021', '2022', '2023'], how='outer', suffixes=('_df1', '_df2'))
-
-    # Fill NaN with 0s for numerical operation
-    merged_df['num_tiles_df1'].fillna(0, inplace=True)
-    merged_df['num_tiles_df2'].fillna(0, inplace=True)
-
-    # Summing up the 'num_tiles' columns
-    merged_df['num_tiles'] = merged_df['num_tiles_df1'].astype(int) + merged_df['num_tiles_df2'].astype(int)
-
-    # Select the relevant columns (if desired) or drop the intermediary columns
-    final_df = merged_df.drop(columns=['num_tiles_df1', 'num_tiles_df2'])
-
-    return final_df
-
-
-def calculate_combined_bounds(datasets):
-    """Calculate the combined bounds of all datasets."""
-    bounds = [ds.bounds for ds in datasets]
-    min_left = min(b.left for b in bounds)
-    min_bottom = min(b.bottom for b in bounds)
-    max_right = max(b.right for b in bounds)
-    max_top = max(b.top for b in bounds)
-    return (min_left, min_bottom, max_right, max_top)
-
-def read_and_pad_geotiffs(paths):
-    datasets = [rasterio.open(path) for path in paths]
-    combined_bounds = calculate_combined_bounds(datasets)
-    min_left, min_bottom, max_right, max_top = combined_bounds
-
-    # Determine the output resolution as the finest (smallest) of the input resolutions
-    pixel_size_x = min(ds.res[0] for ds in datasets)
-    pixel_size_y = min(ds.res[1] for ds in datasets)
-    
-    # Calculate output dimensions more carefully to avoid off-by-one errors
-    out_width = int(round((max_right - min_left) / pixel_size_x))
-    out_height = int(round((max_top - min_bottom) / pixel_size_y))
-    
-    # Prepare metadata for output
-    out_meta = datasets[0].meta.copy()
-    out_meta.update({
-        "driver": "GTiff",
-        "height": out_height,
-        "width": out_width,
-        "transform": rasterio.transform.from_bounds(min_left, min_bottom, max_right, max_top, out_width, out_height)
-    })
-    
-    # Process each dataset individually
-    for dataset, path in zip(datasets, paths):
-        data = dataset.read(1)
-        # Calculate offsets more accurately
-        off_x = int(round((dataset.bounds.left - min_left) / pixel_size_x))
-        off_y = int(round((max_top - dataset.bounds.top) / pixel_size_y))
-        # Prepare output filename
-        dirname, basename = os.path.split(path)
-        filename, ext = os.path.splitext(basename)
-        output_filename = os.path.join(dirname, f"{filename}{ext}")
-        # Create output dataset
-        with rasterio.open(output_filename, 'w', **out_meta) as out_ds:
-            # Initialize output with zeros
-            out_ds.write(np.zeros((out_height, out_width), dtype=out_meta['dtype']), 1)
-            # Write data to the new file, adjusting for the calculated window
-            window = Window(off_x, off_y, min(data.shape[1], out_width - off_x), min(data.shape[0], out_height - off_y))
-            out_ds.write(data, 1, window=window)
-
-
-    # Close all datasets
-    for ds in datasets:
-        ds.close()
-
-
-def replace_raster_band1(original_path, new_path, new_band1_data):
-    """
-    Create a new raster file with the first band replaced by new data, preserving the other bands and original geographic information.
-
-    Parameters:
-    - original_path: str, path to the original raster file.
-    - new_path: str, path where the new raster file will be saved.
-    - new_band1_data: np.array, new data for the first band, must match the dimensions of the original first band.
-
-    Returns:
-    - None
-    """
-    # Open the original raster file to read metadata and data
-    with rasterio.open(original_path, 'r') as src:
-        # Check if the new data dimensions match the first band's dimensions
-        if new_band1_data.shape != (src.height, src.width):
-            raise ValueError("New data dimensions do not match the original first band's dimensions")
-
-        # Copy metadata from the original file
-        meta = src.meta.copy()
-
-        # Create a new raster file using the same metadata
-        with rasterio.open(new_path, 'w', **meta) as dst:
-            # Write new data to the first band
-            dst.write(new_band1_data, 1)
-
-            # Write original data to all other bands
-            for i in range(2, src.count + 1):
-                band_data = src.read(i)
-                dst.write(band_data, i)
-
-
-def polygon_to_raster(gdf, output_path, pixel_size=10):
-    """
-    Convert a GeoDataFrame of polygons and landcover IDs to a raster file on disk.
-
-    Args:
-        gdf (geopandas.GeoDataFrame): GeoDataFrame containing polygon geometries and a 'category_id' column.
-        output_path (str): Path where the raster file will be saved.
-        pixel_size (float): Desired pixel size in meters.
-
-    Returns:
-        np.ndarray: An array representing the first band of the created raster dataset.
-    """
-    # Ensure the GeoDataFrame has a projected CRS suitable for meters
-    if gdf.crs.is_geographic:
-        # Assuming the data is in a CRS that can be projected to a UTM automatically
-        gdf = gdf.to_crs(gdf.estimate_utm_crs())
-
-    # Calculate bounds and dimensions
-    bounds = gdf.total_bounds
-    width = int((bounds[2] - bounds[0]) / pixel_size)
-    height = int((bounds[3] - bounds[1]) / pixel_size)
-
-    # Define the transformation
-    transform = from_bounds(*bounds, width=width, height=height)
-
-    # Rasterize the data
-    out_array = rasterize(
-        [(shape, val) for shape, val in zip(gdf.geometry, gdf['category_id'])],
-        out_shape=(height, width),
-        transform=transform,
-        fill=0,  # Background value
-        all_touched=True,
-        dtype=rasterio.uint8
-    )
-
-    # Save raster data to file
-    with rasterio.open(
-        output_path, 'w',
-        driver='GTiff',
-        height=height,
-        width=width,
-        count=1,
-        dtype='uint8',
-        crs=gdf.crs,
-        transform=transform
-    ) as dataset:
-        dataset.write(out_array, 1)
-
-    # Read the first band back from the saved file to return
-    with rasterio.open(output_path) as dataset:
-        band1 = dataset.read(1)
-    
-    return band1
-
-
-
-
+DYNAMICITY_CSV = "data/dynamicity/dynamicity.csv"
+CHANGE_SEQUENCES_CSV = "data/dynamicity/change_sequences.csv"
+# Packed sequence counts and the chips counted so far, see SequenceCounter
+SEQUENCE_CHECKPOINT = "data/dynamicity/change_sequences.npz"
+# Manifest and per-chip shards of run_parallel
+RUN_DIR = Path("data/dynamicity/run")
+YEARS = [i for i in range(2016,2024)]
+# Times a worker reads a chip before it is marked failed
+DB_ATTEMPTS = 3
 
 def save_raster(path, array, transform=None, crs='EPSG:4326'):
     """
@@ -226,115 +71,64 @@ def save_raster(path, array, transform=None, crs='EPSG:4326'):
 
 
 
-def make_sequence_df(changes,change_dpath="data/dynamicity/change_sequences.csv"):
-    years = [i for i in range(2016,2024)]
-
-    
-
-    sequence_dict = defaultdict(int)
-    for chipid,dd in changes.items():
-
-        for pix, change_sequence in dd.items():
-            
-            change_sequence_str = '|'.join([str(i) for i in change_sequence])
-
-            sequence_dict[change_sequence_str]+=1
-
-                
-        
-
-    sequence_frame_dict = {str(y):[] for y in years}
-    sequence_frame_dict['num_tiles'] = []
-            
-    lens = 0
-    x = 0 
-    for change_sequence_str,counts in sequence_dict.items():
-
-            
-        for year_ix,cat_id in enumerate(change_sequence_str.split('|')):
-            
-            sequence_frame_dict[str(years[year_ix])].append(int(cat_id))
-
-        if len(change_sequence_str.split('|')) != 8:
-            for j in range(8-len(change_sequence_str.split('|'))):
-                sequence_frame_dict[str(years[-1-j])].append(0)
-
-        
-        sequence_frame_dict["num_tiles"].append(int(counts))
-
-
-        
-        x+=1
-
-    
-
-    sequence_frame = pd.DataFrame(sequence_frame_dict)
-    
-    #sequence_frame.to_csv("deubug_dis.csv")
-
-    # if the change path exists then do this
-    if os.path.exists(change_dpath):
-        change_df = pd.read_csv(change_dpath)[list(sequence_frame.columns)]
-        if 1==0:
-            print(sequence_frame.columns)
-            print(change_df.columns)
-
-            for ix in range(len(change_df.columns)):
-                print(change_df.columns[ix],type(change_df.columns[ix]),change_df[change_df.columns[ix]][0],type(change_df[change_df.columns[ix]][0]))
-                print(sequence_frame.columns[ix],type(sequence_frame.columns[ix]),sequence_frame[sequence_frame.columns[ix]][0],type(sequence_frame[sequence_frame.columns[ix]][0]))
-                print('\n\n')
-            
-
-        sequence_frame = merge_df(change_df,sequence_frame)
-        print("SUCCESSFUL MERGE")
-
-    
+def load_sequence_counter(years):
+    """
+    Resume the sequence counts from the last checkpoint.
 
+    Without one, an existing change_sequences.csv export is counted instead, with the
+    chips of dynamicity.csv as the counted chips.
+    """
+    if os.path.exists(SEQUENCE_CHECKPOINT):
+        counter = SequenceCounter.load(SEQUENCE_CHECKPOINT)
+        print(f"RESUMING {len(counter.chips)} COUNTED CHIPS FROM CHECKPOINT")
+        return counter
 
-    return sequence_frame
+    counter = SequenceCounter(years)
+    if os.path.exists(CHANGE_SEQUENCES_CSV):
+        counter.add_frame(pd.read_csv(CHANGE_SEQUENCES_CSV))
+        if os.path.exists(DYNAMICITY_CSV):
+            counter.chips = set(pd.read_csv(DYNAMICITY_CSV)["chip"].astype(str))
+    return counter
 
 
-def delete_file(file_path):
+def save_progress(counter, dynamicity_frames):
     """
-    Deletes a file at the specified path.
+    Checkpoint the sequence counts, then append the dynamicity rows of the same chips.
 
-    Parameters:
-    - file_path: str, the path to the file to be deleted.
-
-    Returns:
-    - None, but prints a message confirming deletion or an error.
+    A chip is only skipped on a rerun once it is in dynamicity.csv, and the counter
+    ignores chips it already counted, so a crash in between counts no chip twice.
     """
-    try:
-        os.remove(file_path)
-    except:
-        pass
-
-
-# Example usage:
-# delete_file('path_to_your_file.txt')
+    counter.save(SEQUENCE_CHECKPOINT)
 
+    if dynamicity_frames:
+        # if the dynamicity.csv file does not exist then create it
+        frame = pd.concat(dynamicity_frames)
+        if os.path.exists(DYNAMICITY_CSV):
+            frame.to_csv(DYNAMICITY_CSV,mode='a',header=False)
+        else:
+            frame.to_csv(DYNAMICITY_CSV)
+        dynamicity_frames.clear()
 
-# Example usage:
-# import numpy as np
-# array = np.random.randint(0, 255, (100, 100), dtype=np.uint8)  # Example data
-# save_raster('path_to_output.tif', array)
 
+def export_sequences(counter):
+    """Decode the counted sequences to one column per year and write change_sequences.csv"""
+    counter.to_frame().to_csv(CHANGE_SEQUENCES_CSV)
 
 
-def get_all_chipids(DB):
+def get_all_chipids(DB,skip_done=True):
 
     AREA = "Denmark"
 
     Q1 = "GET_ONLY_CHIPIDS_FROM_AREA"
-    Q1_params = {"_AREA_":AREA}
+    Q1_params = {"area":AREA}
 
 
     chips = DB.read(Q1,params=Q1_params)
     og_size = chips.chipid.nunique()
 
     # if "data/dynamicity/dynamicity.csv" exists
-    if os.path.exists("data/dynamicity/dynamicity.csv"):
-        chipids = pd.read_csv("data/dynamicity/dynamicity.csv")['chip'].unique().tolist()
+    if skip_done and os.path.exists(DYNAMICITY_CSV):
+        chipids = pd.read_csv(DYNAMICITY_CSV)['chip'].unique().tolist()
 
         chips = chips[~chips["chipid"].isin(chipids)]
 
@@ -357,21 +151,88 @@ def process_gdf(gdf,numeric_legend=numeric_legend):
 
 
 
-def main(chips: pd.DataFrame,DB,AREA = 'Denmark',verbose=True):
+def read_chip_landcover(chip,DB,AREA,years):
+    """The landcover polygons of a chip by year, with their category_id"""
+    landcover_years = {}
+    for year in tqdm(years,desc="Getting each yearly chip"):
+        # Get the current chip as a GDF
+        landcover = DB.read("GET_CHIP_LANDCOVER",params={"chipid":chip,"year":year,"area":AREA},geom_col="geometries",geom_query=True)
+
+        # make geometry column from geometries to geometry and rename columns accoding to our legend
+        landcover_years[year] = process_gdf(landcover)
+    return landcover_years
+
+
+def chip_dynamicity(chip,landcover_years,years,grid_params,raster_dir=None,verbose=False):
+    """
+    Rasterize the years of a chip and compute its dynamics.
 
-    # Query name
-    Q2 = "GET_CHIP_LANDCOVER"
+    :param grid_params: Grid parameters of the chip's area, see BoundaryStore.grid_params
+    :param raster_dir: Directory to write {chip}_dynamics.tif to, None to skip it
+    :return: the chip's dynamicity row and its (years, pixels) stack of classes
+    """
+    if verbose:
+        print("RASTERIZING YEARS ONTO THE CHIP GRID")
+    # Every year is rasterized in memory onto the grid of the chip's cell, so the
+    # (years, H, W) cube needs no padding and is the same for every run
+    cube, grid = rasterize_years(landcover_years, years, grid=grid_from_chip_id(chip, grid_params))
+
+    # One column per pixel holding its class in every year
+    stack = cube.reshape(len(years), -1)
+
+    print("Array Length:",stack.shape[1])
+    if verbose:
+        print("SEQUENCE CREATED")
+
+    # The number of different values present in the tile over time, s.t a change
+    # sequence [1,1,1,1,1,1,1,1] will have num changes = 0, and -99 for no data
+    raster_array, summary = dynamics(stack, grid.shape)
+
+    # The dynamic statistics of the chip, a row of the dynamicity frame
+    dynamicity = {
+        "chip": chip,
+        "num_changed_tiles": summary["num_changed_tiles"],
+        "median": summary["median"],
+        "max": summary["max"],
+    }
 
+    if verbose:
+        print("ANALYSIS CONCLUDED")
+
+    if raster_dir is not None:
+        if verbose:
+            print("SAVING DYNAMIC COUNTS AS GEOTIFF")
+        # saved on the chip grid to preserve the geographic information in the tiff
+        os.makedirs(raster_dir,exist_ok=True)
+        write_raster(os.path.join(raster_dir,f"{chip}_dynamics.tif"),
+                     raster_array.astype(np.int16),
+                     grid,
+                     nodata=NODATA_DYNAMICS)
+
+    return dynamicity, stack
+
+
+def main(chips: pd.DataFrame,DB,AREA = 'Denmark',verbose=True,checkpoint_every=25,raster_dir="data/dynamicity/rastertifs"):
+    """
+    :param raster_dir: Directory to write the {chip}_dynamics.tif rasters to, None to skip them
+    """
 
     # Duration list : This list is for calculating remaining time
     durations = []
 
     # the years to process
-    years = [i for i in range(2016,2024)]
+    years = YEARS
 
     # Get chipids from dataframe 
     chips_to_handle = chips.chipid.values.tolist()
 
+    # The chip cells are rebuilt from the stored boundaries of the area
+    grid_params = BoundaryStore().grid_params(AREA)
+
+    # Pixel counts per change sequence over all chips, and the dynamicity rows not yet saved
+    counter = load_sequence_counter(years)
+    dynamicity_frames = []
+
     # Counter to keep track of while loop
     cnum = 1
 
@@ -383,151 +244,40 @@ def main(chips: pd.DataFrame,DB,AREA = 'Denmark',verbose=True):
     # loop over all current chips
     while len(chips_to_handle)>0:
         
-        # Initialized essential datastructures
-        dynamicity = defaultdict(list)
-        changes = defaultdict(dict)
-        
-
         # Item runtime is calculated from here
         start_time = time.time()
         
         # Get the first chip from the list
         chip = chips_to_handle[0]
-        changes[chip] = defaultdict(list)
         print(f"BEGINNING ON CHIP {chip} nr {cnum}")
         
 
-        # Localt chip data structure
-        chip_data = {}
-
-
-        # This list simply keeps track of whether the chips have multiple shapes
-        shapes = []
-
-
         if verbose:
             print("GETTING CHIP FOR EACH YEAR")
-        # Loop over each year
-        redo = False
-        for year in tqdm(years,desc="Getting each yearly chip"):
-
-            # Query paramters 
-            Q2_params = {"_CHIPID_":chip,"_YEAR_":str(year),"_AREA_":AREA}
-
-            # This try except is just in case we are clogging the DB. Happens occationally
-            try:
-                # Get the current chip as a GDF
-                landcover = DB.read(Q2,params=Q2_params,geom_col="geometries",geom_query=True)
-            except Exception as e:
-                # Else just take a nap and try again
-                time.sleep(30)
-                # write exception to std err
-                print(e,file=sys.stderr)
-                redo = True
-                break
-                
-            # make geometry column from geometries to geometry and rename columns accoding to our legend
-            landcover = process_gdf(landcover)
-
-   
-            # Convert the GDF to a raster file
-            chip_data[year] = polygon_to_raster(landcover,output_path = f"data/dynamicity/rastertifs/{chip}_{year}.tif")
-
-            # append the shaoe of each year of the chip to the shapes list
-            shapes.append(chip_data[year].shape)
-
-        # If the DB was clogged just rerun the current chip
-        if redo:
+        # This try except is just in case we are clogging the DB. Happens occationally
+        try:
+            landcover_years = read_chip_landcover(chip,DB,AREA,years)
+        except Exception as e:
+            # Else just take a nap and try again
+            time.sleep(30)
+            # write exception to std err
+            print(e,file=sys.stderr)
+            # If the DB was clogged just rerun the current chip
             continue
 
-        # If the chip from all years have different shapes then resize the smaller tifs
-        if len(set(shapes))>1:
-            print ("reshaping")
-            print("PRESENT SHAPES",set(shapes))
-            read_and_pad_geotiffs([f"data/dynamicity/rastertifs/{chip}_{year}.tif" for year in years])
-            for year in years:
-                chip_data[year] = replace_tif(f"data/dynamicity/rastertifs/{chip}_{year}.tif")
-
-
-        else:
-
-            if verbose:
-                print("DIMENSIONS MATCH")
-
-    
-
-
-        
-        maxlen = max([v.flatten().shape[0] for v in chip_data.values()])
-
-        raster_array = [[] for i in range(maxlen)]
-
-        print("Array Length:",list(chip_data.values())[0].flatten().shape[0])
-
-        
-        for k,rgdf in tqdm(chip_data.items(),desc="creating the change sequences"):
-            # save the value of the pixel under its flattened index in the changes dict list
-            for ix,i in enumerate(rgdf.flatten()):
-                # the value of the chip in that given pixel is stored in changes as well as the raster array
-                changes[chip][ix].append(i)
-                raster_array[ix].append(i)
-        if verbose:
-            print("SEQUENCE CREATED")
-        # This simply converts the number of different values present in the tile over time to a number
-        # s.t a change sequence [1,1,1,1,1,1,1,1] will have num changes = 0
-        raster_array_ = []
-        raster_array_stats = []
-        for sublist in raster_array:
-            if 0 in sublist:
-                raster_array_.append(-99)
-            else:
-                raster_array_.append(len(set(sublist))-1)
-                raster_array_stats.append(len(set(sublist))-1)
-
-        raster_array = raster_array_
-
-        # Append the dynamic statistics to the dynamicity frame 
-        dynamicity["chip"].append(chip)
-        dynamicity["num_changed_tiles"].append(sum(raster_array_stats))
-        dynamicity["median"] = np.median(raster_array_stats)
-        dynamicity["max"] = np.max(raster_array_stats)
-
-        if verbose:
-            print("ANALYSIS CONCLUDED")
-
-        # reshape the raster to a matrix
-        raster_array = np.array(raster_array).reshape(rgdf.shape)
-
-
-        if verbose:
-            print("SAVING DYNAMIC COUNTS AS GEOTIFF")
-        # this function effectively saves the dynamic array on a copy of the current chip to preserve the geographic information in the tiff
-        replace_raster_band1(original_path=f"data/dynamicity/rastertifs/{chip}_{year}.tif", 
-                            new_path = f"data/dynamicity/rastertifs/{chip}_dynamics.tif", 
-                            new_band1_data=raster_array)
-        
-        if verbose:
-            print("DELTA SAVING SEQUENCE DF")
-        # this performs a delta save of the current sequence DF - can be a bit resource consuming
-        sequence_df = make_sequence_df(changes)
-        sequence_df.to_csv("data/dynamicity/change_sequences.csv")
+        dynamicity, stack = chip_dynamicity(chip,landcover_years,years,grid_params,raster_dir=raster_dir,verbose=verbose)
 
         if verbose:
-            print("DELTA SAVING DYNAMICITY DF")
-
-        # Appends the current chip to previous chips 
-        # if the dynamicity.csv file does not exist then create it
-        if os.path.exists("data/dynamicity/dynamicity.csv"):
-            pd.DataFrame(dynamicity).to_csv("data/dynamicity/dynamicity.csv",mode='a',header=False)
-        else:
-            pd.DataFrame(dynamicity).to_csv("data/dynamicity/dynamicity.csv")
+            print("COUNTING SEQUENCES")
+        # Packed sequences are counted in memory, the cost does not grow with the chips done
+        counter.add(chip, stack)
+        dynamicity_frames.append(pd.DataFrame([dynamicity]))
 
+        if cnum % checkpoint_every == 0:
+            if verbose:
+                print("CHECKPOINTING SEQUENCES AND DYNAMICITY")
+            save_progress(counter, dynamicity_frames)
 
-        if verbose:
-            print("DELETING SUPPORT FILES")
-        # deletes the support files
-        for year in years:
-            delete_file(f"data/dynamicity/rastertifs/{chip}_{year}.tif")
 
         # removes the chip if it has successfully run
         print("FINISHED", chips_to_handle.pop(0))
@@ -546,23 +296,109 @@ def main(chips: pd.DataFrame,DB,AREA = 'Denmark',verbose=True):
         print(f"{num_chips-(cnum)} CHIPS LEFT. ESTIMATED COMPLETION TIME IN {str(ETA)} MINUTES WITH AVERAGE CHIP RUNTIME OF {str(np.mean(durations))}\n\n")
 
         cnum+=1
-        
 
-        
-        
-    
+    save_progress(counter, dynamicity_frames)
+    export_sequences(counter)
+    print(f"{len(counter)} CHANGE SEQUENCES OVER {len(counter.chips)} CHIPS")
 
 
+# State of a worker process of run_parallel, set by init_worker
+_worker = {}
 
 
+def init_worker(AREA,years,grid_params,raster_dir,shard_dir):
+    # Every worker has its own database connection
+    _worker.update(DB=DBMS(),AREA=AREA,years=years,grid_params=grid_params,raster_dir=raster_dir,shard_dir=Path(shard_dir))
 
-if __name__ == "__main__":
-    DB = DBMS()
 
-    
+def process_chip_shard(chip):
+    """
+    Run a chip in a worker and write its shard: {chip}.npz with the sequence counts
+    and {chip}.json with the dynamicity row.
+    """
+    for attempt in range(DB_ATTEMPTS):
+        try:
+            landcover_years = read_chip_landcover(chip,_worker["DB"],_worker["AREA"],_worker["years"])
+            break
+        except Exception as e:
+            if attempt == DB_ATTEMPTS-1:
+                raise
+            # the DB is clogged, take a nap and try again
+            print(e,file=sys.stderr)
+            time.sleep(30)
+
+    dynamicity, stack = chip_dynamicity(chip,landcover_years,_worker["years"],_worker["grid_params"],raster_dir=_worker["raster_dir"])
+
+    counter = SequenceCounter(_worker["years"])
+    counter.add(chip, stack)
+    counter.save(_worker["shard_dir"] / f"{chip}.npz")
+
+    row_path = _worker["shard_dir"] / f"{chip}.json"
+    with open(row_path.with_suffix(".json.tmp"),"w") as f:
+        json.dump(dynamicity,f)
+    os.replace(row_path.with_suffix(".json.tmp"),row_path)
+    return chip
+
+
+def reduce_shards(manifest,shard_dir,years=YEARS):
+    """Merge the shards of the done chips into change_sequences.csv and dynamicity.csv"""
+    counter = SequenceCounter(years)
+    rows = []
+    for chip in tqdm(manifest.chips(DONE),desc="Merging shards"):
+        counter.update(SequenceCounter.load(Path(shard_dir) / f"{chip}.npz"))
+        with open(Path(shard_dir) / f"{chip}.json") as f:
+            rows.append(json.load(f))
+
+    pd.DataFrame(rows,columns=["chip","num_changed_tiles","median","max"]).to_csv(DYNAMICITY_CSV)
+    export_sequences(counter)
+    print(f"{len(counter)} CHANGE SEQUENCES OVER {len(counter.chips)} CHIPS")
+    return counter
+
+
+def run_parallel(chips: pd.DataFrame,AREA='Denmark',workers=None,run_dir=RUN_DIR,raster_dir="data/dynamicity/rastertifs",retry_failed=True):
+    """
+    Run the chips in worker processes, then merge their shards.
 
-    print("Getting New ")
-    chips = get_all_chipids(DB)
+    The manifest in run_dir records which chips are done, failed or in progress, so
+    a rerun with the same run_dir only runs what is left. dynamicity.csv and
+    change_sequences.csv are rewritten from the shards of all done chips.
 
-    main(chips,DB)
+    :param chips: All chips of the area, see get_all_chipids(DB,skip_done=False)
+    :param workers: Worker processes, defaults to the number of CPUs
+    """
+    run_dir = Path(run_dir)
+    shard_dir = run_dir / "shards"
+    shard_dir.mkdir(parents=True,exist_ok=True)
+    manifest = ChipManifest(run_dir / "manifest.jsonl")
+
+    done, failed = run_chips(
+        chips.chipid.unique().tolist(),
+        process_chip_shard,
+        manifest,
+        workers=workers,
+        initializer=init_worker,
+        # Computed once here, the workers get the chip cells without the boundary store
+        initargs=(AREA,YEARS,BoundaryStore().grid_params(AREA),raster_dir,shard_dir),
+        retry_failed=retry_failed,
+    )
+    print(f"{len(done)} CHIPS DONE, {len(failed)} FAILED")
+
+    return reduce_shards(manifest,shard_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pixel dynamicity and change sequences of the chips of Denmark")
+    parser.add_argument("--workers",type=int,default=None,help="Worker processes, defaults to the number of CPUs")
+    parser.add_argument("--serial",action="store_true",help="Run the chips one by one in this process")
+    args = parser.parse_args()
+
+    DB = DBMS()
 
+    print("Getting New ")
+    if args.serial:
+        chips = get_all_chipids(DB)
+        main(chips,DB)
+    else:
+        # The manifest decides which chips are left
+        chips = get_all_chipids(DB,skip_done=False)
+        run_parallel(chips,workers=args.workers)
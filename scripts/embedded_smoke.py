@@ -0,0 +1,290 @@
+"""
+Offline smoke check of the embedded DuckDB backend (src/backends/embedded.py).
+
+A tiny fixture of two Danish chips with Dynamic World and SATLAS polygons for two
+years is loaded into a throwaway .duckdb file through DBMS(backend="embedded"), the
+same way the ingestion stores rasters. GET_DW_LANDCOVER, GET_CHIP_LANDCOVER,
+CALCULATE_LULC_INTERSECTION and GET_SOLAR_WIND_OVERLAP are then read back and their
+areas compared with the queries replayed in shapely, as PostGIS computes them. Before
+that, the translated SQL is checked for the rewrites the backend relies on.
+
+Needs the DuckDB spatial extension, which is installed on first use:
+
+    python -m scripts.embedded_smoke
+
+The check fails, with a non-zero exit, if an area differs by more than --atol km2
+plus --rtol times the expected area.
+"""
+
+import argparse
+import os
+import tempfile
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from config import EPSG_MAPPING, LAND_COVER_LEGEND
+from src.backends.embedded import translate
+from src.data_handlers import calculate_area_km2
+from src.DataBaseManager import DBMS, catalog_statements
+
+AREA = "Denmark"
+CHIPIDS = ["0_1_1", "0_1_2"]
+YEARS = [2016, 2017]
+# Side of a fixture cell in degrees, a chip is CELLS x CELLS cells
+CELL = 0.005
+CELLS = 4
+
+# Substrings every translated query must contain, and PostGIS forms it must not
+REWRITES = {
+    "GET_DW_LANDCOVER": (["list_contains($chipids, chipid)"], ["ANY("]),
+    "INSERT_LULC_DISSOLVED": (
+        ["ST_Union_Agg(geometries)", "always_xy := true", "list_contains("],
+        ["ANY(", "ST_Union(geometries)"],
+    ),
+    "CALCULATE_LULC_INTERSECTION": (
+        ["ST_Union_Agg(geom)", "always_xy := true", "list_contains($chipid_list, chipid)"],
+        ["ANY(", "ST_Union(geom)"],
+    ),
+    "GET_SOLAR_WIND_OVERLAP": (
+        ["ST_Intersects_Extent(a.geometries, b.geometries)", "always_xy := true"],
+        ["&&"],
+    ),
+}
+
+
+def check_rewrites():
+    for query_name, (expected, forbidden) in REWRITES.items():
+        func = "write" if query_name.startswith("INSERT") else "read"
+        sql = translate(catalog_statements(query_name, func=func)[0])
+        missing = [part for part in expected if part not in sql]
+        left = [part for part in forbidden if part in sql]
+        assert not missing and not left, f"{query_name}: missing {missing}, left {left}"
+    print(f"Rewrites of {len(REWRITES)} queries checked")
+
+
+def fixture() -> tuple:
+    """
+    Dynamic World cells with random classes, and a solar park overlapped by wind
+    turbines, per chip and year.
+
+    :return: The Dynamic World and SATLAS GeoDataFrames as the ingestion uploads them
+    """
+    rng = np.random.default_rng(42)
+    dw_rows, satlas_rows = [], []
+    for chip_ix, chipid in enumerate(CHIPIDS):
+        x0, y0 = 9.5 + chip_ix * CELL * CELLS, 55.5
+        for year in YEARS:
+            row = {"chipid": chipid, "year": f"{year}-01-01"}
+
+            landcover = rng.choice([0, 1, 2, 4, 6], size=(CELLS, CELLS))
+            for (y, x), code in np.ndenumerate(landcover):
+                cell = shapely.box(
+                    x0 + x * CELL, y0 + y * CELL, x0 + (x + 1) * CELL, y0 + (y + 1) * CELL
+                )
+                dw_rows.append({**row, "landcover": code, "geometry": cell})
+
+            # The solar park grows in the second year
+            solar = shapely.box(
+                x0 + CELL / 2, y0 + CELL / 2, x0 + CELL * (1 + year - YEARS[0]), y0 + 2 * CELL
+            )
+            satlas_rows.append({**row, "name": "Solar Panel", "geometry": solar})
+            for dx, dy in rng.uniform(0, 2 * CELL, (3, 2)):
+                wind = shapely.box(x0 + dx, y0 + dy, x0 + dx + CELL / 5, y0 + dy + CELL / 5)
+                satlas_rows.append({**row, "name": "Wind Turbine", "geometry": wind})
+
+    dw = gpd.GeoDataFrame(dw_rows, crs="EPSG:4326")
+    satlas = gpd.GeoDataFrame(satlas_rows, crs="EPSG:4326")
+    dw[["data_origins", "area"]] = ["DynamicWorld", AREA]
+    satlas[["data_origins", "area"]] = ["SATLAS", AREA]
+    return dw, satlas
+
+
+def km2(geometries) -> np.ndarray:
+    frame = pd.DataFrame({"geometry": list(geometries), "area": AREA})
+    return calculate_area_km2(frame).values
+
+
+def expected_intersection(lulc: gpd.GeoDataFrame, year_from: int, year_to: int) -> pd.DataFrame:
+    """CALCULATE_LULC_INTERSECTION replayed in shapely, as raster_change_parity does."""
+
+    def year_polygons(year):
+        rows = lulc[lulc["year"] == f"{year}-01-01"]
+        satlas = rows[rows["data_origins"] == "SATLAS"]
+        # The SATLAS unions are taken over all chips of the query
+        satlas_union = shapely.union_all(satlas.geometry.values)
+        wind_union = shapely.union_all(satlas.geometry[satlas["name"] == "Wind Turbine"].values)
+
+        polygons = {}
+        for (chipid, origin, name), group in rows.groupby(["chipid", "data_origins", "name"]):
+            geom = shapely.union_all(group.geometry.values)
+            if origin == "DynamicWorld":
+                geom = geom.difference(satlas_union)
+            elif name == "Solar Panel":
+                geom = geom.difference(wind_union)
+            polygons[(chipid, name)] = geom
+        return polygons
+
+    preceding, current = year_polygons(year_from), year_polygons(year_to)
+    rows = []
+    for (chipid, name_from), geom_from in preceding.items():
+        for (chipid_to, name_to), geom_to in current.items():
+            if chipid == chipid_to and geom_from.intersects(geom_to):
+                rows.append(
+                    {
+                        "chipid": chipid,
+                        "preceding_year_name": name_from,
+                        "current_year_name": name_to,
+                        "expected_km2": km2([geom_from.intersection(geom_to)])[0],
+                        "expected_preceding_km2": km2([geom_from])[0],
+                    }
+                )
+    return pd.DataFrame(rows)
+
+
+def compare(name: str, actual: pd.Series, expected: pd.Series, atol: float, rtol: float) -> int:
+    comparison = pd.concat(
+        [actual.rename("actual_km2"), expected.rename("expected_km2")], axis=1
+    ).fillna(0.0)
+    difference = (comparison["actual_km2"] - comparison["expected_km2"]).abs()
+    exceeded = comparison[difference > atol + rtol * comparison["expected_km2"]]
+
+    print(f"{name}: {comparison.shape[0]} areas, max difference {difference.max():.2e} km2")
+    if not exceeded.empty:
+        print(exceeded)
+    return exceeded.shape[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--atol", type=float, default=1e-9, help="Absolute tolerance in km2")
+    parser.add_argument("--rtol", type=float, default=1e-6, help="Relative tolerance")
+    args = parser.parse_args()
+
+    check_rewrites()
+
+    dw, satlas = fixture()
+    lulc = pd.concat(
+        [dw.assign(name=[LAND_COVER_LEGEND[code] for code in dw["landcover"]]), satlas],
+        ignore_index=True,
+    )
+    lulc["expected_km2"] = km2(lulc.geometry)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.environ["LULC_EMBEDDED_DB"] = str(Path(tmp_dir) / "smoke.duckdb")
+        with DBMS(backend="embedded") as dbms:
+            # Copies, the upload renames and adds columns in place
+            dbms.add_land_cover_type(dw.copy())
+            dbms.add_land_cover_type(satlas.copy())
+            failures = run_queries(dbms, lulc, args.atol, args.rtol)
+
+    if failures:
+        print(f"\n{failures} areas exceed the tolerance")
+        raise SystemExit(1)
+    print(f"All areas within {args.atol:g} km2 + {args.rtol:g} x expected area")
+
+
+def run_queries(dbms: DBMS, lulc: gpd.GeoDataFrame, atol: float, rtol: float) -> int:
+    failures = 0
+    key = ["chipid", "year", "name"]
+
+    dw_landcover = dbms.read(
+        "GET_DW_LANDCOVER",
+        {"area": AREA, "chipids": CHIPIDS, "start_year": YEARS[0], "end_year": YEARS[-1]},
+        geom_query=True,
+    )
+    assert dw_landcover.shape[0] == lulc.shape[0], f"{dw_landcover.shape[0]} lulc rows"
+    dw_landcover["year"] = pd.to_datetime(dw_landcover["year"]).dt.strftime("%Y-%m-%d")
+    dw_landcover["actual_km2"] = calculate_area_km2(dw_landcover, geom_col="geometries")
+    failures += compare(
+        "GET_DW_LANDCOVER",
+        dw_landcover.groupby(key)["actual_km2"].sum(),
+        lulc.groupby(key)["expected_km2"].sum(),
+        atol,
+        rtol,
+    )
+
+    dw_rows = lulc[lulc["data_origins"] == "DynamicWorld"]
+    actual, expected = [], []
+    for chipid in CHIPIDS:
+        for year in YEARS:
+            chip_landcover = dbms.read(
+                "GET_CHIP_LANDCOVER",
+                {"area": AREA, "year": year, "chipid": chipid},
+                geom_query=True,
+            )
+            actual.append(
+                pd.Series(
+                    km2(chip_landcover.geometry),
+                    index=pd.MultiIndex.from_product([[chipid], [year], chip_landcover["name"]]),
+                )
+            )
+            rows = dw_rows[(dw_rows["chipid"] == chipid) & (dw_rows["year"] == f"{year}-01-01")]
+            dissolved = rows.groupby("name").geometry.agg(
+                lambda geoms: shapely.union_all(geoms.values)
+            )
+            expected.append(
+                pd.Series(
+                    km2(dissolved.values),
+                    index=pd.MultiIndex.from_product([[chipid], [year], dissolved.index]),
+                )
+            )
+    failures += compare("GET_CHIP_LANDCOVER", pd.concat(actual), pd.concat(expected), atol, rtol)
+
+    intersection = dbms.read(
+        "CALCULATE_LULC_INTERSECTION",
+        {
+            "area": AREA,
+            "from_year": YEARS[0],
+            "to_year": YEARS[1],
+            "chipid_list": CHIPIDS,
+            "epsg": EPSG_MAPPING[AREA],
+        },
+        geom_query=True,
+        geom_col="land_use_change",
+    )
+    intersection["actual_km2"] = km2(intersection["land_use_change"])
+    transitions = ["chipid", "preceding_year_name", "current_year_name"]
+    expected = expected_intersection(lulc, YEARS[0], YEARS[1]).set_index(transitions)
+    actual = intersection.set_index(transitions)
+    failures += compare(
+        "CALCULATE_LULC_INTERSECTION",
+        actual["actual_km2"],
+        expected["expected_km2"],
+        atol,
+        rtol,
+    )
+    failures += compare(
+        "CALCULATE_LULC_INTERSECTION preceding_area_sq_km",
+        actual["preceding_area_sq_km"],
+        expected["expected_preceding_km2"],
+        atol,
+        rtol,
+    )
+
+    overlap = dbms.read("GET_SOLAR_WIND_OVERLAP", {})
+    overlap["year"] = pd.to_datetime(overlap["year"]).dt.year
+    satlas = lulc[lulc["data_origins"] == "SATLAS"]
+    expected_overlap = {}
+    for (chipid, year), group in satlas.groupby(["chipid", "year"]):
+        solar = group.geometry[group["name"] == "Solar Panel"].values
+        wind = group.geometry[group["name"] == "Wind Turbine"].values
+        pairs = [a.intersection(b) for a in solar for b in wind if a.intersects(b)]
+        year = int(year[:4])
+        expected_overlap[year] = expected_overlap.get(year, 0.0) + km2(pairs).sum()
+    failures += compare(
+        "GET_SOLAR_WIND_OVERLAP",
+        overlap.set_index("year")["yearly_overlap_km2"],
+        pd.Series(expected_overlap),
+        atol,
+        rtol,
+    )
+
+    return failures
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Copy a subset of the thesis database into the embedded DuckDB file.
+
+Takes the first --chips chips of an area that have all years of Dynamic World data,
+and copies their lulc and land_use_change rows. lulc_dissolved is rebuilt locally.
+Afterwards the pipeline runs offline, on the experimental embedded backend, with
+
+    LULC_DB_BACKEND=embedded python -m src.measure_LULC
+
+e.g.
+
+    python -m scripts.make_embedded_subset --area Denmark --chips 200
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from config import EMBEDDED_DB_PATH
+from src.backends.embedded import EmbeddedBackend
+from src.DataBaseManager import DBMS
+
+
+def copy_query(source, target, table_name, query_name, params, geom_col):
+    columns = target.backend.table_columns(table_name)
+    rows = 0
+    for chunk in source.iter_read(query_name, params, geom_query=True, geom_col=geom_col):
+        chunk = chunk[[col for col in chunk.columns if col in columns]]
+        with target.backend.transaction() as conn:
+            rows += target.backend.copy_frame(conn, chunk, table_name, geom_cols=[geom_col])
+    print(f"Copied {rows} rows into {table_name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--area", default="Denmark")
+    parser.add_argument("--chips", type=int, default=200)
+    parser.add_argument("--path", default=EMBEDDED_DB_PATH)
+    args = parser.parse_args()
+
+    source = DBMS(backend="postgres")
+    target = DBMS(backend=EmbeddedBackend(args.path))
+
+    chipids = source.read("GET_ONLY_CHIPIDS_FROM_AREA", {"area": args.area})[
+        "chipid"
+    ].tolist()[: args.chips]
+    print(f"Copying {len(chipids)} chips of {args.area} to {args.path}")
+
+    copy_query(
+        source,
+        target,
+        "lulc",
+        "GET_DW_LANDCOVER",
+        {"area": args.area, "chipids": chipids, "start_year": 2016, "end_year": 2023},
+        geom_col="geometries",
+    )
+    copy_query(
+        source,
+        target,
+        "land_use_change",
+        "GET_LAND_USE_CHANGE_FOR_CHIPS",
+        {"area": args.area, "chipids": chipids},
+        geom_col="geom",
+    )
+
+    target.refresh_lulc_dissolved(args.area)
+    target.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -8,12 +8,11 @@ Simply pass a path to the directory containing the raster files and the function
 from pathlib import Path
 from typing import List
 
-import geopandas as gpd
 import rasterio
-from rasterio.features import shapes
-from shapely.geometry import shape
 from tqdm import tqdm
 
+from src.data_handlers import polygonize
+
 
 def raster2geo(raster_dir: Path, out_dir: Path):
     assert raster_dir.exists(), f"{raster_dir} does not exist"
@@ -26,22 +25,7 @@ def raster2geo(raster_dir: Path, out_dir: Path):
             image = src.read(1)  # Read the first band
             transform = src.transform
 
-        # Step 3: Convert raster to vector
-        mask = image != 0  # Assuming 0 is the value for no data
-        vector_shapes = shapes(image, mask=mask, transform=transform)
-
-        # Step 4: Create GeoDataFrame
-        polygons = []
-        values = []  # Store landcover values here
-        for geom, value in vector_shapes:
-            polygons.append(shape(geom))
-            values.append(value)
-
-        gdf = gpd.GeoDataFrame({"landcover": values, "geometry": polygons})
-        gdf["landcover"] = gdf["landcover"].astype(int)
-        # Optional: Set the CRS (Coordinate Reference System) to match the input raster
-        gdf.crs = src.crs
-        gdf = gdf.to_crs(epsg=25832)
+        gdf = polygonize(image, transform, src.crs, dst_crs="EPSG:25832")
 
         gdf.to_file(out_dir / f"{raster_path.stem}.shp")
     return
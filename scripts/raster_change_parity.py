@@ -0,0 +1,244 @@
+"""
+Parity of the raster change engine (src/raster_change.py) with the SQL path.
+
+With --raster-dir, sample chips of an area are run through both engines: the GeoTIFFs
+through chip_land_use_change and the database through CALCULATE_LULC_INTERSECTION, as
+measure_LULC does. Without it, synthetic chips with SATLAS footprints are polygonized
+like the ingestion does, and the query is replayed with shapely, so the check runs
+without a database.
+
+    python -m scripts.raster_change_parity --synthetic-chips 3
+    python -m scripts.raster_change_parity --raster-dir data/DW/Denmark --area Denmark \\
+        --year-from 2016 --year-to 2017 --chips 20
+
+Transitions are compared per chip by summed area_km2, and the largest differences
+are printed. The check fails, with a non-zero exit, if a transition differs by more
+than --atol km2 plus --rtol times its SQL area.
+"""
+
+import argparse
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from rasterio.io import MemoryFile
+from rasterio.transform import from_origin
+
+from config import LAND_COVER_LEGEND
+from src.data_handlers import calculate_area_km2, polygonize
+from src.raster_change import (
+    chip_land_use_change,
+    index_rasters,
+    land_use_change_from_rasters,
+    read_satlas_footprints,
+)
+
+KEY = ["chipid", "lulc_category_from", "lulc_category_to"]
+
+
+def synthetic_raster(seed: int, size: int = 300, patch: int = 20) -> np.ndarray:
+    """Blocky classes 1-8 with noisy pixels and some no data, like a Drive export."""
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(1, 9, (size // patch + 1, size // patch + 1), dtype=np.uint8)
+    image = np.kron(coarse, np.ones((patch, patch), dtype=np.uint8))[:size, :size]
+
+    noise = rng.random((size, size)) < 0.05
+    image[noise] = rng.integers(0, 9, noise.sum(), dtype=np.uint8)
+    return image
+
+
+def to_tif(image: np.ndarray, transform) -> bytes:
+    with MemoryFile() as memfile:
+        with memfile.open(
+            driver="GTiff",
+            height=image.shape[0],
+            width=image.shape[1],
+            count=1,
+            dtype=image.dtype,
+            crs="EPSG:4326",
+            transform=transform,
+        ) as dataset:
+            dataset.write(image, 1)
+        return memfile.read()
+
+
+def synthetic_footprints(transform, seed: int) -> gpd.GeoDataFrame:
+    """A solar park and wind turbines overlapping it, in pixel-aligned corners."""
+    rng = np.random.default_rng(seed)
+    x0, y0 = transform * (rng.integers(20, 150), rng.integers(20, 150))
+    step = transform.a
+    solar = shapely.box(x0, y0 - 60 * step, x0 + 80 * step, y0)
+    wind = [
+        shapely.box(x0 + dx * step, y0 - (dy + 6) * step, x0 + (dx + 6) * step, y0 - dy * step)
+        for dx, dy in rng.integers(0, 120, (4, 2))
+    ]
+    return gpd.GeoDataFrame(
+        {"name": ["Solar Panel"] + ["Wind Turbine"] * len(wind)},
+        geometry=[solar] + wind,
+        crs="EPSG:4326",
+    )
+
+
+def sql_replay(area, chipid, image_from, image_to, transform, footprints_from, footprints_to):
+    """CALCULATE_LULC_INTERSECTION on the polygons ingestion would store, in shapely."""
+
+    def year_polygons(image, footprints):
+        dw = polygonize(image, transform, "EPSG:4326")
+        dw["name"] = [LAND_COVER_LEGEND[ix] for ix in dw["landcover"]]
+        dissolved = dw.dissolve("name")["geometry"]
+
+        satlas = shapely.union_all(footprints.geometry.values)
+        solar = shapely.union_all(footprints.geometry[footprints["name"] == "Solar Panel"].values)
+        wind = shapely.union_all(footprints.geometry[footprints["name"] == "Wind Turbine"].values)
+
+        polygons = {name: geom.difference(satlas) for name, geom in dissolved.items()}
+        polygons["Solar Panel"] = solar.difference(wind)
+        polygons["Wind Turbine"] = wind
+        return {name: geom for name, geom in polygons.items() if not geom.is_empty}
+
+    preceding = year_polygons(image_from, footprints_from)
+    current = year_polygons(image_to, footprints_to)
+
+    rows = []
+    for name_from, geom_from in preceding.items():
+        for name_to, geom_to in current.items():
+            if geom_from.intersects(geom_to):
+                rows.append(
+                    {
+                        "area": area,
+                        "chipid": chipid,
+                        "lulc_category_from": name_from,
+                        "lulc_category_to": name_to,
+                        "geom": geom_from.intersection(geom_to),
+                    }
+                )
+    rows = pd.DataFrame(rows)
+    rows["area_km2"] = calculate_area_km2(rows, geom_col="geom")
+    return rows
+
+
+def compare(raster_rows: pd.DataFrame, sql_rows: pd.DataFrame) -> pd.DataFrame:
+    comparison = pd.merge(
+        raster_rows.groupby(KEY)["area_km2"].sum().rename("raster_km2"),
+        sql_rows.groupby(KEY)["area_km2"].sum().rename("sql_km2"),
+        left_index=True,
+        right_index=True,
+        how="outer",
+    ).fillna(0.0)
+    comparison["difference_km2"] = (comparison["raster_km2"] - comparison["sql_km2"]).abs()
+    comparison["relative"] = comparison["difference_km2"] / comparison["sql_km2"].clip(lower=1e-9)
+    return comparison
+
+
+def synthetic_parity(chips: int):
+    # 10 m pixels in degrees, as the Drive exports
+    transform = from_origin(9.5, 55.5, 0.0001, 0.0001)
+
+    raster_rows, sql_rows = [], []
+    for seed in range(chips):
+        chipid = f"{seed}_0_0"
+        image_from, image_to = synthetic_raster(2 * seed), synthetic_raster(2 * seed + 1)
+        footprints_from = synthetic_footprints(transform, 2 * seed)
+        footprints_to = pd.concat(
+            [footprints_from, synthetic_footprints(transform, 2 * seed + 1)],
+            ignore_index=True,
+        )
+
+        raster_rows.append(
+            chip_land_use_change(
+                "Denmark",
+                chipid,
+                2016,
+                2017,
+                to_tif(image_from, transform),
+                to_tif(image_to, transform),
+                footprints_from=footprints_from,
+                footprints_to=footprints_to,
+            )
+        )
+        sql_rows.append(
+            sql_replay(
+                "Denmark",
+                chipid,
+                image_from,
+                image_to,
+                transform,
+                footprints_from,
+                footprints_to,
+            )
+        )
+
+    return compare(pd.concat(raster_rows), pd.concat(sql_rows))
+
+
+def database_parity(raster_dir, area: str, year_from: int, year_to: int, chips: int):
+    from src.DataBaseManager import DBMS
+    from src.measure_LULC import calculate_lulc_polygon_intersection, format_for_db
+
+    rasters = index_rasters(raster_dir)
+    chipids = [
+        chipid
+        for chipid, years in rasters.items()
+        if year_from in years and year_to in years
+    ][:chips]
+
+    raster_rows = land_use_change_from_rasters(
+        area,
+        [year_from, year_to],
+        rasters,
+        footprints=read_satlas_footprints(DBMS(), area, chipids, [year_from, year_to]),
+        chipids=chipids,
+    )
+
+    sql_rows = format_for_db(
+        calculate_lulc_polygon_intersection(area, year_from, year_to, chipids),
+        area,
+        year_from,
+        year_to,
+    )
+    sql_rows["area_km2"] = calculate_area_km2(sql_rows, geom_col="geom")
+
+    return compare(raster_rows, sql_rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--raster-dir", default=None)
+    parser.add_argument("--area", default="Denmark")
+    parser.add_argument("--year-from", type=int, default=2016)
+    parser.add_argument("--year-to", type=int, default=2017)
+    parser.add_argument("--chips", type=int, default=20)
+    parser.add_argument("--synthetic-chips", type=int, default=3)
+    # One 10 m pixel
+    parser.add_argument("--atol", type=float, default=1e-4, help="Absolute tolerance in km2")
+    parser.add_argument("--rtol", type=float, default=1e-3, help="Relative tolerance")
+    args = parser.parse_args()
+
+    if args.raster_dir is None:
+        comparison = synthetic_parity(args.synthetic_chips)
+    else:
+        comparison = database_parity(
+            args.raster_dir, args.area, args.year_from, args.year_to, args.chips
+        )
+
+    print(comparison.sort_values("difference_km2", ascending=False).head(10))
+    print(
+        f"\n{comparison.shape[0]} transitions, "
+        f"total {comparison['sql_km2'].sum():.4f} km2 (SQL) vs "
+        f"{comparison['raster_km2'].sum():.4f} km2 (raster), "
+        f"max difference {comparison['difference_km2'].max():.2e} km2"
+    )
+
+    exceeded = comparison[
+        comparison["difference_km2"] > args.atol + args.rtol * comparison["sql_km2"]
+    ]
+    if not exceeded.empty:
+        print(f"\n{exceeded.shape[0]} transitions exceed the tolerance:")
+        print(exceeded.sort_values("difference_km2", ascending=False))
+        raise SystemExit(1)
+    print(f"All transitions within {args.atol:g} km2 + {args.rtol:g} x SQL area")
+
+
+if __name__ == "__main__":
+    main()
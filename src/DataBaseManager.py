@@ -1,23 +1,39 @@
 import getpass
 import os
+import re
 import sys
 from io import BytesIO
 
-import geopandas as gpd
+import numpy as np
 import pandas as pd
-from geoalchemy2 import Geometry, WKTElement
+import shapely
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload
-from sqlalchemy import create_engine, text, types
-from sshtunnel import SSHTunnelForwarder
 from tqdm import tqdm
 
-from config import LAND_COVER_LEGEND
+from config import (
+    DB_BACKEND,
+    EMBEDDED_DB_PATH,
+    EPSG_MAPPING,
+    LAND_COVER_LEGEND,
+)
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
-from src.data_handlers import raster_dict2geo
+from src.data_handlers import add_chip_coordinates, calculate_area_km2
+from src.backends.base import Backend
+from src.backends.postgres import PostgresBackend
+from src.db_connection import get_tunnelled_engine
+from src.drive_batch import delete_files, find_folders
+from src.ingestion import DriveSource, IngestionPipeline, RetryQueue, retry_failed
+from src.query_cache import QueryCache, query_area, written_tables
+
+# Equal-area CRS per country as an SQL VALUES list, for the few areas that are still
+# measured at query time (intersections that only exist inside a query)
+AREA_EPSG_VALUES = ", ".join(
+    [f"('{area}', {epsg})" for area, epsg in EPSG_MAPPING.items()]
+)
 
 QUERY_CATALOG = {
     "read": {
@@ -26,11 +42,11 @@ QUERY_CATALOG = {
                 area,
                 name,
                 year,
-                ST_Area(ST_Transform(ST_Union(geometries), __EPSG__)) / 1000000.0 AS result_geom_area_km2 
+                SUM(area_km2) AS result_geom_area_km2 
             FROM 
-                lulc 
+                lulc_dissolved 
             WHERE 
-                area = '__AREA__' AND 
+                area = :area AND 
                 (data_origins = 'SATLAS' OR data_origins = 'DynamicWorld')
             GROUP BY 
                 area, name, year;
@@ -60,118 +76,117 @@ QUERY_CATALOG = {
         "chip_greater_than": """
             SELECT 
                 chipid, 
-                ST_Area(ST_Transform(ST_Union(geometries), __EPSG__)) / 1000000.0 AS area_sq_km
+                SUM(area_km2) AS area_sq_km
             FROM 
-                lulc
-                WHERE year = '2016-01-01' AND data_origins = 'DynamicWorld' AND area = '__COUNTRY__'
+                lulc_dissolved
+                WHERE year = '2016-01-01' AND data_origins = 'DynamicWorld' AND area = :country
             GROUP BY 
                 chipid
             HAVING 
-                ST_Area(ST_Transform(ST_Union(geometries), __EPSG__)) / 1000000.0 > __KILOMETER_THRESHOLD__
+                SUM(area_km2) > :kilometer_threshold
                 """,
         "GET_DW_LANDCOVER": """SELECT * FROM lulc 
     WHERE 
-    Area = '_AREA_'
-    AND chipid in (_CHIPIDS_)
-    AND (year <= '_END_YEAR_-01-01' AND year >= '_START_YEAR_-01-01')
+    Area = :area
+    AND chipid = ANY(:chipids)
+    AND (year <= make_date(CAST(:end_year AS INTEGER), 1, 1) AND year >= make_date(CAST(:start_year AS INTEGER), 1, 1))
     AND (data_origins = 'DynamicWorld' OR data_origins = 'SATLAS')
     """,  # AND data_origins = 'DynamicWorld',
         "GET_ONLY_DW_LANDCOVER": """SELECT * FROM lulc 
     WHERE 
-    Area = '_AREA_'
-    AND chipid in (_CHIPIDS_)
-    AND (year <= '_END_YEAR_-01-01' AND year >= '_START_YEAR_-01-01')
+    Area = :area
+    AND chipid = ANY(:chipids)
+    AND (year <= make_date(CAST(:end_year AS INTEGER), 1, 1) AND year >= make_date(CAST(:start_year AS INTEGER), 1, 1))
     AND (data_origins = 'DynamicWorld')
     """,
         "GET_AGGREGATED_LANDCOVER": """SELECT name, ST_Union(geometries) as geometries 
                                    FROM lulc WHERE 
                                    and name  = ''
                                    data_origins = 'DynamicWorld' 
-                                   AND year = '_YEAR_-01-01' 
-                                   AND area = '_AREA_'
+                                   AND year = make_date(CAST(:year AS INTEGER), 1, 1) 
+                                   AND area = :area
                                    GROUP BY name
                                    """,
         "GET_ONLY_CHIPIDS_FROM_AREA": """ SELECT chipid,count(distinct year)  as num_years FROM lulc
-                                        WHERE area='_AREA_' AND data_origins = 'DynamicWorld'
-                                        group by chipid
+                                        WHERE area=:area AND data_origins = 'DynamicWorld'
+                                        group by chipid, polygon_index
                                         HAVING count(distinct year) = 8
-                                        ORDER BY CAST(split_part(split_part(chipid, '_', 1), '-', 1) AS INTEGER)""",
-        "GET_CHIPIDS_FROM_AREA": """ SELECT DISTINCT chipid FROM lulc WHERE area = '_AREA_' 
+                                        ORDER BY polygon_index""",
+        "GET_CHIPIDS_FROM_AREA": """ SELECT DISTINCT chipid FROM lulc WHERE area = :area 
                                 AND chipid not in (SELECT DISTINCT chipid from land_use_change
-                                WHERE area = '_AREA_' and year_from = _YEAR_FROM_ 
-                                AND year_to =  _YEAR_TO_)""",
+                                WHERE area = :area and year_from = :year_from 
+                                AND year_to =  :year_to)""",
+        "GET_SATLAS_FOOTPRINTS": """SELECT chipid, year, name, geom FROM lulc_dissolved
+                        WHERE area = :area
+                        AND data_origins = 'SATLAS'
+                        AND chipid = ANY(:chipid_list)
+                        AND year = ANY(CAST(:year_list AS DATE[]))""",
         "GET_LANDCOVER": """SELECT * FROM lulc
-                        WHERE area='_AREA_' AND year = '_YEAR_-01-01'
+                        WHERE area=:area AND year = make_date(CAST(:year AS INTEGER), 1, 1)
                         AND data_origins = 'DynamicWorld'""",
         "GET_SATLAS_AND_DW_LANDCOVER": """SELECT * FROM lulc
-                        WHERE area='_AREA_' AND year = '_YEAR_-01-01'
+                        WHERE area=:area AND year = make_date(CAST(:year AS INTEGER), 1, 1)
                         AND data_origins = 'DynamicWorld' OR data_origins = 'SATLAS'""",
         "GET_CHIP_LANDCOVER": """SELECT chipid,
                                     name,
-                                    ST_Union(geometries) AS geometries FROM lulc
-                        WHERE area='_AREA_' AND year = '_YEAR_-01-01'
-                        AND data_origins = 'DynamicWorld' AND chipid = '_CHIPID_'
-                        GROUp BY chipid, name""",
+                                    geom AS geometries FROM lulc_dissolved
+                        WHERE area=:area AND year = make_date(CAST(:year AS INTEGER), 1, 1)
+                        AND data_origins = 'DynamicWorld' AND chipid = :chipid""",
         "GET_DRIVE_FOLDERS": "SELECT foldername,area FROM drive_folders",
-        "GET_EXISTING_CHIPS": """SELECT chipid,num_dates  FROM (
-                            SELECT chipid,COUNT(distinct year) as num_dates 
+        "GET_AREAS": "SELECT DISTINCT area FROM lulc",
+        "GET_LAND_USE_CHANGE_AREAS": "SELECT DISTINCT area FROM land_use_change",
+        "GET_EXISTING_CHIPS": """SELECT chipid,polygon_index,lon_idx,lat_idx,num_dates  FROM (
+                            SELECT chipid,polygon_index,lon_idx,lat_idx,COUNT(distinct year) as num_dates 
                             FROM lulc
-                            WHERE area = '_AREA_' 
-                            GROUP BY chipid ) iq
-                            WHERE num_dates = _NUM_DATES_
+                            WHERE area = :area 
+                            GROUP BY chipid,polygon_index,lon_idx,lat_idx ) iq
+                            WHERE num_dates = :num_dates
                              """,
         "GET_CHIPIDS": """
-                        SELECT * FROM (
-                        SELECT DISTINCT chipid,
-                        CAST(split_part(split_part(chipid, '_', 1), '-', 1) AS INTEGER) as poly_int,
-                        CAST(split_part(split_part(chipid, '_', 2), '-', 1) AS INTEGER) as lat_int, 
-                        CAST(split_part(split_part(chipid, '_', 3), '-', 1) AS INTEGER) as lon_int 
-                            
-                            FROM lulc WHERE area = '_AREA_'
-                        AND split_part(split_part(chipid, '_', 1), '-', 1) = '_SUB_AREAID_' 
-                        ) iq
+                        SELECT DISTINCT chipid, polygon_index, lon_idx, lat_idx, sub_part
+                        FROM lulc WHERE area = :area
+                        AND polygon_index = :sub_areaid
                         ORDER BY 
-                        poly_int,lon_int,lat_int
+                        polygon_index,lat_idx,lon_idx
                         """,
-        "GET_FINISHED_SUBPOLY": """SELECT polygon_index FROM sub_polygons WHERE area = '_AREA_'""",
+        "GET_FINISHED_SUBPOLY": """SELECT polygon_index FROM sub_polygons WHERE area = :area""",
         "GET_INTERSECTING_CHIPS": """
                                 SELECT * FROM lulc
-                                WHERE area = '_AREA_' 
-                                AND year = '_YEAR_-01-01' 
-                                AND ST_Intersects(geometries, ST_GeomFromText('_GEOMETRY_', 4326))
+                                WHERE area = :area 
+                                AND year = make_date(CAST(:year AS INTEGER), 1, 1) 
+                                AND ST_Intersects(geometries, ST_GeomFromWKB(:geometry, 4326))
                                 """,
         "CALCULATE_LULC_INTERSECTION": """ 
-        SELECT *,
-       intersection_area_sq_km / preceding_area_sq_km * 100 AS percent_change
-FROM (
+    -- area_km2 and percent_change of the intersections are calculated client side at upload
     SELECT preceding_year.chipid,
            preceding_year.name AS preceding_year_name,
            current_year.name AS current_year_name,
            ST_Intersection(preceding_year.result_geom_area, current_year.result_geom_area) AS land_use_change,
-           ST_Area(ST_Transform(preceding_year.result_geom_area, 25832)) / 1000000.0 AS preceding_area_sq_km,
-           ST_Area(ST_Transform(ST_Intersection(preceding_year.result_geom_area, current_year.result_geom_area), 25832)) / 1000000.0 AS intersection_area_sq_km
+           preceding_year.preceding_area_sq_km
     FROM (
+      SELECT *,
+             ST_Area(ST_Transform(result_geom_area, CAST(:epsg AS INTEGER))) / 1000000.0 AS preceding_area_sq_km
+      FROM (
         SELECT chipid,
                name,
                COALESCE(ST_Difference(DynamicWorld.lulc_polygon, SATLAS.lulc_polygon), DynamicWorld.lulc_polygon) AS result_geom_area
         FROM (
             SELECT chipid,
                    name,
-                   ST_Union(geometries) AS lulc_polygon
-            FROM lulc
-            WHERE area = '_AREA_'
-              AND year = '_FROM_YEAR_-01-01'
+                   geom AS lulc_polygon
+            FROM lulc_dissolved
+            WHERE area = :area
+              AND year = make_date(CAST(:from_year AS INTEGER), 1, 1)
               AND data_origins = 'DynamicWorld'
-              AND chipid in _CHIPID_LIST_
-            GROUP BY chipid,name
+              AND chipid = ANY(:chipid_list)
         ) AS DynamicWorld
         CROSS JOIN (
-            SELECT ST_Union(geometries) AS lulc_polygon
-            FROM lulc
-            WHERE area = '_AREA_'
-              AND year = '_FROM_YEAR_-01-01'
+            SELECT ST_Union(geom) AS lulc_polygon
+            FROM lulc_dissolved
+            WHERE area = :area
+              AND year = make_date(CAST(:from_year AS INTEGER), 1, 1)
               AND data_origins = 'SATLAS'
-              AND chipid in _CHIPID_LIST_
+              AND chipid = ANY(:chipid_list)
         ) AS SATLAS
         UNION ALL
         SELECT chipid,
@@ -180,22 +195,21 @@ FROM (
         FROM (
             SELECT chipid,
                    name,
-                   ST_Union(geometries) AS lulc_polygon
-            FROM lulc
-            WHERE area = '_AREA_'
-              AND year = '_FROM_YEAR_-01-01'
+                   geom AS lulc_polygon
+            FROM lulc_dissolved
+            WHERE area = :area
+              AND year = make_date(CAST(:from_year AS INTEGER), 1, 1)
               AND data_origins = 'SATLAS'
-              AND chipid in _CHIPID_LIST_
+              AND chipid = ANY(:chipid_list)
               AND name = 'Solar Panel'
-            GROUP BY chipid,name
         ) AS Solar
         CROSS JOIN (
-            SELECT ST_Union(geometries) AS lulc_polygon
-            FROM lulc
-            WHERE area = '_AREA_'
-              AND year = '_FROM_YEAR_-01-01'
+            SELECT ST_Union(geom) AS lulc_polygon
+            FROM lulc_dissolved
+            WHERE area = :area
+              AND year = make_date(CAST(:from_year AS INTEGER), 1, 1)
               AND data_origins = 'SATLAS'
-              AND chipid in _CHIPID_LIST_
+              AND chipid = ANY(:chipid_list)
               AND name = 'Wind Turbine'
         ) AS Wind
         UNION ALL
@@ -205,15 +219,15 @@ FROM (
         FROM (
             SELECT chipid,
                    name,
-                   ST_Union(geometries) AS lulc_polygon
-            FROM lulc
-            WHERE area = '_AREA_'
-              AND year = '_FROM_YEAR_-01-01'
+                   geom AS lulc_polygon
+            FROM lulc_dissolved
+            WHERE area = :area
+              AND year = make_date(CAST(:from_year AS INTEGER), 1, 1)
               AND data_origins = 'SATLAS'
-              AND chipid in _CHIPID_LIST_
+              AND chipid = ANY(:chipid_list)
               AND name = 'Wind Turbine'
-            GROUP BY chipid,name
         ) AS Wind
+      ) AS preceding_union
     ) AS preceding_year
     INNER JOIN (
         SELECT chipid,
@@ -223,21 +237,20 @@ FROM (
             SELECT 
                    chipid,
                    name,
-                   ST_Union(geometries) AS lulc_polygon
-            FROM lulc
-            WHERE area = '_AREA_'
-              AND year = '_TO_YEAR_-01-01'
+                   geom AS lulc_polygon
+            FROM lulc_dissolved
+            WHERE area = :area
+              AND year = make_date(CAST(:to_year AS INTEGER), 1, 1)
               AND data_origins = 'DynamicWorld'
-              AND chipid in _CHIPID_LIST_
-            GROUP BY chipid,name
+              AND chipid = ANY(:chipid_list)
         ) AS DynamicWorld
         CROSS JOIN (
-            SELECT ST_Union(geometries) AS lulc_polygon
-            FROM lulc
-            WHERE area = '_AREA_'
-              AND year = '_TO_YEAR_-01-01'
+            SELECT ST_Union(geom) AS lulc_polygon
+            FROM lulc_dissolved
+            WHERE area = :area
+              AND year = make_date(CAST(:to_year AS INTEGER), 1, 1)
               AND data_origins = 'SATLAS'
-              AND chipid in _CHIPID_LIST_
+              AND chipid = ANY(:chipid_list)
         ) AS SATLAS
         UNION ALL
         SELECT chipid,
@@ -246,22 +259,21 @@ FROM (
         FROM (
             SELECT chipid,
                    name,
-                   ST_Union(geometries) AS lulc_polygon
-            FROM lulc
-            WHERE area = '_AREA_'
-              AND year = '_TO_YEAR_-01-01'
+                   geom AS lulc_polygon
+            FROM lulc_dissolved
+            WHERE area = :area
+              AND year = make_date(CAST(:to_year AS INTEGER), 1, 1)
               AND data_origins = 'SATLAS'
-              AND chipid in _CHIPID_LIST_
+              AND chipid = ANY(:chipid_list)
               AND name = 'Solar Panel'
-            GROUP BY chipid,name
         ) AS Solar
         CROSS JOIN (
-            SELECT ST_Union(geometries) AS lulc_polygon
-            FROM lulc
-            WHERE area = '_AREA_'
-              AND year = '_TO_YEAR_-01-01'
+            SELECT ST_Union(geom) AS lulc_polygon
+            FROM lulc_dissolved
+            WHERE area = :area
+              AND year = make_date(CAST(:to_year AS INTEGER), 1, 1)
               AND data_origins = 'SATLAS'
-              AND chipid in _CHIPID_LIST_
+              AND chipid = ANY(:chipid_list)
               AND name = 'Wind Turbine'
         ) AS Wind
         UNION ALL
@@ -271,20 +283,17 @@ FROM (
         FROM (
             SELECT chipid,
                    name,
-                   ST_Union(geometries) AS lulc_polygon
-            FROM lulc
-            WHERE area = '_AREA_'
-              AND year = '_TO_YEAR_-01-01'
+                   geom AS lulc_polygon
+            FROM lulc_dissolved
+            WHERE area = :area
+              AND year = make_date(CAST(:to_year AS INTEGER), 1, 1)
               AND data_origins = 'SATLAS'
-              AND chipid in _CHIPID_LIST_
+              AND chipid = ANY(:chipid_list)
               AND name = 'Wind Turbine'
-            GROUP BY chipid,name
         ) AS Wind
     ) AS current_year ON 
                         preceding_year.chipid = current_year.chipid AND 
                         ST_Intersects(preceding_year.result_geom_area, current_year.result_geom_area)
-) ooq
-ORDER BY intersection_area_sq_km DESC;
 
 
         """,  # --WHERE preceding_year_name != current_year_name HAS BEEN REMOVED
@@ -292,8 +301,8 @@ ORDER BY intersection_area_sq_km DESC;
                   SELECT area,chipid,lulc_category_from,lulc_category_to,sum(area_km2) as changed_area
                     FROM land_use_change luc
                     WHERE area_km2 > 0.001 AND 
-                        luc.year_to = _YEAR_TO_ AND luc.year_from = _YEAR_FROM_
-                        AND lulc_category_from != lulc_category_to and area = '_AREA_'
+                        luc.year_to = :year_to AND luc.year_from = :year_from
+                        AND lulc_category_from != lulc_category_to and area = :area
                     GROUP BY area,chipid,lulc_category_from,lulc_category_to
                     ORDER BY area,chipid,sum(area_km2) desc
                   """,
@@ -301,9 +310,9 @@ ORDER BY intersection_area_sq_km DESC;
                   SELECT area,chipid,lulc_category_from,lulc_category_to,sum(area_km2) as changed_area
                     FROM land_use_change luc
                     WHERE area_km2 > 0.001 AND 
-                        luc.year_to = _YEAR_TO_ AND luc.year_from = _YEAR_FROM_
-                        AND lulc_category_from != lulc_category_to and area = '_AREA_'
-                        AND chipid = '_CHIPID_'
+                        luc.year_to = :year_to AND luc.year_from = :year_from
+                        AND lulc_category_from != lulc_category_to and area = :area
+                        AND chipid = :chipid
                     GROUP BY area,chipid,lulc_category_from,lulc_category_to
                     ORDER BY area,chipid,sum(area_km2) desc
                   """,
@@ -314,12 +323,16 @@ ORDER BY intersection_area_sq_km DESC;
                             WHERE area='Denmark' AND year_from = 2016 AND year_to = 2017
                             AND lulc_category_from != lulc_category_to
 
+                            """,
+        "GET_LAND_USE_CHANGE_FOR_CHIPS": """
+                            SELECT * FROM land_use_change
+                            WHERE area = :area AND chipid = ANY(:chipids)
                             """,
         "GET_LANDCOVER_CHANGE_WITH_PARAMS": """
                             SELECT lulc_category_from,lulc_category_to,area_km2
                             FROM land_use_change
 
-                            WHERE area='_AREA_' AND year_from = _YEAR_FROM_ AND year_to = _YEAR_TO_
+                            WHERE area=:area AND year_from = :year_from AND year_to = :year_to
                             """,
         "GET_SOLAR_WIND_OVERLAP": """
                                
@@ -340,7 +353,7 @@ ORDER BY intersection_area_sq_km DESC;
                                 a.area,
                                 a.year,
                                 a.chipid,
-                                ST_Area(ST_Transform(ST_Intersection(a.geometries, b.geometries),25832)) AS intersection_area
+                                ST_Area(ST_Transform(ST_Intersection(a.geometries, b.geometries),epsg.srid)) AS intersection_area
                                     --,
                                 --a.geometries AS a_geometry,
                                 --b.geometries AS b_geometry
@@ -355,6 +368,9 @@ ORDER BY intersection_area_sq_km DESC;
                                 AND a.geometries && b.geometries -- Ensures there's a bounding box intersection before attempting the more costly ST_Intersection
                                 AND ST_Intersects(a.geometries, b.geometries)
                                 --AND a.ctid != b.ctid -- Prevents a row from joining with itself
+                                INNER JOIN
+                                (VALUES __AREA_EPSG_VALUES__) AS epsg (area, srid)
+                                ON a.area = epsg.area
 
 
                                     ) iq
@@ -373,7 +389,7 @@ ORDER BY intersection_area_sq_km DESC;
                                     (SELECT 
                                     area,
                                     year,
-                                    SUM(ST_Area(ST_Transform(geometries,25832)))/1000000 as wind_turbine_km2
+                                    SUM(area_km2) as wind_turbine_km2
                                     FROM lulc
 
                                     WHERE name = 'Wind Turbine' AND data_origins = 'SATLAS'
@@ -389,7 +405,7 @@ ORDER BY intersection_area_sq_km DESC;
                                     (SELECT 
                                     area,
                                     year,
-                                    SUM(ST_Area(ST_Transform(geometries,25832)))/1000000 as solar_panel_km2
+                                    SUM(area_km2) as solar_panel_km2
                                     FROM lulc
 
                                     WHERE name = 'Solar Panel' AND data_origins = 'SATLAS'
@@ -399,7 +415,7 @@ ORDER BY intersection_area_sq_km DESC;
 
 
                                     on main.area = solar.area AND main.year = solar.year
-                                    """,
+                                    """.replace("__AREA_EPSG_VALUES__", AREA_EPSG_VALUES),
         "GET_LUC_VERIFICATION": """
                                                             
                                 SELECT year_from,year_to,lulc_category_from,lulc_category_to,SUM(area_km2) as area_km2, ST_Union(geom) as geometries from land_use_change 
@@ -414,28 +430,153 @@ ORDER BY intersection_area_sq_km DESC;
                                     (year_from = 2016 AND year_to = 2023))
 
                                 AND area = 'Denmark'
-                                AND chipid in (_CHIPIDS_)
+                                AND chipid = ANY(:chipids)
                                     
                                 GROUP BY year_from,year_to,lulc_category_from,lulc_category_to
 
                                 """,
     },
     "write": {
-        "INSERT_LANDCOVER": """INSERT INTO landcover (Area, Name, Year, data_origins, ChipID, Geometry) VALUES ('_AREA_', '_NAME_', '_YEAR_', '_DATA_ORIGIN_', '_CHIPID_',')""",
+        "INSERT_LANDCOVER": """INSERT INTO landcover (Area, Name, Year, data_origins, ChipID, Geometry) VALUES (:area, :name, :year, :data_origin, :chipid, ST_GeomFromWKB(:geometry, 4326))""",
         "INSERT_DRIVE_FOLDER": """
                     INSERT INTO drive_folders (area, foldername) 
-                    VALUES ('_AREA_', '_FOLDERNAME_') 
+                    VALUES (:area, :foldername) 
                     """,
         "INSERT_FINISHED_SUBPOLY": """
                     INSERT INTO sub_polygons (area, polygon_index) 
-                    VALUES ('_AREA_', '_POLYGON_INDEX_') 
+                    VALUES (:area, CAST(:polygon_index AS INTEGER)) 
+                    """,
+        # lulc_dissolved holds one ST_Union'ed geometry per area/chip/year/origin/category,
+        # so the analytical queries do not have to dissolve the raw lulc polygons every time.
+        # The table itself is created by src/sql/migrations/0004_lulc_dissolved.sql
+        "DELETE_LULC_DISSOLVED": """
+                    DELETE FROM lulc_dissolved
+                    WHERE area = :area
+                    AND chipid = ANY(:chipid_list)
+                    AND year = ANY(CAST(:year_list AS DATE[]))
                     """,
+        "INSERT_LULC_DISSOLVED": """
+                    INSERT INTO lulc_dissolved (area, chipid, year, data_origins, name, geom, area_km2)
+                    SELECT area,
+                           chipid,
+                           year,
+                           data_origins,
+                           name,
+                           ST_Union(geometries),
+                           ST_Area(ST_Transform(ST_Union(geometries), CAST(:epsg AS INTEGER))) / 1000000.0
+                    FROM lulc
+                    WHERE area = :area
+                    AND chipid = ANY(:chipid_list)
+                    AND year = ANY(CAST(:year_list AS DATE[]))
+                    GROUP BY area, chipid, year, data_origins, name
+                    """,
+        # Statements with bind parameters cannot be sent as one string, so entries with
+        # several statements are lists that DBMS.write runs in order
+        "REBUILD_LULC_DISSOLVED": [
+            "DELETE FROM lulc_dissolved WHERE area = :area",
+            """
+                    INSERT INTO lulc_dissolved (area, chipid, year, data_origins, name, geom, area_km2)
+                    SELECT area,
+                           chipid,
+                           year,
+                           data_origins,
+                           name,
+                           ST_Union(geometries),
+                           ST_Area(ST_Transform(ST_Union(geometries), CAST(:epsg AS INTEGER))) / 1000000.0
+                    FROM lulc
+                    WHERE area = :area
+                    GROUP BY area, chipid, year, data_origins, name
+                    """,
+        ],
     },
 }
 
 
+# Parameters that are bound as Postgres arrays and geometries respectively
+ARRAY_PARAMS = ["chipids", "chipid_list", "year_list"]
+GEOMETRY_PARAMS = ["geometry"]
+
+
+def catalog_statements(query_name, func="read"):
+    """The SQL statement(s) of a catalog entry as a list."""
+    statements = QUERY_CATALOG[func][query_name]
+    if isinstance(statements, str):
+        statements = [statements]
+    return list(statements)
+
+
+def bind_params(params):
+    """
+    Turn query params into bind parameters for the catalog.
+
+    Keys may be given as bind parameter names ("area") or as the old replace tokens
+    ("_AREA_", "__COUNTRY__"). Array parameters take any iterable, or an old-style
+    quoted SQL list string such as "('14_3_12','14_3_13')". Geometry parameters take
+    shapely geometries or WKT and are sent as WKB.
+    """
+    bound = {}
+    for key, value in params.items():
+        name = key.strip("_").lower()
+
+        if name in ARRAY_PARAMS:
+            if isinstance(value, str):
+                value = re.findall(r"'([^']*)'", value)
+            value = [str(item) for item in value]
+        elif name in GEOMETRY_PARAMS and not isinstance(value, bytes):
+            if isinstance(value, str):
+                value = shapely.from_wkt(value)
+            value = shapely.to_wkb(value)
+        elif isinstance(value, np.generic):
+            value = value.item()
+
+        bound[name] = value
+
+    return bound
+
+
+def group_chunks(chunks, by):
+    """
+    Regroup streamed chunks into one DataFrame per group.
+
+    The query must be ordered by the `by` columns. Rows of the last group in a chunk
+    are held back until the next chunk shows whether the group continues.
+
+    Args:
+        chunks: Iterable of (Geo)DataFrames, e.g. from DBMS.iter_read.
+        by: Column or list of columns identifying a group.
+
+    Yields:
+        Tuple of the group key (a tuple of the `by` values) and its rows.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+
+    carry = None
+    for chunk in chunks:
+        if carry is not None:
+            chunk = pd.concat([carry, chunk])
+        if chunk.shape[0] == 0:
+            continue
+
+        is_last_group = (chunk[by] == chunk[by].iloc[-1]).all(axis=1)
+        carry = chunk[is_last_group]
+
+        yield from chunk[~is_last_group].groupby(by, sort=False)
+
+    if carry is not None and carry.shape[0] > 0:
+        yield from carry.groupby(by, sort=False)
+
+
 class DriveManager:
-    def __init__(self):
+    def __init__(self, workers=None, cube_dir=None):
+        """
+        :param workers: Number of processes converting rasters to polygons, defaults
+            to the number of CPUs
+        :param cube_dir: Where the downloaded rasters are also kept as per-chip cubes
+            (see src/cube_store.py), e.g. CUBE_STORE_DIR. None only stores the polygons
+        """
+        self.workers = workers
+        self.cube_dir = cube_dir
+
         # Specify the scopes and service account file
         self.SCOPES = ["https://www.googleapis.com/auth/drive"]
         self.SERVICE_ACCOUNT_FILE = "askemeineche_google_drive_secret.json"
@@ -450,102 +591,99 @@ class DriveManager:
         self.DBMS = DBMS()
 
     def update_database(self):
+        """
+        Ingest the exports of every Drive folder in one pipeline.
+
+        The folder ids are looked up, and the folders listed, in batch requests.
+        """
         folders = self.DBMS.read("GET_DRIVE_FOLDERS", {})
+        folder_ids = find_folders(self.drive, folders["foldername"].unique())
 
-        for _, row in tqdm(
-            folders.iterrows(), desc="Checking Each Folder for New Data"
-        ):
-            self.search_folder_and_download_files(
-                folder_name=row["foldername"], area=row["area"]
-            )
+        for folder_name in set(folders["foldername"]) - set(folder_ids):
+            print(f"No folder found with the name: {folder_name}")
+
+        # Folder id -> area of its exports
+        areas = {
+            folder_ids[row["foldername"]]: row["area"]
+            for _, row in folders.iterrows()
+            if row["foldername"] in folder_ids
+        }
+        if not areas:
+            return
+
+        return IngestionPipeline(
+            DriveSource(self.creds, areas),
+            self.DBMS,
+            convert_workers=self.workers,
+            retry_queue=RetryQueue(),
+            cube_dir=self.cube_dir,
+        ).run()
 
     def search_folder_and_download_files(
         self, folder_name, area="Denmark", test=False, pageSize=100
     ):
-        # Step 1: Search for the folder by name to get its ID.
-        folder_query = f"mimeType='application/vnd.google-apps.folder' and name='{folder_name}' and trashed=false"
-        folder_result = (
-            self.drive.files().list(q=folder_query, fields="files(id, name)").execute()
-        )
-        folders = folder_result.get("files", [])
+        """
+        Ingest every export in a Drive folder and delete the files once committed.
 
-        if not folders:
+        Downloading, conversion and uploading overlap, see src/ingestion.py. Files
+        that fail are recorded in the RetryQueue, see retry_failed. Multi-year exports
+        ({chipid}_years_...) are split into their years while converting.
+
+        :param test: Stop after the first pageSize files
+        :param pageSize: Files listed per request and written per transaction
+        :return: IngestionStats of the run
+        """
+        folder_ids = find_folders(self.drive, [folder_name])
+
+        if folder_name not in folder_ids:
             print(f"No folder found with the name: {folder_name}")
             return
-        folder_id = folders[0][
-            "id"
-        ]  # Assuming the first result is the folder you're looking for
+        folder_id = folder_ids[folder_name]
         print(f"Folder ID for '{folder_name}': {folder_id}")
 
-        page_token = None
-        pageNum = 1
-        cc = 0
-        while True:
-            file_contents = {}
-            file_ids = []
-            print(f"Downloading Files From Page {pageNum}")
-            # Step 2: Search for the files inside the folder with pagination.
-            files_query = f"'{folder_id}' in parents and trashed=false"
-            files_result = (
-                self.drive.files()
-                .list(
-                    q=files_query,
-                    pageSize=pageSize,
-                    fields="nextPageToken, files(id, name)",
-                    pageToken=page_token,
-                )
-                .execute()
-            )
-            files = files_result.get("files", [])
-            page_token = files_result.get("nextPageToken", None)
-
-            if not files:
-                print(f"No more files found in the folder: {folder_name}")
-                break
-            else:
-                print(f"Files in folder '{folder_name}':")
-                for file in tqdm(files, desc="Downloading files from current page..."):
-                    content = self.download_file(file["id"])
-                    file_contents[file["name"]] = content
-                    file_ids.append(file["id"])
-
-                geoframe = raster_dict2geo(file_contents, area=area)
-                try:
-                    self.DBMS.add_land_cover_type(geoframe)
-
-                    self.delete_files_by_ids(file_ids)
-                except:
-                    print("Could not upload to DB")
-                    geoframe.to_file(f'/output/errors/{file["id"]}.shp')
-
-                pageNum += 1
-            if page_token is None:
-                break
-            if test:
-                break
-
-        return file_contents
+        pipeline = IngestionPipeline(
+            DriveSource(self.creds, {folder_id: area}, page_size=pageSize),
+            self.DBMS,
+            area=area,
+            convert_workers=self.workers,
+            batch_files=pageSize,
+            max_files=pageSize if test else None,
+            retry_queue=RetryQueue(),
+            cube_dir=self.cube_dir,
+        )
+        return pipeline.run()
+
+    def retry_failed(self):
+        """Retry the files of earlier runs that failed to ingest or be deleted."""
+        retry_queue = RetryQueue()
+        if len(retry_queue) == 0:
+            print("No failed files to retry")
+            return
+
+        return retry_failed(
+            DriveSource(self.creds, {}),
+            self.DBMS,
+            retry_queue,
+            convert_workers=self.workers,
+            cube_dir=self.cube_dir,
+        )
 
     def delete_files_by_ids(self, file_ids):
         """
-        Delete files from Google Drive given a dictionary of file IDs.
+        Delete files from Google Drive in batch requests.
 
         Args:
-            file_ids_dict (dict): A dictionary with file IDs as keys.
+            file_ids (list): The IDs of the files to delete.
+
+        Returns:
+            dict: The error of each file that could not be deleted, by ID.
         """
-        delete_counter = 0
-        for ix, file_id in tqdm(
-            enumerate(file_ids), desc="Deleting uploaded files from Drive"
-        ):
-            try:
-                # Attempt to delete each file by ID
-                self.drive.files().delete(fileId=file_id).execute()
-                delete_counter += 1
-            except Exception as e:
-                # Handle potential errors, such as the file not existing or lacking permission
-                print(f"Could not delete file with ID {file_id}. Error: {e}")
-
-        print(f"{delete_counter} OUT OF {ix+1} WHERE SUCCESSFULLY DELETED")
+        deleted, errors = delete_files(self.drive, list(file_ids))
+        for file_id, error in errors.items():
+            print(f"Could not delete file with ID {file_id}. Error: {error}")
+
+        print(f"{len(deleted)} OUT OF {len(file_ids)} WHERE SUCCESSFULLY DELETED")
+        return errors
 
     def download_file(self, file_id):
         """
@@ -575,9 +713,41 @@ class DriveManager:
 class DBMS:
     """Database Manager System.
     Håndterer Lasse (Marius <3)
+
+    The database is reached through a backend (src/backends): the thesis PostGIS
+    server over SSH by default, or a local DuckDB file with backend="embedded" or
+    LULC_DB_BACKEND=embedded. The embedded backend is experimental, only the queries
+    scripts/embedded_smoke.py checks are known to match PostGIS. A Backend instance can also be passed directly, e.g.
+    PostgresBackend.from_dsn(...) for a local PostGIS.
+
+    Every postgres instance shares one long-lived SSH tunnel and connection pool per
+    user (see src/db_connection.py). Use it as a context manager, or call close(), to
+    shut the tunnel down before the interpreter exits.
+
+    With cache=True (or a QueryCache) read() results are cached on disk, see
+    src/query_cache.py. Writes through any DBMS invalidate the affected entries.
     """
 
-    def __init__(self):
+    def __init__(self, pool_size=4, max_overflow=4, cache=False, backend=None):
+        self.cache = QueryCache() if cache is True else (cache or None)
+
+        if backend is None:
+            backend = os.environ.get("LULC_DB_BACKEND", DB_BACKEND)
+
+        if isinstance(backend, Backend):
+            self.backend = backend
+            self.connection = getattr(backend, "connection", None)
+            return
+        if backend == "embedded":
+            from src.backends.embedded import EmbeddedBackend
+
+            self.backend = EmbeddedBackend(
+                os.environ.get("LULC_EMBEDDED_DB", EMBEDDED_DB_PATH)
+            )
+            self.connection = None
+            return
+        assert backend == "postgres", f"Unknown backend {backend}"
+
         if getpass.getuser() == "viktorduepedersen":
             self.username = "viktor"
             self.password = "ye6X8ja(JaF<4>Uv"
@@ -588,68 +758,155 @@ class DBMS:
         self.host_address = "192.168.1.150"
         self.port = 5432
         self.db_name = "GIS"
-        self.server = SSHTunnelForwarder(
-            ("89.150.135.220", 11234),
+        self.connection = get_tunnelled_engine(
+            ssh_address=("89.150.135.220", 11234),
             ssh_username="viktor"
             if getpass.getuser() == "viktorduepedersen"
             else "aske",
             ssh_pkey="~/.ssh/id_rsa_viktor"
             if getpass.getuser() == "viktorduepedersen"
             else "~/.ssh/id_rsa_aske",
-            remote_bind_address=("192.168.1.150", 5432),
+            remote_bind_address=(self.host_address, self.port),
+            username=self.username,
+            password=self.password,
+            db_name=self.db_name,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
         )
+        self.backend = PostgresBackend(self.connection)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def server(self):
+        return self.connection.server
+
+    @property
+    def engine(self):
+        return self.connection.engine
+
+    def connect(self):
+        """Context manager handing out a (pooled) connection of the backend."""
+        return self.backend.connect()
+
+    def pool_stats(self):
+        """Checkouts, waits and reconnects so far - useful for sizing the pool."""
+        return self.backend.pool_stats()
+
+    def close(self):
+        """
+        Release this instance's hold on the backend. A shared tunnel stays up for the
+        other DBMS instances until the last one closes.
+        """
+        if self.cache is not None:
+            self.cache.flush()
+        self.backend.close()
+
+    def cache_stats(self):
+        """Hits, misses and bytes served from the query cache, if it is enabled."""
+        return self.cache.cache_stats() if self.cache is not None else None
+
+    def invalidate_cache(self, tables, area=None, years=None):
+        """Drop cached results that a write to tables for area/years may have changed."""
+        # Writers usually run without a cache of their own, but must still keep an
+        # existing on-disk cache from serving stale results
+        cache = self.cache if self.cache is not None else QueryCache.existing()
+        if cache is not None:
+            cache.invalidate(tables, area=area, years=years)
 
     def handle_queries(
-        self, query_name, params, func="read", geom_query=False, geom_col="geometries"
+        self,
+        query_name,
+        params,
+        func="read",
+        geom_query=False,
+        geom_col="geometries",
+        conn=None,
     ):
-        query = QUERY_CATALOG[func][query_name]
-        for query_element, element_value in params.items():
-            query = query.replace(query_element, element_value)
-        # print(query)
+        statements = catalog_statements(query_name, func=func)
+        params = bind_params(params)
         if func == "write":
-            return query
+            return statements, params
 
-        if geom_query:
-            return gpd.GeoDataFrame.from_postgis(query, self.engine, geom_col=geom_col)
-        else:
-            return pd.read_sql(query, self.engine)
+        return self.backend.read_frame(
+            conn, statements[0], params, geom_col=geom_col if geom_query else None
+        )
 
     def read(self, query_name, params, geom_query=False, geom_col="geometries"):
-        self.server.start()
-        local_port = str(self.server.local_bind_port)
-
-        self.engine = create_engine(
-            "postgresql://{}:{}@{}:{}/{}".format(
-                self.username, self.password, "127.0.0.1", local_port, self.db_name
+        cache_geom_col = geom_col if geom_query else None
+        if self.cache is not None:
+            query_results = self.cache.get(query_name, bind_params(params), cache_geom_col)
+            if query_results is not None:
+                return query_results
+            # Before querying, so a write committed meanwhile keeps the result out
+            generation = self.cache.generation()
+
+        with self.connect() as conn:
+            query_results = self.handle_queries(
+                query_name, params, geom_query=geom_query, geom_col=geom_col, conn=conn
             )
-        )
 
-        query_results = self.handle_queries(
-            query_name, params, geom_query=geom_query, geom_col=geom_col
-        )
-
-        self.server.stop()
+        if self.cache is not None:
+            self.cache.put(
+                query_name,
+                catalog_statements(query_name)[0],
+                bind_params(params),
+                query_results,
+                cache_geom_col,
+                generation=generation,
+            )
 
         return query_results
 
-    def write(self, query_name, values):
-        self.server.start()
-        local_port = str(self.server.local_bind_port)
+    def iter_read(
+        self,
+        query_name,
+        params,
+        chunksize=100_000,
+        geom_query=False,
+        geom_col="geometries",
+    ):
+        """
+        Stream the result of a read query as (Geo)DataFrames of at most chunksize rows.
+
+        The rows are fetched through a server-side cursor (or DuckDB's chunked fetch),
+        so only one chunk is held in memory at a time. The pooled connection is held until the generator is
+        exhausted or closed.
 
-        self.engine = create_engine(
-            "postgresql://{}:{}@{}:{}/{}".format(
-                self.username, self.password, "127.0.0.1", local_port, self.db_name
+        :param query_name: Name of the query in QUERY_CATALOG["read"]
+        :param params: Query parameters, see bind_params
+        :param chunksize: Maximum number of rows per yielded frame
+        :return: Generator of DataFrames, or GeoDataFrames if geom_query
+        """
+        statement = catalog_statements(query_name)[0]
+        params = bind_params(params)
+
+        with self.connect() as conn:
+            yield from self.backend.iter_frames(
+                conn,
+                statement,
+                params,
+                chunksize,
+                geom_col=geom_col if geom_query else None,
             )
-        )
 
-        query = text(self.handle_queries(query_name, values, func="write"))
+    def write(self, query_name, values):
+        statements, params = self.handle_queries(query_name, values, func="write")
 
-        print(query)
-        with self.engine.connect() as conn:
-            conn.execute(query)
-            conn.commit()
+        print(query_name)
+        with self.connect() as conn:
+            for statement in statements:
+                self.backend.execute(conn, statement, params)
+            self.backend.commit(conn)
 
-        self.server.stop()
+        self.invalidate_cache(
+            [table for statement in statements for table in written_tables(statement)],
+            area=query_area(params),
+        )
 
     def format_DW_geodf_for_DBMS(self, gdf):
         gdf["name"] = [LAND_COVER_LEGEND[LULC_id] for LULC_id in gdf.landcover.values]
@@ -658,131 +915,103 @@ class DBMS:
         return gdf
 
     def add_land_use_change(self, gdf):
-        self.server.start()
-        local_port = str(self.server.local_bind_port)
-
-        self.engine = create_engine(
-            "postgresql://{}:{}@{}:{}/{}".format(
-                self.username, self.password, "127.0.0.1", local_port, self.db_name
-            )
-        )
-
-        dtypes = {
-            "area": types.VARCHAR(255),
-            "chipid": types.VARCHAR(255),
-            "year_from": types.INTEGER,
-            "year_to": types.INTEGER,
-            "lulc_category_from": types.VARCHAR(255),
-            "lulc_category_to": types.VARCHAR(255),
-            "percent_change": types.FLOAT,
-            "from_category_area_sq_km": types.FLOAT,
-            "area_km2": types.FLOAT,
-            "geom": Geometry("GEOMETRY", srid=4326),
-        }
+        """
+        Append rows to land_use_change.
 
-        if "object_id" in gdf.columns:
-            dtypes["object_id"] = types.VARCHAR(100)
+        area_km2 is measured from geom, unless the rows come with it and without
+        geometries, like the raster engine's (src/raster_change.py). The caller's
+        frame is not modified.
+        """
+        gdf = gdf.copy()
+        if "area_km2" not in gdf.columns or gdf["geom"].notna().any():
+            gdf["area_km2"] = calculate_area_km2(gdf, geom_col="geom")
+        gdf = add_chip_coordinates(gdf)
+        if "from_category_area_sq_km" in gdf.columns:
+            gdf["percent_change"] = gdf["area_km2"] / gdf["from_category_area_sq_km"] * 100
 
-        # Use 'dtype' parameter to specify SQL types for the GeoDataFrame columns
-        gdf.to_sql(
-            "land_use_change",
-            self.engine,
-            if_exists="append",
-            index=False,
-            dtype=dtypes,
-        )
+        with self.backend.transaction() as conn:
+            self.backend.copy_frame(conn, gdf, "land_use_change", geom_cols=["geom"])
 
-        self.server.stop()
+        for area, area_gdf in gdf.groupby("area"):
+            years = set(area_gdf["year_from"]) | set(area_gdf["year_to"])
+            self.invalidate_cache(["land_use_change"], area=area, years=years)
 
     def add_add_change(self, gdf):
-        self.server.start()
-        local_port = str(self.server.local_bind_port)
-
-        self.engine = create_engine(
-            "postgresql://{}:{}@{}:{}/{}".format(
-                self.username, self.password, "127.0.0.1", local_port, self.db_name
-            )
-        )
-
-        dtypes = {
-            "area": types.VARCHAR(255),
-            "chipid": types.VARCHAR(255),
-            "year_from": types.INTEGER,
-            "year_to": types.INTEGER,
-            "lulc_category_from": types.VARCHAR(255),
-            "lulc_category_to": types.VARCHAR(255),
-            "percent_change": types.FLOAT,
-            "from_category_area_sq_km": types.FLOAT,
-            "area_km2": types.FLOAT,
-            "geom": Geometry("GEOMETRY", srid=4326),
-        }
-
-        if "object_id" in gdf.columns:
-            dtypes["object_id"] = types.VARCHAR(100)
-
-        # Use 'dtype' parameter to specify SQL types for the GeoDataFrame columns
-        gdf.to_sql(
-            "land_use_change",
-            self.engine,
-            if_exists="append",
-            index=False,
-            dtype=dtypes,
-        )
-
-        self.server.stop()
+        # Kept for older callers - identical to add_land_use_change
+        self.add_land_use_change(gdf)
 
     def add_land_cover_type(self, gdf, table_name="lulc"):
         print("Uploading to DB....")
 
-        self.server.start()
-        local_port = str(self.server.local_bind_port)
-
-        self.engine = create_engine(
-            "postgresql://{}:{}@{}:{}/{}".format(
-                self.username, self.password, "127.0.0.1", local_port, self.db_name
-            )
-        )
-
         if gdf.shape[0] == 0:
             return 1
 
-        # Assuming 'gdf' is your GeoDataFrame and 'engine' is your SQLAlchemy engine
         if gdf["data_origins"].values[0] == "DynamicWorld":
             gdf = self.format_DW_geodf_for_DBMS(gdf)
 
-        gdf["geometries"] = gdf["geometry"].apply(
-            lambda x: WKTElement(x.wkt, srid=4326)
-        )
-
-        gdf.drop(columns=["geometry"], inplace=True)
+        gdf = gdf.rename(columns={"geometry": "geometries"})
+        gdf["area_km2"] = calculate_area_km2(gdf, geom_col="geometries")
+        gdf = add_chip_coordinates(gdf)
 
         # Convert 'Year' column to date if it's not already in datetime format
         gdf["year"] = pd.to_datetime(gdf["year"])
 
-        dtypes = {
-            "data_origins": types.VARCHAR(255),
-            "name": types.VARCHAR(255),
-            "year": types.DATE,
-            "chipid": types.INTEGER,
-            "area": types.VARCHAR(100),
-            "geometries": Geometry("GEOMETRY", srid=4326),
+        with self.backend.transaction() as conn:
+            self.backend.copy_frame(conn, gdf, table_name, geom_cols=["geometries"])
+
+            if table_name == "lulc":
+                # Re-dissolve exactly the chip-years that were just appended
+                for area, area_gdf in gdf.groupby("area"):
+                    self.refresh_lulc_dissolved(
+                        area,
+                        chipids=area_gdf["chipid"].unique(),
+                        years=area_gdf["year"].dt.strftime("%Y-%m-%d").unique(),
+                        conn=conn,
+                    )
+
+        tables = [table_name, "lulc_dissolved"] if table_name == "lulc" else [table_name]
+        for area, area_gdf in gdf.groupby("area"):
+            self.invalidate_cache(tables, area=area, years=area_gdf["year"].dt.year.unique())
+
+        return 0
+
+    def refresh_lulc_dissolved(self, area, chipids=None, years=None, conn=None):
+        """
+        Recompute the lulc_dissolved rows of an area from lulc.
+
+        With chipids and years only those chip-years are replaced, otherwise the
+        whole area is rebuilt. When conn is given the statements run inside the
+        caller's transaction.
+        """
+        params = {
+            "area": area,
+            "epsg": EPSG_MAPPING.get(area, EPSG_MAPPING["World"]),
         }
 
-        if "object_id" in gdf.columns:
-            dtypes["object_id"] = types.VARCHAR(100)
+        if chipids is None:
+            query_names = ["REBUILD_LULC_DISSOLVED"]
+        else:
+            params["chipid_list"] = chipids
+            params["year_list"] = years
+            query_names = ["DELETE_LULC_DISSOLVED", "INSERT_LULC_DISSOLVED"]
 
-        # Use 'dtype' parameter to specify SQL types for the GeoDataFrame columns
-        gdf.to_sql(
-            table_name,
-            self.engine,
-            if_exists="append",
-            index=False,
-            dtype=dtypes,
-        )
+        if conn is None:
+            with self.backend.transaction() as conn:
+                self.refresh_lulc_dissolved(area, chipids, years, conn=conn)
 
-        self.server.stop()
+            if years is not None:
+                years = pd.to_datetime(pd.Series(years)).dt.year.unique()
+            self.invalidate_cache(["lulc_dissolved"], area=area, years=years)
+            return
 
-        return 0
+        for query_name in query_names:
+            statements, bound_params = self.handle_queries(query_name, params, func="write")
+            for statement in statements:
+                self.backend.execute(conn, statement, bound_params)
+
+    def migrate(self, target=None):
+        """Bring the schema up to date, see src/migrations.py."""
+        return self.backend.migrate(target=target)
 
 
 if __name__ == "__main__":
@@ -790,6 +1019,6 @@ if __name__ == "__main__":
     print(
         db.read(
             "GET_DW_LANDCOVER",
-            {"_AREA_": "DK", "_START_YEAR_": "2010", "_END_YEAR_": "2024"},
+            {"area": "DK", "chipids": [], "start_year": 2010, "end_year": 2024},
         )
     )
@@ -9,8 +9,7 @@ import requests
 import zipfile
 import shutil
 import geopandas as gpd
-from src.dynamic_world import DynamicWorldBasemap
-from src.utils import authenticate_Google_Earth_Engine as authenticate
+from src.boundary_store import BoundaryStore
 import ee
 import os
 from tqdm import tqdm
@@ -139,18 +138,10 @@ def create_geodataframe(geojson_list):
 # Load the LSIB data
 
 
-def get_LSIB_as_gdf(country):
-    DWB = DynamicWorldBasemap(
-        area_name=country, date_ranges=[("2016-01-01", "2016-12-31")]
-    )
-
-    polys = DWB.create_polygon(DWB.get_country_LSIB_coordinates(country), flip=False)
-
-    # Example usage
-    geojson_list = ee_geometry_to_geojson([polys])  # Convert ee.Geometry to GeoJSON
-    gdf = create_geodataframe(geojson_list)  # Create GeoDataFrame
-
-    return gdf.dissolve().set_crs("EPSG:4326")
+def get_LSIB_as_gdf(country, boundary_store=None):
+    # The outer rings of the LSIB polygons dissolved, read from the local boundary store
+    boundary_store = BoundaryStore() if boundary_store is None else boundary_store
+    return boundary_store.outline(country)
 
 
 def format_date(date):
@@ -176,11 +167,11 @@ def to_DB_format(gdf, year, country):
 
 
 def get_polygon_chips(gdf, year, country):
-    geometry_wkt = gdf.dissolve().geometry.geometry.iloc[0].wkt
+    geometry = gdf.dissolve().geometry.iloc[0]
     DB = DBMS()
     intersecting_chips = DB.read(
         "GET_INTERSECTING_CHIPS",
-        {"_AREA_": country, "_GEOMETRY_": geometry_wkt, "_YEAR_": year},
+        {"area": country, "geometry": geometry, "year": year},
         geom_query=True,
     )
 
@@ -269,11 +260,11 @@ def upload_SATLAS_data(countries, years):
 
         SATLAS[year_] = {"wind": gdf_wind, "solar": gdf_solar}
 
-    # Get LSIBs
+    # Get LSIBs, Earth Engine is only contacted for countries not stored yet
     country_gdfs = {}
-    authenticate()
+    boundary_store = BoundaryStore()
     for country in tqdm(countries, desc="Getting LSIB data for each country"):
-        country_gdfs[country] = get_LSIB_as_gdf(country)
+        country_gdfs[country] = get_LSIB_as_gdf(country, boundary_store)
 
     # Run through all years
     DB_upload_list = []
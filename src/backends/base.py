@@ -0,0 +1,73 @@
+"""
+The interface DBMS uses to talk to a database.
+
+DBMS owns the query catalog, parameter binding, caching and the upload logic. A
+backend only knows how to hand out connections and run SQL from the catalog on them,
+so the same DBMS code runs against the remote PostGIS server (postgres.py) or a local
+single-file database (embedded.py).
+"""
+
+from abc import ABC, abstractmethod
+from typing import Dict, Iterator, List, Optional
+
+import pandas as pd
+
+
+class Backend(ABC):
+    """Base class of the database backends. Subclasses implement every abstract method."""
+
+    name = "base"
+
+    @abstractmethod
+    def connect(self):
+        """Context manager handing out a connection."""
+
+    @abstractmethod
+    def transaction(self):
+        """Context manager handing out a connection inside a transaction."""
+
+    @abstractmethod
+    def read_frame(
+        self, conn, sql: str, params: Dict, geom_col: Optional[str] = None
+    ) -> pd.DataFrame:
+        """
+        Run a read query.
+
+        Returns a GeoDataFrame with geom_col as geometry (EPSG:4326) if geom_col is
+        given, otherwise a DataFrame with any geometry columns as hex WKB.
+        """
+
+    @abstractmethod
+    def iter_frames(
+        self,
+        conn,
+        sql: str,
+        params: Dict,
+        chunksize: int,
+        geom_col: Optional[str] = None,
+    ) -> Iterator[pd.DataFrame]:
+        """Like read_frame, but yields frames of at most chunksize rows."""
+
+    @abstractmethod
+    def execute(self, conn, sql: str, params: Dict):
+        """Run a write statement. The caller commits."""
+
+    @abstractmethod
+    def commit(self, conn):
+        """Commit the transaction of a connection."""
+
+    @abstractmethod
+    def copy_frame(
+        self, conn, frame: pd.DataFrame, table_name: str, geom_cols: List[str]
+    ) -> int:
+        """Append a frame to a table. Column names must match the table's."""
+
+    @abstractmethod
+    def migrate(self, target: Optional[int] = None):
+        """Create or upgrade the schema."""
+
+    def pool_stats(self) -> Dict:
+        return {}
+
+    def close(self):
+        pass
@@ -0,0 +1,353 @@
+"""
+Embedded single-file backend on DuckDB with the spatial extension. Experimental.
+
+lulc, land_use_change, lulc_dissolved and the bookkeeping tables live in one .duckdb
+file (EMBEDDED_DB_PATH), so the pipeline runs on a laptop-sized subset without the
+SSH tunnel, and benchmarks can run without network. The catalog queries are written
+for PostGIS and translated on the fly where DuckDB-spatial differs:
+
+- :name bind parameters become $name
+- the ST_Union aggregate is ST_Union_Agg
+- ST_Transform takes source and target CRS strings, and needs always_xy since the
+  stored geometries are lon/lat
+- ST_GeomFromWKB takes no SRID
+- x = ANY(list) becomes list_contains(list, x), and a && b ST_Intersects_Extent(a, b)
+
+The translation covers the queries of the pipeline, not every PostGIS behaviour, so
+the backend is not a drop-in replacement for the thesis database yet: results are
+only known to match the Postgres path where scripts/embedded_smoke.py checks them
+(GET_DW_LANDCOVER, GET_CHIP_LANDCOVER, CALCULATE_LULC_INTERSECTION and
+GET_SOLAR_WIND_OVERLAP). Run it after changing the catalog or upgrading DuckDB.
+
+Fill it with scripts/make_embedded_subset.py.
+"""
+
+import re
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+import duckdb
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from config import EMBEDDED_DB_PATH
+from src.backends.base import Backend
+
+# Same tables as src/sql/migrations, without the PostGIS specific indexes and partitions
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS lulc (
+        data_origins VARCHAR,
+        name VARCHAR,
+        year DATE,
+        chipid VARCHAR,
+        area VARCHAR,
+        object_id VARCHAR,
+        geometries GEOMETRY,
+        area_km2 DOUBLE,
+        polygon_index INTEGER,
+        lon_idx INTEGER,
+        lat_idx INTEGER,
+        sub_part INTEGER
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS land_use_change (
+        area VARCHAR,
+        chipid VARCHAR,
+        year_from INTEGER,
+        year_to INTEGER,
+        lulc_category_from VARCHAR,
+        lulc_category_to VARCHAR,
+        area_km2 DOUBLE,
+        from_category_area_sq_km DOUBLE,
+        percent_change DOUBLE,
+        object_id VARCHAR,
+        geom GEOMETRY,
+        polygon_index INTEGER,
+        lon_idx INTEGER,
+        lat_idx INTEGER,
+        sub_part INTEGER
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS lulc_dissolved (
+        area VARCHAR,
+        chipid VARCHAR,
+        year DATE,
+        data_origins VARCHAR,
+        name VARCHAR,
+        geom GEOMETRY,
+        area_km2 DOUBLE
+    )
+    """,
+    "CREATE TABLE IF NOT EXISTS sub_polygons (area VARCHAR, polygon_index INTEGER)",
+    "CREATE TABLE IF NOT EXISTS drive_folders (area VARCHAR, foldername VARCHAR)",
+]
+
+# Same pattern SQLAlchemy's text() uses to find bind parameters
+BIND_PARAM_PATTERN = re.compile(r"(?<![:\w\\]):(\w+)(?!:)")
+
+# Rows per DuckDB vector, fetch_df_chunk counts in vectors
+VECTOR_SIZE = 2048
+
+
+def _matching_paren(sql: str, open_ix: int) -> int:
+    """Index of the parenthesis closing the one at open_ix."""
+    depth = 0
+    in_string = False
+    for ix in range(open_ix, len(sql)):
+        char = sql[ix]
+        if char == "'":
+            in_string = not in_string
+        elif in_string:
+            continue
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth == 0:
+                return ix
+    raise ValueError(f"Unbalanced parentheses in: {sql[open_ix:open_ix + 80]}")
+
+
+def _split_args(args: str) -> List[str]:
+    """Split a function's argument list on its top level commas."""
+    parts, depth, in_string, start = [], 0, False, 0
+    for ix, char in enumerate(args):
+        if char == "'":
+            in_string = not in_string
+        elif in_string:
+            continue
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            parts.append(args[start:ix].strip())
+            start = ix + 1
+    parts.append(args[start:].strip())
+    return parts
+
+
+def _rewrite_calls(sql: str, function: str, rewrite: Callable[[List[str]], str]) -> str:
+    """Replace every call of function(...) with rewrite(args), innermost calls first."""
+    pattern = re.compile(r"\b" + function + r"\s*\(", flags=re.IGNORECASE)
+
+    position = 0
+    while True:
+        match = pattern.search(sql, position)
+        if match is None:
+            return sql
+
+        open_ix = match.end() - 1
+        close_ix = _matching_paren(sql, open_ix)
+        args = _split_args(_rewrite_calls(sql[open_ix + 1 : close_ix], function, rewrite))
+
+        replacement = rewrite(args)
+        sql = sql[: match.start()] + replacement + sql[close_ix + 1 :]
+        position = match.start() + len(replacement)
+
+
+def _rewrite_any(sql: str) -> str:
+    """x = ANY(list) -> list_contains(list, x)"""
+    pattern = re.compile(r"([\w.]+)\s*=\s*ANY\s*\(", flags=re.IGNORECASE)
+
+    while True:
+        match = pattern.search(sql)
+        if match is None:
+            return sql
+        open_ix = match.end() - 1
+        close_ix = _matching_paren(sql, open_ix)
+        array = sql[open_ix + 1 : close_ix]
+        sql = (
+            sql[: match.start()]
+            + f"list_contains({array}, {match.group(1)})"
+            + sql[close_ix + 1 :]
+        )
+
+
+def translate(sql: str) -> str:
+    """Translate a PostGIS catalog query into DuckDB-spatial SQL."""
+    # Comments go first, an apostrophe in one would throw off the parenthesis matching
+    sql = re.sub(r"--[^\n]*", "", sql).strip().rstrip(";")
+
+    sql = _rewrite_calls(
+        sql,
+        "ST_Union",
+        lambda args: f"ST_Union_Agg({args[0]})"
+        if len(args) == 1
+        else f"ST_Union({', '.join(args)})",
+    )
+    sql = _rewrite_calls(
+        sql,
+        "ST_Transform",
+        lambda args: f"ST_Transform({args[0]}, 'EPSG:4326', "
+        f"'EPSG:' || CAST({args[1]} AS VARCHAR), always_xy := true)",
+    )
+    sql = _rewrite_calls(sql, "ST_GeomFromWKB", lambda args: f"ST_GeomFromWKB({args[0]})")
+    sql = _rewrite_any(sql)
+    sql = re.sub(r"([\w.]+)\s*&&\s*([\w.]+)", r"ST_Intersects_Extent(\1, \2)", sql)
+
+    return BIND_PARAM_PATTERN.sub(r"$\1", sql)
+
+
+def _used_params(sql: str, params: Dict) -> Dict:
+    """DuckDB refuses named parameters the query does not use."""
+    names = set(re.findall(r"\$(\w+)", sql))
+    return {name: value for name, value in params.items() if name in names}
+
+
+class EmbeddedBackend(Backend):
+    """
+    Args:
+        path: The .duckdb file, created with the schema if it does not exist.
+        read_only: Open the file read only, allowing several processes to read it.
+    """
+
+    name = "embedded"
+
+    def __init__(self, path: Path = EMBEDDED_DB_PATH, read_only: bool = False):
+        self.path = Path(path)
+        self.read_only = read_only
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _get_connection(self):
+        with self._lock:
+            if self._connection is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._connection = duckdb.connect(str(self.path), read_only=self.read_only)
+                self._connection.execute("INSTALL spatial")
+                self._connection.execute("LOAD spatial")
+                if not self.read_only:
+                    for statement in SCHEMA:
+                        self._connection.execute(statement)
+            return self._connection
+
+    @contextmanager
+    def connect(self):
+        # A cursor is DuckDB's per-thread handle on the same database
+        cursor = self._get_connection().cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+
+    @contextmanager
+    def transaction(self):
+        with self.connect() as conn:
+            conn.begin()
+            try:
+                yield conn
+            except Exception:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def _geometry_select(self, conn, sql: str, params: Dict, geom_col: Optional[str]):
+        """
+        Wrap a query so geometry columns come out as WKB.
+
+        geom_col comes back as WKB for shapely, any other geometry column as hex WKB
+        like PostGIS returns to pd.read_sql.
+        """
+        relation = conn.sql(sql, params=params)
+        replacements = []
+        for column, column_type in zip(relation.columns, relation.types):
+            if str(column_type) != "GEOMETRY":
+                continue
+            if column == geom_col:
+                replacements.append(f'ST_AsWKB("{column}") AS "{column}"')
+            else:
+                replacements.append(f'ST_AsHEXWKB("{column}") AS "{column}"')
+
+        if not replacements:
+            return sql
+        return f"SELECT * REPLACE ({', '.join(replacements)}) FROM ({sql}) AS q"
+
+    def _to_frame(self, frame: pd.DataFrame, geom_col: Optional[str]) -> pd.DataFrame:
+        if geom_col is None:
+            return frame
+        wkb = np.array(
+            [None if value is None else bytes(value) for value in frame[geom_col]],
+            dtype=object,
+        )
+        frame[geom_col] = shapely.from_wkb(wkb)
+        return gpd.GeoDataFrame(frame, geometry=geom_col, crs="EPSG:4326")
+
+    def read_frame(self, conn, sql, params, geom_col=None):
+        sql = translate(sql)
+        params = _used_params(sql, params)
+        sql = self._geometry_select(conn, sql, params, geom_col)
+        return self._to_frame(conn.execute(sql, params).df(), geom_col)
+
+    def iter_frames(
+        self, conn, sql, params, chunksize, geom_col=None
+    ) -> Iterator[pd.DataFrame]:
+        sql = translate(sql)
+        params = _used_params(sql, params)
+        sql = self._geometry_select(conn, sql, params, geom_col)
+
+        conn.execute(sql, params)
+        vectors_per_chunk = max(1, chunksize // VECTOR_SIZE)
+        while True:
+            frame = conn.fetch_df_chunk(vectors_per_chunk)
+            if frame.shape[0] == 0:
+                return
+            yield self._to_frame(frame, geom_col)
+
+    def execute(self, conn, sql: str, params: Dict):
+        sql = translate(sql)
+        conn.execute(sql, _used_params(sql, params))
+
+    def commit(self, conn):
+        # Statements outside an explicit transaction are committed as they run
+        pass
+
+    def copy_frame(
+        self, conn, frame: pd.DataFrame, table_name: str, geom_cols: List[str]
+    ) -> int:
+        frame = pd.DataFrame(frame).copy()
+        for col in geom_cols:
+            geometries = frame[col].values
+            if not shapely.is_geometry(geometries).all():
+                # hex (E)WKB as read from PostGIS
+                geometries = shapely.from_wkb(geometries)
+            frame[col] = shapely.to_wkb(geometries)
+
+        columns = list(frame.columns)
+        select = ", ".join(
+            [f'ST_GeomFromWKB("{col}")' if col in geom_cols else f'"{col}"' for col in columns]
+        )
+
+        conn.register("copy_frame", frame)
+        try:
+            conn.execute(
+                "INSERT INTO {} ({}) SELECT {} FROM copy_frame".format(
+                    table_name, ", ".join(columns), select
+                )
+            )
+        finally:
+            conn.unregister("copy_frame")
+
+        return frame.shape[0]
+
+    def table_columns(self, table_name: str) -> List[str]:
+        with self.connect() as conn:
+            return [row[0] for row in conn.execute(f"DESCRIBE {table_name}").fetchall()]
+
+    def migrate(self, target: Optional[int] = None):
+        # The schema is created when the file is opened
+        self._get_connection()
+        return []
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
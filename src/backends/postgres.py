@@ -0,0 +1,97 @@
+"""
+PostGIS backend, either through the shared SSH tunnel (src/db_connection.py) or a
+plain SQLAlchemy engine for a local database given by a DSN.
+"""
+
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+import geopandas as gpd
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+from src.backends.base import Backend
+from src.bulk_loader import copy_geodataframe
+
+
+class PostgresBackend(Backend):
+    """
+    Args:
+        connection: A TunnelledEngine, or any object with a connect() method handing
+            out SQLAlchemy connections such as an Engine.
+    """
+
+    name = "postgres"
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._closed = False
+
+    @classmethod
+    def from_dsn(cls, dsn: str, **engine_kwargs) -> "PostgresBackend":
+        """Backend for a directly reachable database, e.g. a throwaway local PostGIS."""
+        return cls(create_engine(dsn, **engine_kwargs))
+
+    def connect(self):
+        return self.connection.connect()
+
+    @contextmanager
+    def transaction(self):
+        with self.connect() as conn, conn.begin():
+            yield conn
+
+    def read_frame(self, conn, sql, params, geom_col=None):
+        # The SQL text is the same on every call, so the driver prepares hot
+        # queries once per connection (see prepare_threshold in src/db_connection.py)
+        if geom_col is not None:
+            return gpd.GeoDataFrame.from_postgis(
+                text(sql), conn, geom_col=geom_col, params=params
+            )
+        return pd.read_sql(text(sql), conn, params=params)
+
+    def iter_frames(
+        self, conn, sql, params, chunksize, geom_col=None
+    ) -> Iterator[pd.DataFrame]:
+        # stream_results fetches through a server-side cursor
+        conn = conn.execution_options(stream_results=True, max_row_buffer=chunksize)
+        if geom_col is not None:
+            yield from gpd.GeoDataFrame.from_postgis(
+                text(sql), conn, geom_col=geom_col, params=params, chunksize=chunksize
+            )
+        else:
+            yield from pd.read_sql(text(sql), conn, params=params, chunksize=chunksize)
+
+    def execute(self, conn, sql: str, params: Dict):
+        conn.execute(text(sql), params)
+
+    def commit(self, conn):
+        conn.commit()
+
+    def copy_frame(
+        self, conn, frame: pd.DataFrame, table_name: str, geom_cols: List[str]
+    ) -> int:
+        # Rows are streamed through COPY, see src/bulk_loader.py
+        return copy_geodataframe(conn, frame, table_name, geom_cols=geom_cols)
+
+    def migrate(self, target: Optional[int] = None):
+        from src.migrations import migrate
+
+        with self.connect() as conn:
+            return migrate(conn, target=target)
+
+    def pool_stats(self) -> Dict:
+        if hasattr(self.connection, "pool_stats"):
+            return self.connection.pool_stats()
+        return {}
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if hasattr(self.connection, "release"):
+            # A TunnelledEngine is shared, the tunnel stays up for its other owners
+            self.connection.release()
+        elif hasattr(self.connection, "close"):
+            self.connection.close()
+        else:
+            self.connection.dispose()
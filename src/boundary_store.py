@@ -0,0 +1,140 @@
+"""
+Local store of the LSIB country boundaries.
+
+The boundary of a country is fetched from Earth Engine (USDOS/LSIB_SIMPLE/2017) the
+first time it is needed and kept as GeoParquet under BOUNDARY_DIR, one row per
+polygon part in the order Earth Engine returns them, so the part index is the
+polygon_index of the chip ids. Later runs read the parts, their bounding boxes and
+the grid cell sizes from disk without contacting Earth Engine.
+
+    python -m src.boundary_store Denmark Estonia            # fetch the missing ones
+    python -m src.boundary_store Denmark --refresh          # fetch again
+"""
+
+import argparse
+import os
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import ee
+import geopandas as gpd
+import numpy as np
+import shapely
+from shapely.geometry import shape
+
+from config import BOUNDARY_DIR
+from src.chip_grid import cell_size, polygon_boundaries
+from src.utils import authenticate_Google_Earth_Engine as authenticate
+
+LSIB_COLLECTION = "USDOS/LSIB_SIMPLE/2017"
+
+
+class BoundaryStore:
+    """
+    Args:
+        directory: Where the {country}.parquet files are kept.
+    """
+
+    def __init__(self, directory: Path = BOUNDARY_DIR):
+        self.directory = Path(directory)
+        self._parts: Dict[str, gpd.GeoDataFrame] = {}
+        self._authenticated = False
+
+    def path(self, country: str) -> Path:
+        return self.directory / f"{country}.parquet"
+
+    def __contains__(self, country: str) -> bool:
+        return self.path(country).exists()
+
+    def fetch(self, country: str) -> gpd.GeoDataFrame:
+        """Get a country's boundary from Earth Engine and store it."""
+        if not self._authenticated:
+            authenticate()
+            self._authenticated = True
+
+        lsib = ee.FeatureCollection(LSIB_COLLECTION)
+        geometry = lsib.filter(ee.Filter.eq("country_na", country)).geometry().getInfo()
+
+        parts = shapely.get_parts(shape(geometry))
+        if len(parts) == 0:
+            raise ValueError(f"{country} is not in {LSIB_COLLECTION}")
+
+        gdf = gpd.GeoDataFrame(
+            {"country": country, "polygon_index": np.arange(len(parts))},
+            geometry=parts,
+            crs="EPSG:4326",
+        )
+        bounds = shapely.bounds(parts)
+        gdf["minx"], gdf["miny"], gdf["maxx"], gdf["maxy"] = bounds.T
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path(country).with_suffix(".tmp")
+        gdf.to_parquet(tmp_path)
+        os.replace(tmp_path, self.path(country))
+
+        self._parts[country] = gdf
+        return gdf
+
+    def refresh(self, country: str) -> gpd.GeoDataFrame:
+        self._parts.pop(country, None)
+        return self.fetch(country)
+
+    def parts(self, country: str) -> gpd.GeoDataFrame:
+        """The polygon parts of a country with polygon_index and bounding box columns."""
+        if country not in self._parts:
+            if country in self:
+                self._parts[country] = gpd.read_parquet(self.path(country))
+            else:
+                print(f"Fetching the {country} boundary from {LSIB_COLLECTION}")
+                self.fetch(country)
+        return self._parts[country]
+
+    def coordinates(self, country: str) -> List:
+        """
+        The [lon, lat] rings of each part, like the coordinates of the LSIB geometry
+        get_country_LSIB_coordinates used to get from Earth Engine.
+        """
+        return [
+            [
+                [list(coord) for coord in ring.coords]
+                for ring in [polygon.exterior, *polygon.interiors]
+            ]
+            for polygon in self.parts(country).geometry
+        ]
+
+    def grid_params(
+        self, country: str, grid_size_meters: int = 10000
+    ) -> Tuple[List[Dict[str, float]], List[Tuple[float, float, float, float]]]:
+        """
+        The cell size and the boundaries of each part, as
+        DynamicWorldBasemap.get_sub_area_grid_params computes them.
+        """
+        cell_sizes, all_boundaries = [], []
+        for minx, miny, maxx, maxy in self.parts(country)[["minx", "miny", "maxx", "maxy"]].itertuples(
+            index=False
+        ):
+            # The corners of the bounding box have the extremes of the outer ring
+            boundaries = polygon_boundaries([[[(minx, miny), (maxx, maxy)]]])
+            all_boundaries.append(boundaries)
+            cell_sizes.append(cell_size(np.mean(boundaries[:2]), grid_size_meters))
+        return cell_sizes, all_boundaries
+
+    def outline(self, country: str) -> gpd.GeoDataFrame:
+        """The country as one dissolved geometry of the outer rings of its parts."""
+        exteriors = shapely.polygons(shapely.get_exterior_ring(self.parts(country).geometry.values))
+        return gpd.GeoDataFrame(geometry=exteriors, crs="EPSG:4326").dissolve()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch LSIB country boundaries to the local store")
+    parser.add_argument("countries", nargs="+")
+    parser.add_argument("--refresh", action="store_true", help="Fetch stored countries again")
+    args = parser.parse_args()
+
+    store = BoundaryStore()
+    for country in args.countries:
+        if args.refresh or country not in store:
+            parts = store.refresh(country)
+            print(f"{country}: {parts.shape[0]} parts stored in {store.path(country)}")
+        else:
+            print(f"{country} is already stored in {store.path(country)}")
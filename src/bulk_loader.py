@@ -0,0 +1,78 @@
+"""
+Bulk loading of (Geo)DataFrames into PostGIS through COPY ... FROM STDIN.
+
+GeoDataFrame.to_sql formats every geometry as WKT in Python and sends the rows as
+individual INSERTs. Here geometries are encoded to hex EWKB in one vectorized shapely
+call and the rows are streamed to the server in CSV blocks over a single COPY per block,
+which PostGIS parses straight into the geometry column.
+"""
+
+from io import StringIO
+from typing import List
+
+import numpy as np
+import pandas as pd
+import shapely
+
+
+def encode_geometries(geometries, srid: int = 4326) -> np.ndarray:
+    """
+    Encode shapely geometries as hex EWKB strings carrying the SRID.
+
+    Values that are already hex (E)WKB strings, as returned by pd.read_sql for a
+    geometry column, are passed through untouched.
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    is_geometry = shapely.is_geometry(geometries)
+
+    encoded = geometries.copy()
+    encoded[is_geometry] = shapely.to_wkb(
+        shapely.set_srid(geometries[is_geometry], srid), hex=True, include_srid=True
+    )
+    return encoded
+
+
+def copy_geodataframe(
+    conn,
+    frame: pd.DataFrame,
+    table_name: str,
+    geom_cols: List[str],
+    srid: int = 4326,
+    chunk_rows: int = 100_000,
+) -> int:
+    """
+    Append a frame to an existing table using COPY.
+
+    Args:
+        conn: SQLAlchemy connection using the psycopg (3) driver. The caller owns the
+            transaction (use conn.begin()).
+        frame: Rows to insert. Column names must match the table's column names.
+        table_name: Target table.
+        geom_cols: Columns holding shapely geometries.
+        srid: SRID written into the EWKB of every geometry.
+        chunk_rows: Number of rows encoded and sent per COPY block, bounding memory use.
+
+    Returns:
+        int: Number of rows copied.
+    """
+    columns = list(frame.columns)
+    copy_sql = "COPY {} ({}) FROM STDIN WITH (FORMAT csv)".format(
+        table_name, ", ".join(columns)
+    )
+
+    dbapi_connection = conn.connection.dbapi_connection
+
+    with dbapi_connection.cursor() as cursor:
+        for start in range(0, frame.shape[0], chunk_rows):
+            chunk = pd.DataFrame(frame.iloc[start : start + chunk_rows])
+
+            for col in geom_cols:
+                chunk[col] = encode_geometries(chunk[col].values, srid=srid)
+
+            buffer = StringIO()
+            chunk.to_csv(buffer, index=False, header=False)
+
+            with cursor.copy(copy_sql) as copy:
+                copy.write(buffer.getvalue())
+
+    return frame.shape[0]
@@ -0,0 +1,201 @@
+"""
+The chip grid of an area, computed locally with shapely.
+
+DynamicWorldBasemap.create_country_grid builds every grid cell as an ee.Geometry and
+asks Earth Engine for its intersection with the area, one round trip per cell. Here
+the cells of all sub-polygons are built as arrays of boxes and intersected with the
+sub-polygons in one pass over an STRtree, so Earth Engine is only needed to export
+the chips that are not empty.
+
+The grid is the same as create_country_grid's: each sub-polygon gets its own grid
+from its bounding box and cell size, and cells keep the
+{polygon_index}_{lon_idx}_{lat_idx} chip ids. Intersections are planar in longitude
+and latitude, while Earth Engine intersects geodesic edges with a 1 m max error, so
+cells that only graze the boundary can differ.
+"""
+
+import math
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import geopandas as gpd
+import numpy as np
+import shapely
+from pyproj import Geod
+from shapely.geometry import MultiPolygon, Polygon
+
+GRID_COLUMNS = ["chipid", "polygon_index", "lon_idx", "lat_idx", "geometry"]
+
+
+def polygon_boundaries(poly_list) -> Tuple[float, float, float, float]:
+    """
+    The bounding box of polygon coordinates, as DynamicWorldBasemap.get_polygon_boundaries.
+
+    :param poly_list: List of polygons, each a list of rings of [lon, lat] coordinates
+    :return: max_lat, min_lat, max_lon, min_lon
+    """
+    # The extremes start where get_polygon_boundaries starts them, so the grid origin
+    # and the chip ids stay the same
+    max_lon = 0
+    min_lon = 180
+    max_lat = 0
+    min_lat = 180
+
+    for poly in poly_list:
+        for sub_poly in poly:
+            for lon, lat in sub_poly:
+                max_lon = max(max_lon, lon)
+                min_lon = min(min_lon, lon)
+                max_lat = max(max_lat, lat)
+                min_lat = min(min_lat, lat)
+
+    return max_lat, min_lat, max_lon, min_lon
+
+
+def cell_size(country_lat: float, grid_size_meters: int = 10000) -> Dict[str, float]:
+    """Degrees of latitude and longitude of a grid_size_meters cell at a latitude."""
+    degrees_latitude = grid_size_meters / 111000
+    degrees_longitude = grid_size_meters / (111000 * math.cos(country_lat * (math.pi / 180)))
+    return {"lat": degrees_latitude, "lon": degrees_longitude}
+
+
+def chip_cell_boundary(
+    polygon_index: int,
+    lon_idx: int,
+    lat_idx: int,
+    cell_sizes: List[Dict[str, float]],
+    all_boundaries: List[Tuple[float, float, float, float]],
+) -> List[List[float]]:
+    """
+    The [lat, lon] ring of a chip's grid cell, as create_country_grid builds it with
+    create_chip_boundary.
+
+    :param cell_sizes: Cell size of each sub-polygon, see BoundaryStore.grid_params
+    :param all_boundaries: max_lat, min_lat, max_lon, min_lon of each sub-polygon
+    """
+    size = cell_sizes[polygon_index]
+    _, min_lat, _, min_lon = all_boundaries[polygon_index]
+    lon = min_lon + lon_idx * size["lon"]
+    lat = min_lat + lat_idx * size["lat"]
+    return [
+        [lat, lon],
+        [lat, lon + size["lon"]],
+        [lat + size["lat"], lon + size["lon"]],
+        [lat + size["lat"], lon],
+        [lat, lon],
+    ]
+
+
+def country_chip_grid(
+    coords: List,
+    grid_size_meters: int = 10000,
+    skip_polygons: Iterable[int] = (),
+) -> gpd.GeoDataFrame:
+    """
+    The non-empty chips of an area.
+
+    :param coords: The area's polygons, each a list of rings of [lon, lat] coordinates,
+        as get_country_LSIB_coordinates returns them
+    :param skip_polygons: Indices of sub-polygons to leave out, e.g. the finished ones
+    :return: GeoDataFrame of chipid, polygon_index, lon_idx, lat_idx and the chip's
+        ROI (its cell clipped to the sub-polygon), in the order create_country_grid
+        visits the cells
+    """
+    skip_polygons = set(skip_polygons)
+    # Only the outer ring of each polygon, as create_polygon builds them
+    polygons = np.array([Polygon(rings[0]) for rings in coords], dtype=object)
+
+    cells, cell_polygon, cell_lon, cell_lat = [], [], [], []
+    for polygon_index, rings in enumerate(coords):
+        if polygon_index in skip_polygons:
+            continue
+
+        max_lat, min_lat, max_lon, min_lon = polygon_boundaries([rings])
+        size = cell_size(np.mean([max_lat, min_lat]), grid_size_meters)
+
+        latitudes = math.ceil((max_lat - min_lat) / size["lat"])
+        longitudes = math.ceil((max_lon - min_lon) / size["lon"])
+
+        # Latitude in the outer loop, like create_country_grid
+        lat_idx, lon_idx = np.meshgrid(np.arange(latitudes), np.arange(longitudes), indexing="ij")
+        lat_idx, lon_idx = lat_idx.ravel(), lon_idx.ravel()
+        lon = min_lon + lon_idx * size["lon"]
+        lat = min_lat + lat_idx * size["lat"]
+
+        cells.append(shapely.box(lon, lat, lon + size["lon"], lat + size["lat"]))
+        cell_polygon.append(np.full(lat_idx.shape, polygon_index))
+        cell_lon.append(lon_idx)
+        cell_lat.append(lat_idx)
+
+    if not cells:
+        return gpd.GeoDataFrame(columns=GRID_COLUMNS, geometry="geometry", crs="EPSG:4326")
+
+    cells = np.concatenate(cells)
+    cell_polygon = np.concatenate(cell_polygon)
+    cell_lon = np.concatenate(cell_lon)
+    cell_lat = np.concatenate(cell_lat)
+
+    # Every cell is only intersected with its own sub-polygon
+    cell_ix, polygon_ix = shapely.STRtree(polygons).query(cells, predicate="intersects")
+    own = cell_polygon[cell_ix] == polygon_ix
+    cell_ix, polygon_ix = cell_ix[own], polygon_ix[own]
+    order = np.argsort(cell_ix, kind="stable")
+    cell_ix, polygon_ix = cell_ix[order], polygon_ix[order]
+
+    rois = _polygonal(shapely.intersection(cells[cell_ix], polygons[polygon_ix]))
+    keep = ~shapely.is_empty(rois)
+    cell_ix = cell_ix[keep]
+
+    return gpd.GeoDataFrame(
+        {
+            "chipid": [
+                f"{polygon_index}_{lon_idx}_{lat_idx}"
+                for polygon_index, lon_idx, lat_idx in zip(
+                    cell_polygon[cell_ix], cell_lon[cell_ix], cell_lat[cell_ix]
+                )
+            ],
+            "polygon_index": cell_polygon[cell_ix],
+            "lon_idx": cell_lon[cell_ix],
+            "lat_idx": cell_lat[cell_ix],
+        },
+        geometry=rois[keep],
+        crs="EPSG:4326",
+    )
+
+
+def _polygonal(geometries: np.ndarray) -> np.ndarray:
+    """
+    Only the polygons with area of each intersection, as Earth Engine keeps them.
+    Cells touching the boundary in a line or point become empty.
+    """
+    parts, index = shapely.get_parts(geometries, return_index=True)
+    is_polygon = (shapely.get_type_id(parts) == 3) & (shapely.area(parts) > 0)
+    parts, index = parts[is_polygon], index[is_polygon]
+
+    # get_parts keeps the order of the geometries, so each one's parts are a run
+    result = np.full(len(geometries), Polygon(), dtype=object)
+    indices, starts = np.unique(index, return_index=True)
+    for ix, own in zip(indices, np.split(parts, starts[1:])):
+        result[ix] = own[0] if len(own) == 1 else MultiPolygon(list(own))
+    return result
+
+
+def chip_parts(chipid: str, roi) -> List[Tuple[str, Polygon]]:
+    """
+    The ids and polygons exported for a chip, suffixed -a, -b, ... when its ROI has
+    more than one part, like get_DW_for_polygons names them.
+    """
+    if isinstance(roi, MultiPolygon):
+        return [(f"{chipid}-{chr(97 + number)}", part) for number, part in enumerate(roi.geoms)]
+    return [(chipid, roi)]
+
+
+def geodesic_area_km2(polygon) -> float:
+    return abs(Geod(ellps="WGS84").geometry_area_perimeter(polygon)[0]) / 10**6
+
+
+def polygon_coordinates(polygon: Polygon) -> List[List[Sequence[float]]]:
+    """The [lon, lat] rings of a polygon, for ee.Geometry.Polygon."""
+    return [
+        [list(coord) for coord in ring.coords]
+        for ring in [polygon.exterior, *polygon.interiors]
+    ]
@@ -0,0 +1,189 @@
+"""
+Rasterize the landcover polygons of a chip onto one grid for all years.
+
+The polygons of each year only cover the classified part of the chip, so their bounds
+differ from year to year. The grid is therefore fixed per chip up front from the
+chip's grid cell (grid_from_chip_id), which only depends on the chip id and the grid
+parameters of its area. Without them, the union of the bounds of all years snapped to
+whole pixels is used instead, which differs between chips and data. Every year is then rasterized straight
+into its slice of a preallocated (years, H, W) uint8 array, so the years line up pixel
+for pixel without writing, padding and re-reading GeoTIFFs. Class 0 is no data.
+
+Files are only written on request, with write_raster.
+"""
+
+import math
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import geopandas as gpd
+import numpy as np
+import rasterio
+from affine import Affine
+from pyproj import CRS
+from rasterio.features import rasterize
+from shapely.geometry import Polygon
+
+from src.chip_grid import chip_cell_boundary
+from src.data_handlers import chip_coordinates
+
+# Dynamic World pixels are 10 m
+PIXEL_SIZE = 10
+
+
+@dataclass
+class ChipGrid:
+    transform: Affine
+    shape: Tuple[int, int]  # (H, W)
+    crs: CRS
+
+    @property
+    def bounds(self) -> Tuple[float, float, float, float]:
+        height, width = self.shape
+        left, top = self.transform * (0, 0)
+        right, bottom = self.transform * (width, height)
+        return left, bottom, right, top
+
+
+def grid_from_bounds(bounds: Sequence[float], crs, pixel_size: float = PIXEL_SIZE) -> ChipGrid:
+    """
+    The grid of square pixels covering bounds, with edges on multiples of pixel_size.
+
+    :param bounds: (left, bottom, right, top) in crs
+    :param crs: A projected CRS in meters
+    """
+    left, bottom, right, top = bounds
+    left = math.floor(left / pixel_size) * pixel_size
+    top = math.ceil(top / pixel_size) * pixel_size
+    width = max(1, math.ceil((right - left) / pixel_size))
+    height = max(1, math.ceil((top - bottom) / pixel_size))
+
+    return ChipGrid(
+        transform=Affine(pixel_size, 0, left, 0, -pixel_size, top),
+        shape=(height, width),
+        crs=CRS.from_user_input(crs),
+    )
+
+
+def grid_from_chip_boundary(
+    boundary: List[List[float]], crs=None, pixel_size: float = PIXEL_SIZE
+) -> ChipGrid:
+    """
+    The grid of a chip's cell.
+
+    :param boundary: The [lat, lon] ring of DynamicWorldBasemap.create_chip_boundary
+    :param crs: CRS of the grid, defaults to the UTM zone of the cell
+    """
+    cell = gpd.GeoSeries([Polygon([(lon, lat) for lat, lon in boundary])], crs="EPSG:4326")
+    crs = cell.estimate_utm_crs() if crs is None else crs
+    return grid_from_bounds(cell.to_crs(crs).total_bounds, crs, pixel_size)
+
+
+def grid_from_chip_id(
+    chipid: str,
+    grid_params: Tuple[List[Dict[str, float]], List[Tuple[float, float, float, float]]],
+    pixel_size: float = PIXEL_SIZE,
+) -> ChipGrid:
+    """
+    The grid of a chip's cell, the same for every year and every run. Sub-polygon
+    chips (-a, -b, ...) get the grid of their whole cell.
+
+    :param grid_params: The cell sizes and boundaries of the sub-polygons of the
+        chip's area, as BoundaryStore.grid_params returns them
+    """
+    coordinates = chip_coordinates([chipid]).iloc[0]
+    if coordinates.isna()[["polygon_index", "lon_idx", "lat_idx"]].any():
+        raise ValueError(f"{chipid} is not a chip id")
+
+    boundary = chip_cell_boundary(
+        int(coordinates["polygon_index"]),
+        int(coordinates["lon_idx"]),
+        int(coordinates["lat_idx"]),
+        *grid_params,
+    )
+    return grid_from_chip_boundary(boundary, pixel_size=pixel_size)
+
+
+def grid_from_polygons(
+    landcover: Dict[int, gpd.GeoDataFrame], pixel_size: float = PIXEL_SIZE
+) -> ChipGrid:
+    """
+    The grid covering the polygons of every year.
+
+    Geographic coordinates are projected to one UTM zone for all years, estimated
+    from the first year with polygons.
+    """
+    frames = [gdf for gdf in landcover.values() if gdf.shape[0] > 0]
+    if not frames:
+        raise ValueError("The chip has no polygons in any year")
+
+    crs = frames[0].crs
+    if crs.is_geographic:
+        crs = frames[0].estimate_utm_crs()
+
+    bounds = np.array([gdf.to_crs(crs).total_bounds for gdf in frames])
+    combined = (
+        bounds[:, 0].min(),
+        bounds[:, 1].min(),
+        bounds[:, 2].max(),
+        bounds[:, 3].max(),
+    )
+    return grid_from_bounds(combined, crs, pixel_size)
+
+
+def rasterize_years(
+    landcover: Dict[int, gpd.GeoDataFrame],
+    years: List[int],
+    grid: Optional[ChipGrid] = None,
+    pixel_size: float = PIXEL_SIZE,
+    value_col: str = "category_id",
+) -> Tuple[np.ndarray, ChipGrid]:
+    """
+    Rasterize the landcover polygons of every year of a chip onto one grid.
+
+    :param landcover: year -> GeoDataFrame of polygons with a class column, a year
+        missing or without polygons is left as no data
+    :param grid: Grid to rasterize onto, e.g. grid_from_chip_id. Defaults to
+        grid_from_polygons
+    :param value_col: Column with the class of each polygon
+    :return: (len(years), H, W) uint8 array and its grid
+    """
+    if grid is None:
+        grid = grid_from_polygons(landcover, pixel_size)
+
+    cube = np.zeros((len(years),) + tuple(grid.shape), dtype=np.uint8)
+    for ix, year in enumerate(years):
+        gdf = landcover.get(year)
+        if gdf is None:
+            continue
+
+        gdf = gdf[gdf.geometry.notna() & gdf[value_col].notna()]
+        if gdf.shape[0] == 0:
+            continue
+
+        gdf = gdf.to_crs(grid.crs)
+        rasterize(
+            zip(gdf.geometry, gdf[value_col]),
+            out=cube[ix],
+            transform=grid.transform,
+            all_touched=True,
+        )
+
+    return cube, grid
+
+
+def write_raster(path, image: np.ndarray, grid: ChipGrid, nodata=None):
+    """Write a (H, W) array on its grid as a single band GeoTIFF."""
+    with rasterio.open(
+        path,
+        "w",
+        driver="GTiff",
+        height=grid.shape[0],
+        width=grid.shape[1],
+        count=1,
+        dtype=image.dtype,
+        crs=grid.crs,
+        transform=grid.transform,
+        nodata=nodata,
+    ) as dataset:
+        dataset.write(image, 1)
@@ -0,0 +1,146 @@
+"""
+Run a function over chips in worker processes, with a manifest for exact resume.
+
+The manifest is a JSON lines log of chip states, appended to by the parent process
+only: a chip is in_progress when it is handed to a worker, then done or failed. The
+last line of a chip is its state, so a crashed run leaves its unfinished chips
+in_progress and they are run again, while done chips are skipped.
+
+Workers write their own per-chip outputs, nothing is shared between them. Used by
+scripts/change_sequences.py.
+"""
+
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from tqdm import tqdm
+
+IN_PROGRESS = "in_progress"
+DONE = "done"
+FAILED = "failed"
+
+
+class ChipManifest:
+    """
+    Args:
+        path: The JSON lines file, replayed if it exists.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.states: Dict[str, dict] = {}
+        if self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.states[entry["chip"]] = entry
+
+    def __len__(self):
+        return len(self.states)
+
+    def state(self, chip: str) -> Optional[str]:
+        entry = self.states.get(chip)
+        return entry["state"] if entry is not None else None
+
+    def chips(self, state: str) -> List[str]:
+        return [chip for chip, entry in self.states.items() if entry["state"] == state]
+
+    def mark(self, chips: Iterable[str], state: str, error: Optional[Exception] = None):
+        """Record the state of chips, one flushed line each."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a") as f:
+            for chip in chips:
+                entry = {
+                    "chip": chip,
+                    "state": state,
+                    "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                }
+                if error is not None:
+                    entry["error"] = repr(error)
+                self.states[chip] = entry
+                f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def pending(self, chips: Iterable[str], retry_failed: bool = True) -> List[str]:
+        """The chips still to run: not done, and not failed unless retry_failed."""
+        skip = {DONE} if retry_failed else {DONE, FAILED}
+        return [chip for chip in chips if self.state(chip) not in skip]
+
+
+def run_chips(
+    chips: Iterable[str],
+    process: Callable[[str], object],
+    manifest: ChipManifest,
+    workers: Optional[int] = None,
+    initializer: Optional[Callable] = None,
+    initargs: Tuple = (),
+    retry_failed: bool = True,
+) -> Tuple[List[str], Dict[str, Exception]]:
+    """
+    Run process(chip) for the pending chips in a process pool.
+
+    Args:
+        chips: All chips of the run, the manifest decides which are still pending.
+        process: Module-level function of one chip id, run in the workers. A chip
+            is done when it returns and failed when it raises.
+        manifest: Where the chip states are recorded.
+        workers: Worker processes, defaults to the number of CPUs.
+        initializer: Run once in each worker, e.g. to open a database connection.
+        initargs: Arguments of initializer.
+        retry_failed: Run the chips that failed in an earlier run again.
+
+    Returns:
+        The chips done in this run, and the errors of the chips that failed.
+    """
+    pending = manifest.pending(chips, retry_failed=retry_failed)
+    workers = workers or os.cpu_count() or 1
+    print(f"{len(pending)} CHIPS TO RUN ON {workers} WORKERS")
+
+    done, failed = [], {}
+    if not pending:
+        return done, failed
+
+    # Only a few chips per worker are handed out ahead, so in_progress stays accurate
+    max_in_flight = 2 * workers
+    queue = iter(pending)
+    in_flight = {}
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=initializer, initargs=initargs
+    ) as executor, tqdm(total=len(pending), desc="Chips") as progress:
+
+        def submit(n):
+            chips = [chip for _, chip in zip(range(n), queue)]
+            manifest.mark(chips, IN_PROGRESS)
+            for chip in chips:
+                in_flight[executor.submit(process, chip)] = chip
+
+        try:
+            submit(max_in_flight)
+            while in_flight:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    chip = in_flight.pop(future)
+                    try:
+                        future.result()
+                    except Exception as e:
+                        print(f"Chip {chip} failed. Error: {e}")
+                        manifest.mark([chip], FAILED, error=e)
+                        failed[chip] = e
+                    else:
+                        manifest.mark([chip], DONE)
+                        done.append(chip)
+                    progress.update(1)
+                submit(len(finished))
+        except KeyboardInterrupt:
+            # The chips still in flight stay in_progress and run again on resume
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    return done, failed
@@ -0,0 +1,245 @@
+"""
+Per-chip multi-year Dynamic World rasters, kept after ingestion.
+
+Each area has a Zarr store (CUBE_STORE_DIR/{area}.zarr) holding one uint8 array of
+shape (years, H, W) per chip, with its affine transform and CRS as attributes. An
+array is a single chunk, so a chip's full history is one contiguous read and one
+decompression. With compress=False the chunk is the raw C-ordered array on disk and
+read(chipid, mmap=True) memory-maps it.
+
+The stores are written by the ingestion pipeline (src/ingestion.py) as the GeoTIFFs
+are downloaded, or backfilled from a directory of exports:
+
+    python -m src.cube_store data/DW/Denmark/Raster --area Denmark
+
+Pixel analyses (raster_change, change sequences, area statistics) can then read the
+cubes instead of the database. Class 0 is no data, like in polygonize.
+"""
+
+import argparse
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import zarr
+from affine import Affine
+from numcodecs import Blosc
+from rasterio.crs import CRS
+from tqdm import tqdm
+
+from config import CUBE_STORE_DIR, CUBE_YEARS
+from src.raster_change import index_rasters, read_raster_years
+
+
+@dataclass
+class Cube:
+    data: np.ndarray  # (years, H, W) uint8
+    transform: Affine
+    crs: CRS
+    years: List[int]
+    years_written: List[int]
+
+    def year(self, year: int) -> np.ndarray:
+        return self.data[self.years.index(year)]
+
+
+class CubeStore:
+    """
+    Args:
+        area: Area of the chips, names the store.
+        path: The .zarr directory, defaults to CUBE_STORE_DIR/{area}.zarr.
+        years: Years along the first axis, fixed when the store is created.
+        compress: Compress new chips with Blosc zstd. Uncompressed chips can be
+            memory-mapped.
+        mode: "a" to read and write, "r" to read only.
+
+    Only one process should write to a store at a time.
+    """
+
+    def __init__(
+        self,
+        area: str,
+        path: Optional[Path] = None,
+        years: List[int] = CUBE_YEARS,
+        compress: bool = True,
+        mode: str = "a",
+    ):
+        self.area = area
+        self.path = Path(path) if path is not None else CUBE_STORE_DIR / f"{area}.zarr"
+        self.compress = compress
+        self.group = zarr.open_group(str(self.path), mode=mode)
+
+        if "years" not in self.group.attrs and mode != "r":
+            self.group.attrs.update({"area": area, "years": list(years)})
+        self.years = list(self.group.attrs.get("years", years))
+
+    def __contains__(self, chipid: str) -> bool:
+        return chipid in self.group
+
+    def __len__(self) -> int:
+        return len(list(self.group.array_keys()))
+
+    def keys(self) -> Iterator[str]:
+        return self.group.array_keys()
+
+    def _create(self, chipid: str, shape: Tuple[int, int], transform, crs):
+        array = self.group.create_dataset(
+            chipid,
+            shape=(len(self.years),) + tuple(shape),
+            chunks=(len(self.years),) + tuple(shape),
+            dtype="u1",
+            fill_value=0,
+            compressor=Blosc(cname="zstd", clevel=5, shuffle=Blosc.BITSHUFFLE)
+            if self.compress
+            else None,
+        )
+        array.attrs.update(
+            {
+                "transform": list(transform)[:6],
+                "crs": CRS.from_user_input(crs).to_string(),
+                "years_written": [],
+            }
+        )
+        return array
+
+    def write_chip(self, chipid: str, years: Dict[int, Tuple[np.ndarray, Affine, CRS]]):
+        """
+        Write some years of a chip, keeping the years already stored.
+
+        :param years: year -> (image, transform, crs), no data as 0
+        """
+        first_image, transform, crs = next(iter(years.values()))
+
+        if chipid in self.group:
+            array = self.group[chipid]
+            if array.shape[1:] != first_image.shape or not Affine(
+                *array.attrs["transform"]
+            ).almost_equals(transform):
+                raise ValueError(f"Chip {chipid} does not match its stored grid")
+        else:
+            array = self._create(chipid, first_image.shape, transform, crs)
+
+        # The chip is one chunk, so it is read and written whole once
+        cube = array[:]
+        for year, (image, _, _) in years.items():
+            if image.shape != cube.shape[1:]:
+                raise ValueError(f"The {year} raster of chip {chipid} has another shape")
+            cube[self.years.index(year)] = image
+        array[:] = cube
+
+        array.attrs["years_written"] = sorted(
+            set(array.attrs["years_written"]) | set(years.keys())
+        )
+
+    def write_rasters(
+        self, rasters: Dict[str, Union[bytes, Path]]
+    ) -> Tuple[int, Dict[str, Exception]]:
+        """
+        Write Drive exports, e.g. a batch of the ingestion pipeline.
+
+        A file that cannot be read or written only fails itself and the other files of
+        its chip, and years outside the store's years are skipped.
+
+        :param rasters: Filename ({chipid}_{year}... or {chipid}_years_{years}...) ->
+            GeoTIFF bytes or path
+        :return: Number of chips written, and the error of each file that failed
+        """
+        chips = defaultdict(dict)
+        chip_files = defaultdict(list)
+        errors = {}
+        for filename, raster in rasters.items():
+            try:
+                chipid, years = read_raster_years(filename, raster)
+            except Exception as e:
+                errors[filename] = e
+                continue
+
+            skipped = sorted(set(years) - set(self.years))
+            if skipped:
+                print(f"Skipping {skipped} of {filename}, the {self.area} cubes hold {self.years}")
+            for year, (image, valid, transform, crs) in years.items():
+                if year in self.years:
+                    image[~valid] = 0
+                    chips[chipid][year] = (image, transform, crs)
+            chip_files[chipid].append(filename)
+
+        written = 0
+        for chipid, years in chips.items():
+            try:
+                self.write_chip(chipid, years)
+                written += 1
+            except Exception as e:
+                for filename in chip_files[chipid]:
+                    errors[filename] = e
+        return written, errors
+
+    def write_directory(self, raster_dir: Path) -> Dict[str, Exception]:
+        """Backfill the store from a directory of exports, returning the failed files."""
+        errors = {}
+        for chipid, years in tqdm(
+            index_rasters(raster_dir).items(), desc=f"Writing {self.area} cubes"
+        ):
+            # The years of a multi-year export are bands of one file
+            paths = {Path(getattr(raster, "path", raster)) for raster in years.values()}
+            _, chip_errors = self.write_rasters({path.name: path for path in paths})
+            errors.update(chip_errors)
+
+        for filename, error in errors.items():
+            print(f"Could not write {filename}. Error: {error}")
+        return errors
+
+    def read(self, chipid: str, mmap: bool = False) -> Cube:
+        """
+        A chip's cube.
+
+        :param mmap: Memory-map the data instead of reading it, for uncompressed chips
+        """
+        array = self.group[chipid]
+
+        if mmap:
+            if array.compressor is not None:
+                raise ValueError(f"Chip {chipid} is compressed and cannot be memory-mapped")
+            chunk_path = self.path / chipid / ".".join(["0"] * array.ndim)
+            if chunk_path.exists():
+                data = np.memmap(chunk_path, dtype=np.uint8, mode="r", shape=array.shape)
+            else:
+                data = np.zeros(array.shape, dtype=np.uint8)
+        else:
+            data = array[:]
+
+        return Cube(
+            data=data,
+            transform=Affine(*array.attrs["transform"]),
+            crs=CRS.from_user_input(array.attrs["crs"]),
+            years=self.years,
+            years_written=list(array.attrs["years_written"]),
+        )
+
+    def get(self, chipid: str, default=None):
+        """
+        year -> (image, transform, crs) of the written years of a chip, the shape
+        raster_change.land_use_change_from_rasters takes.
+        """
+        if chipid not in self.group:
+            return default
+        cube = self.read(chipid, mmap=self.group[chipid].compressor is None)
+        return {
+            year: (cube.year(year), cube.transform, cube.crs) for year in cube.years_written
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Backfill a cube store from a directory of Dynamic World GeoTIFFs"
+    )
+    parser.add_argument("raster_dir", type=Path)
+    parser.add_argument("--area", default="Denmark")
+    parser.add_argument("--path", type=Path, default=None)
+    parser.add_argument("--no-compress", action="store_true")
+    args = parser.parse_args()
+
+    CubeStore(args.area, path=args.path, compress=not args.no_compress).write_directory(
+        args.raster_dir
+    )
@@ -2,18 +2,23 @@ import math
 import os
 import warnings
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from typing import Tuple
 
 import geopandas as gpd
+import numpy as np
 import pandas as pd
 import rasterio
-from pyproj import Proj, transform
+import shapely
+from geopandas.array import GeometryArray
+from pyproj import CRS, Proj, Transformer, transform
 from rasterio.features import shapes
 from rasterio.io import MemoryFile
-from shapely.geometry import Point, Polygon, shape
+from shapely.geometry import Point, Polygon
 from tqdm import tqdm
 
-from config import DATA_DIR
+from config import DATA_DIR, EPSG_MAPPING
+from src.raster_change import STACK_NAME_PATTERN, raster_years
 
 warnings.filterwarnings("ignore", category=FutureWarning)
 
@@ -256,6 +261,65 @@ def prepare_polygons_for_DB(
     return db_ready_frame
 
 
+# Chip IDs are "{polygon_index}_{lon_idx}_{lat_idx}", with a "-a", "-b", ... suffix when
+# the chip's intersection with the country consists of several sub-polygons
+CHIPID_PATTERN = r"^(?P<polygon_index>\d+)_(?P<lon_idx>\d+)_(?P<lat_idx>\d+)(?:-(?P<sub_part>[a-z]))?$"
+
+
+def chip_coordinates(chipids) -> pd.DataFrame:
+    """
+    Split chip IDs into integer polygon_index, lon_idx, lat_idx and sub_part columns.
+
+    sub_part is 0 for "-a", 1 for "-b" and so on, and missing for chips without a suffix.
+    """
+    parts = pd.Series(np.asarray(chipids, dtype=str)).str.extract(CHIPID_PATTERN)
+
+    coordinates = parts[["polygon_index", "lon_idx", "lat_idx"]].astype("Int32")
+    coordinates["sub_part"] = (
+        parts["sub_part"].map({chr(97 + i): i for i in range(26)}).astype("Int32")
+    )
+
+    return coordinates
+
+
+def add_chip_coordinates(gdf):
+    """Add the integer chip coordinate columns of chip_coordinates to a frame with a chipid column."""
+    coordinates = chip_coordinates(gdf["chipid"].values)
+    for col in coordinates.columns:
+        gdf[col] = coordinates[col].values
+
+    return gdf
+
+
+def calculate_area_km2(gdf, geom_col="geometry", area_col="area") -> pd.Series:
+    """
+    Area of every row in km2, measured in the equal-area CRS of its country.
+
+    Geometries are expected in EPSG:4326 and may be shapely objects or hex (E)WKB
+    strings as returned by pd.read_sql. Each country is reprojected in one
+    vectorized pass using its CRS from EPSG_MAPPING, falling back to the global
+    equal-area CRS for countries without one.
+    """
+    geometries = gdf[geom_col].values
+    if not isinstance(geometries, GeometryArray):
+        # A copy, the values of a copy-on-write frame are read only
+        geometries = np.array(geometries, dtype=object)
+        is_encoded = ~shapely.is_geometry(geometries)
+        geometries[is_encoded] = shapely.from_wkb(geometries[is_encoded])
+
+    geometries = gpd.GeoSeries(geometries, crs="EPSG:4326")
+    areas = gdf[area_col].values
+
+    # Positional indexing, since concatenated frames often carry duplicate labels
+    area_km2 = np.full(gdf.shape[0], np.nan)
+    for area in pd.unique(areas):
+        rows = np.flatnonzero(areas == area)
+        epsg = EPSG_MAPPING.get(area, EPSG_MAPPING["World"])
+        area_km2[rows] = geometries.iloc[rows].to_crs(epsg=epsg).area.values / 10**6
+
+    return pd.Series(area_km2, index=gdf.index)
+
+
 def get_area_of_raster_tif(src, image):
     # Determine the no-data value from the metadata (if it exists)
     no_data_value = src.nodata
@@ -286,56 +350,223 @@ def binary2tif(tif_bytes):
     return band1, transform, src
 
 
+def trace_polygons(
+    image: np.ndarray,
+    transform,
+    crs,
+    dst_crs="EPSG:4326",
+    nodata: int = 0,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Trace the connected patches of each class in a landcover raster as ragged arrays.
+
+    Returns:
+        coords: (N, 2) float64 vertex coordinates in dst_crs.
+        ring_offsets: Start of each ring in coords, plus the total.
+        polygon_offsets: Start of each polygon in the rings, plus the total.
+        landcover: uint8 class of each polygon.
+    """
+    # The dtypes rasterio can trace
+    if image.dtype not in [np.uint8, np.uint16, np.int16, np.int32, np.float32]:
+        image = image.astype(np.int32)
+    mask = image != nodata
+
+    coords = []
+    ring_offsets = [0]
+    polygon_offsets = [0]
+    values = []
+    for geom, value in shapes(image, mask=mask, transform=transform):
+        for ring in geom["coordinates"]:
+            coords.extend(ring)
+            ring_offsets.append(ring_offsets[-1] + len(ring))
+        polygon_offsets.append(polygon_offsets[-1] + len(geom["coordinates"]))
+        values.append(value)
+
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+
+    if crs is not None and dst_crs is not None:
+        if CRS.from_user_input(crs) != CRS.from_user_input(dst_crs):
+            transformer = Transformer.from_crs(crs, dst_crs, always_xy=True)
+            x, y = transformer.transform(coords[:, 0], coords[:, 1])
+            coords = np.column_stack([x, y])
+
+    return (
+        coords,
+        np.asarray(ring_offsets, dtype=np.int64),
+        np.asarray(polygon_offsets, dtype=np.int64),
+        np.asarray(values).astype(np.uint8),
+    )
+
+
+def polygons_from_ragged(coords, ring_offsets, polygon_offsets) -> np.ndarray:
+    return shapely.from_ragged_array(
+        shapely.GeometryType.POLYGON, coords, (ring_offsets, polygon_offsets)
+    )
+
+
+def polygonize(
+    image: np.ndarray,
+    transform,
+    crs,
+    dst_crs="EPSG:4326",
+    nodata: int = 0,
+) -> gpd.GeoDataFrame:
+    """
+    Convert a landcover raster to one polygon per connected patch of a class.
+
+    rasterio traces the patches. Their rings are collected as flat coordinate arrays,
+    reprojected in a single vectorized pyproj call and built into polygons with one
+    shapely.from_ragged_array call, instead of a shapely.geometry.shape and a to_crs
+    per polygon.
+
+    Args:
+        image: 2D array of landcover classes.
+        transform: Affine transform of the raster.
+        crs: CRS of the raster.
+        dst_crs: CRS of the returned polygons.
+        nodata: Pixel value that is not polygonized.
+
+    Returns:
+        gpd.GeoDataFrame: A uint8 landcover column and the polygons.
+    """
+    coords, ring_offsets, polygon_offsets, landcover = trace_polygons(
+        image, transform, crs, dst_crs=dst_crs, nodata=nodata
+    )
+
+    return gpd.GeoDataFrame(
+        {"landcover": landcover},
+        geometry=polygons_from_ragged(coords, ring_offsets, polygon_offsets),
+        crs=dst_crs if dst_crs is not None else crs,
+    )
+
+
 def rasterfile2geo(filecontents):
     image, transform, src = binary2tif(filecontents)
 
-    raster_area = get_area_of_raster_tif(src, image)
+    return polygonize(image, transform, src.crs)
 
-    # Step 3: Convert raster to vector
-    mask = image != 0  # Assuming 0 is the value for no data
-    vector_shapes = shapes(image, mask=mask, transform=transform)
 
-    # Step 4: Create GeoDataFrame
-    polygons = []
-    values = []  # Store landcover values here
-    for geom, value in vector_shapes:
-        polygons.append(shape(geom))
-        values.append(value)
+def trace_rasterfile(filecontents):
+    """Process pool worker: plain arrays pickle far cheaper than shapely objects."""
+    image, transform, src = binary2tif(filecontents)
 
-    gdf = gpd.GeoDataFrame({"landcover": values, "geometry": polygons})
-    gdf["landcover"] = gdf["landcover"].astype(int)
-    # Optional: Set the CRS (Coordinate Reference System) to match the input raster
-    gdf.crs = src.crs
-    gdf = gdf.to_crs(epsg=4326)
+    return trace_polygons(image, transform, src.crs)
 
-    return gdf
 
+def trace_raster_years(filename, filecontents):
+    """
+    Process pool worker: trace_rasterfile for each year of a Drive export.
 
-def raster_dict2geo(file_contents, area="Denmark", test=False):
-    frames = defaultdict(dict)
+    A multi-year export ({chipid}_years_{year}-{year}-...) has one band per year,
+    each is traced on its own and named {chipid}_{year} like a single year export.
 
-    for filename, file_contents in tqdm(
-        file_contents.items(), desc="Converting rasterfiles to polygons..."
-    ):
-        chip_id = "_".join(filename.split("_")[0:3])
-        year = filename.split("_")[3]
-        frames[chip_id][year] = dict()
-        frames[chip_id][year]["GeoFrame"] = rasterfile2geo(file_contents)
+    :return: List of (filename, trace_rasterfile result), one per year
+    """
+    if STACK_NAME_PATTERN.match(os.path.basename(filename)) is None:
+        return [(filename, trace_rasterfile(filecontents))]
 
-        frames[chip_id][year]["GeoFrame"]["year"] = year
-        frames[chip_id][year]["GeoFrame"]["area"] = area
-        frames[chip_id][year]["GeoFrame"]["chipid"] = chip_id
-        frames[chip_id][year]["GeoFrame"]["data_origins"] = "DynamicWorld"
+    chipid, years = raster_years(filename)
+    with MemoryFile(filecontents) as memfile, memfile.open() as src:
+        if src.count != len(years):
+            raise ValueError(f"{filename} has {src.count} bands for {len(years)} years")
+        return [
+            (f"{chipid}_{year}", trace_polygons(src.read(band), src.transform, src.crs))
+            for band, year in enumerate(years, start=1)
+        ]
 
-    concatted_frames = pd.concat(
-        [
-            value_inner["GeoFrame"]
-            for value_outer in frames.values()
-            for value_inner in value_outer.values()
+
+def raster_dict2geo(file_contents, area="Denmark", test=False, workers=None):
+    """
+    Convert downloaded Dynamic World GeoTIFFs to one GeoDataFrame.
+
+    :param file_contents: Dict of filename ({chipid}_{year}... or multi-year
+        {chipid}_years_{year}-{year}-...) to GeoTIFF bytes
+    :param area: Area the chips belong to
+    :param workers: Number of processes converting files in parallel, defaults to
+        the number of CPUs. 1 converts in this process.
+    :return: GeoDataFrame with landcover, geometry, year, area, chipid and data_origins
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    filenames = list(file_contents.keys())
+    contents = [file_contents[filename] for filename in filenames]
+
+    if workers > 1 and len(contents) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(contents))) as executor:
+            per_file = list(
+                tqdm(
+                    executor.map(trace_raster_years, filenames, contents),
+                    total=len(contents),
+                    desc="Converting rasterfiles to polygons...",
+                )
+            )
+    else:
+        per_file = [
+            trace_raster_years(filename, content)
+            for filename, content in tqdm(
+                zip(filenames, contents),
+                total=len(contents),
+                desc="Converting rasterfiles to polygons...",
+            )
         ]
+
+    # The bands of multi-year exports become files of their own years
+    year_files = [year_file for years in per_file for year_file in years]
+    return traced2geo(
+        [filename for filename, _ in year_files],
+        [traced for _, traced in year_files],
+        area=area,
+    )
+
+
+def traced2geo(filenames, traced, area="Denmark") -> gpd.GeoDataFrame:
+    """
+    Build the GeoDataFrame of raster_dict2geo from the trace_rasterfile output per file.
+
+    :param filenames: Filenames ({chipid}_{year}...) in the same order as traced
+    :param traced: trace_rasterfile results
+    :param area: Area the chips belong to, or a list with the area of each file
+    """
+    if not traced:
+        return gpd.GeoDataFrame(
+            columns=["landcover", "geometry", "year", "area", "chipid", "data_origins"],
+            geometry="geometry",
+            crs="EPSG:4326",
+        )
+
+    # Stitch the ragged arrays of all files together and build every polygon at once
+    coords, ring_offsets, polygon_offsets, landcover = zip(*traced)
+    ring_shift = np.cumsum([0] + [part.shape[0] for part in coords[:-1]])
+    polygon_shift = np.cumsum([0] + [len(offsets) - 1 for offsets in ring_offsets[:-1]])
+
+    polygons = polygons_from_ragged(
+        np.concatenate(coords),
+        np.concatenate(
+            [[0]] + [offsets[1:] + shift for offsets, shift in zip(ring_offsets, ring_shift)]
+        ),
+        np.concatenate(
+            [[0]]
+            + [offsets[1:] + shift for offsets, shift in zip(polygon_offsets, polygon_shift)]
+        ),
     )
 
-    return concatted_frames
+    polygons_per_file = [values.shape[0] for values in landcover]
+    chip_ids = ["_".join(filename.split("_")[0:3]) for filename in filenames]
+    years = [filename.split("_")[3] for filename in filenames]
+
+    return gpd.GeoDataFrame(
+        {
+            "landcover": np.concatenate(landcover),
+            "geometry": polygons,
+            "year": np.repeat(years, polygons_per_file),
+            "area": area if isinstance(area, str) else np.repeat(area, polygons_per_file),
+            "chipid": np.repeat(chip_ids, polygons_per_file),
+            "data_origins": "DynamicWorld",
+        },
+        geometry="geometry",
+        crs="EPSG:4326",
+    )
 
 
 def read_all_tifs2geo(path, year="", area="Denmark", test=False):
@@ -420,26 +651,7 @@ def raster2geo(data_dir: str, file: str):
         image = src.read(1)  # Read the first band
         transform = src.transform
 
-    raster_area = get_area_of_raster_tif(src, image)
-
-    # Step 3: Convert raster to vector
-    mask = image != 0  # Assuming 0 is the value for no data
-    vector_shapes = shapes(image, mask=mask, transform=transform)
-
-    # Step 4: Create GeoDataFrame
-    polygons = []
-    values = []  # Store landcover values here
-    for geom, value in vector_shapes:
-        polygons.append(shape(geom))
-        values.append(value)
-
-    gdf = gpd.GeoDataFrame({"landcover": values, "geometry": polygons})
-    gdf["landcover"] = gdf["landcover"].astype(int)
-    # Optional: Set the CRS (Coordinate Reference System) to match the input raster
-    gdf.crs = src.crs
-    gdf = gdf.to_crs(epsg=4326)
-
-    return gdf
+    return polygonize(image, transform, src.crs)
 
 
 def geo_overlay(base_layer, overlay):
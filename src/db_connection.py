@@ -0,0 +1,243 @@
+"""
+Long-lived SSH tunnel and pooled SQLAlchemy engine shared by every DBMS instance.
+
+Opening the tunnel and connecting to Postgres is the expensive part of every query,
+so a single TunnelledEngine is kept per (ssh host, user, database) for the lifetime of
+the process. It restarts the tunnel when it drops, hands out pooled connections and
+keeps counters that can be used to size the pool. Every DBMS holding the engine is an
+owner, and the tunnel is only stopped when the last owner releases it, or when the
+process exits.
+
+Connections use psycopg 3, which turns a query into a server-side prepared statement
+once the same SQL has been executed prepare_threshold times on a connection. Since
+the catalog queries use bind parameters, the chip-by-chip loops are parsed and
+planned once per pooled connection instead of once per call.
+"""
+
+import atexit
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Dict, Tuple
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
+from sshtunnel import SSHTunnelForwarder
+
+
+@dataclass
+class PoolStats:
+    checkouts: int = 0  # connections handed out by the pool
+    waits: int = 0  # checkouts requested while every pooled connection was busy
+    wait_seconds: float = 0.0  # time spent blocked in those checkouts
+    connects: int = 0  # new DBAPI connections opened against Postgres
+    reconnects: int = 0  # times the tunnel was found down and restarted
+
+
+class TunnelledEngine:
+    """An SSH tunnel plus a bounded SQLAlchemy connection pool on top of it."""
+
+    def __init__(
+        self,
+        ssh_address: Tuple[str, int],
+        ssh_username: str,
+        ssh_pkey: str,
+        remote_bind_address: Tuple[str, int],
+        username: str,
+        password: str,
+        db_name: str,
+        pool_size: int = 4,
+        max_overflow: int = 4,
+        pool_timeout: int = 60,
+        pool_recycle: int = 1800,
+        prepare_threshold: int = 2,
+    ):
+        self.ssh_address = ssh_address
+        self.ssh_username = ssh_username
+        self.ssh_pkey = ssh_pkey
+        self.remote_bind_address = remote_bind_address
+        self.username = username
+        self.password = password
+        self.db_name = db_name
+
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_timeout = pool_timeout
+        self.pool_recycle = pool_recycle
+        self.prepare_threshold = prepare_threshold
+
+        self.stats = PoolStats()
+
+        self._lock = threading.RLock()
+        self._server = None
+        self._engine = None
+        self._local_port = None
+        self._pid = os.getpid()
+        # DBMS instances holding the engine, see acquire and release
+        self._owners = 0
+
+        atexit.register(self.close)
+
+    def acquire(self) -> "TunnelledEngine":
+        with self._lock:
+            self._owners += 1
+        return self
+
+    def release(self):
+        """Give up one owner's hold, closing the engine when no owner is left."""
+        with self._lock:
+            self._owners = max(self._owners - 1, 0)
+            if self._owners == 0:
+                self.close()
+
+    def _reset_after_fork(self):
+        """A forked child must not reuse the parent's tunnel thread or sockets."""
+        if self._engine is not None:
+            self._engine.dispose(close=False)
+        self._server = None
+        self._engine = None
+        self._local_port = None
+        self.stats = PoolStats()
+        self._owners = 0
+        self._pid = os.getpid()
+
+    def _tunnel_is_up(self) -> bool:
+        return self._server is not None and self._server.is_active
+
+    def _start_tunnel(self):
+        if self._server is None:
+            self._server = SSHTunnelForwarder(
+                self.ssh_address,
+                ssh_username=self.ssh_username,
+                ssh_pkey=self.ssh_pkey,
+                remote_bind_address=self.remote_bind_address,
+                set_keepalive=30,
+            )
+            self._server.start()
+        else:
+            # The tunnel existed but has dropped
+            self.stats.reconnects += 1
+            self._server.restart()
+
+    def _create_engine(self):
+        if self._engine is not None:
+            self._engine.dispose()
+
+        self._local_port = self._server.local_bind_port
+        self._engine = create_engine(
+            "postgresql+psycopg://{}:{}@{}:{}/{}".format(
+                self.username, self.password, "127.0.0.1", self._local_port, self.db_name
+            ),
+            pool_size=self.pool_size,
+            max_overflow=self.max_overflow,
+            pool_timeout=self.pool_timeout,
+            pool_recycle=self.pool_recycle,
+            pool_pre_ping=True,
+            connect_args={"prepare_threshold": self.prepare_threshold},
+        )
+
+        event.listen(self._engine, "checkout", self._on_checkout)
+        event.listen(self._engine, "connect", self._on_connect)
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.stats.checkouts += 1
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        self.stats.connects += 1
+
+    @property
+    def server(self) -> SSHTunnelForwarder:
+        self.get_engine()
+        return self._server
+
+    @property
+    def engine(self):
+        return self.get_engine()
+
+    def get_engine(self):
+        """Return the pooled engine, (re)starting the tunnel first if it is down."""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset_after_fork()
+
+            if not self._tunnel_is_up():
+                self._start_tunnel()
+
+            if self._engine is None or self._server.local_bind_port != self._local_port:
+                self._create_engine()
+
+            return self._engine
+
+    def _pool_is_saturated(self, engine) -> bool:
+        return engine.pool.checkedout() >= self.pool_size + self.max_overflow
+
+    @contextmanager
+    def connect(self):
+        """Check a connection out of the pool, retrying once if the tunnel has dropped."""
+        engine = self.get_engine()
+
+        for attempt in range(2):
+            saturated = self._pool_is_saturated(engine)
+            start_time = time.time()
+            try:
+                conn = engine.connect()
+                break
+            except OperationalError:
+                if attempt == 1:
+                    raise
+                # Most likely the tunnel went away underneath the pool
+                with self._lock:
+                    if self._server is not None:
+                        self._server.stop()
+                engine = self.get_engine()
+
+        if saturated:
+            self.stats.waits += 1
+            self.stats.wait_seconds += time.time() - start_time
+
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def pool_stats(self) -> Dict:
+        stats = asdict(self.stats)
+        if self._engine is not None:
+            stats["pool_size"] = self._engine.pool.size()
+            stats["checked_out"] = self._engine.pool.checkedout()
+            stats["overflow"] = self._engine.pool.overflow()
+        return stats
+
+    def close(self):
+        """
+        Dispose of the pool and stop the tunnel under every owner. Using the engine
+        again reopens both.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            if self._engine is not None:
+                self._engine.dispose()
+                self._engine = None
+            if self._server is not None:
+                self._server.stop()
+                self._server = None
+            self._local_port = None
+
+
+_ENGINES: Dict[Tuple, TunnelledEngine] = {}
+_ENGINES_LOCK = threading.Lock()
+
+
+def get_tunnelled_engine(**kwargs) -> TunnelledEngine:
+    """
+    Return the process-wide TunnelledEngine for these credentials, creating it if
+    needed. The caller is an owner until it calls release.
+    """
+    key = (kwargs["ssh_address"], kwargs["username"], kwargs["db_name"])
+    with _ENGINES_LOCK:
+        if key not in _ENGINES:
+            _ENGINES[key] = TunnelledEngine(**kwargs)
+        return _ENGINES[key].acquire()
@@ -0,0 +1,163 @@
+"""
+Google Drive calls grouped into batch HTTP requests.
+
+The Drive API accepts up to 100 calls in one batch request. Each call in a batch
+succeeds or fails on its own, so only the failed calls are retried, with exponential
+backoff, and only when the error is transient (rate limits and server errors).
+"""
+
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from googleapiclient.errors import HttpError
+
+# Most calls the Drive API accepts in one batch request
+DRIVE_BATCH_SIZE = 100
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+RETRYABLE_REASONS = {"rateLimitExceeded", "userRateLimitExceeded", "backendError"}
+
+
+def http_status(error: Exception) -> Optional[int]:
+    if isinstance(error, HttpError):
+        return int(error.resp.status)
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether a failed call may succeed when sent again."""
+    if not isinstance(error, HttpError):
+        # Connection errors and timeouts
+        return True
+    if http_status(error) in RETRYABLE_STATUS:
+        return True
+    content = error.content.decode(errors="ignore") if error.content else ""
+    return http_status(error) == 403 and any(
+        reason in content for reason in RETRYABLE_REASONS
+    )
+
+
+def execute_batch(
+    drive, requests: Dict[str, object], retries: int = 5, backoff: float = 1.0
+) -> Tuple[Dict[str, dict], Dict[str, Exception]]:
+    """
+    Run requests in batches of DRIVE_BATCH_SIZE, retrying the calls that failed.
+
+    Args:
+        drive: A Drive v3 service.
+        requests: HttpRequests (e.g. drive.files().delete(fileId=...)) by a key of
+            the caller's choice.
+        retries: Times a transiently failing call is sent again.
+        backoff: Seconds before the first retry, doubled on each retry.
+
+    Returns:
+        The responses and the errors of the calls that did not succeed, by key.
+    """
+    responses, errors = {}, {}
+    pending = list(requests.keys())
+
+    for attempt in range(retries + 1):
+        failed = {}
+
+        def callback(request_id, response, exception):
+            if exception is None:
+                responses[request_id] = response
+            else:
+                failed[request_id] = exception
+
+        for start in range(0, len(pending), DRIVE_BATCH_SIZE):
+            batch = drive.new_batch_http_request(callback=callback)
+            for key in pending[start : start + DRIVE_BATCH_SIZE]:
+                batch.add(requests[key], request_id=key)
+            try:
+                batch.execute()
+            except Exception as e:
+                # The batch request itself failed, none of its calls ran
+                for key in pending[start : start + DRIVE_BATCH_SIZE]:
+                    failed.setdefault(key, e)
+
+        pending = [key for key, error in failed.items() if is_retryable(error)]
+        errors.update({key: error for key, error in failed.items() if key not in pending})
+        if not pending:
+            return responses, errors
+
+        if attempt < retries:
+            time.sleep(backoff * 2**attempt)
+
+    errors.update({key: failed[key] for key in pending})
+    return responses, errors
+
+
+def find_folders(drive, folder_names: Iterable[str]) -> Dict[str, str]:
+    """The id of each named folder that exists, by name."""
+    # Folder names can hold characters a batch request id cannot
+    folder_names = list(folder_names)
+    requests = {
+        str(ix): drive.files().list(
+            q=f"mimeType='application/vnd.google-apps.folder' and name='{name}' and trashed=false",
+            fields="files(id, name)",
+        )
+        for ix, name in enumerate(folder_names)
+    }
+    responses, errors = execute_batch(drive, requests)
+    for ix, error in errors.items():
+        print(f"Could not look up folder {folder_names[int(ix)]}. Error: {error}")
+
+    # Assuming the first result is the folder you're looking for
+    return {
+        folder_names[int(ix)]: response["files"][0]["id"]
+        for ix, response in responses.items()
+        if response.get("files")
+    }
+
+
+def list_folder_files(
+    drive, folder_ids: Iterable[str], page_size: int = 100
+) -> Iterator[Tuple[str, dict]]:
+    """
+    Yield (folder id, file) for every file in the folders.
+
+    The next page of every folder is requested in the same batch, so listing N
+    folders takes as many round trips as the largest folder has pages.
+    """
+    page_tokens = {folder_id: None for folder_id in folder_ids}
+
+    while page_tokens:
+        requests = {
+            folder_id: drive.files().list(
+                q=f"'{folder_id}' in parents and trashed=false",
+                pageSize=page_size,
+                fields="nextPageToken, files(id, name)",
+                pageToken=page_token,
+            )
+            for folder_id, page_token in page_tokens.items()
+        }
+        responses, errors = execute_batch(drive, requests)
+        for folder_id, error in errors.items():
+            print(f"Could not list folder {folder_id}. Error: {error}")
+
+        page_tokens = {}
+        for folder_id, response in responses.items():
+            for file in response.get("files", []):
+                yield folder_id, file
+            if response.get("nextPageToken"):
+                page_tokens[folder_id] = response["nextPageToken"]
+
+
+def delete_files(drive, file_ids: List[str]) -> Tuple[List[str], Dict[str, Exception]]:
+    """
+    Delete files in batches.
+
+    Returns:
+        The ids that are gone, including files that were already deleted, and the
+        errors of the others by id.
+    """
+    requests = {file_id: drive.files().delete(fileId=file_id) for file_id in file_ids}
+    responses, errors = execute_batch(drive, requests)
+
+    deleted = list(responses.keys())
+    for file_id, error in list(errors.items()):
+        if http_status(error) == 404:
+            deleted.append(file_id)
+            del errors[file_id]
+    return deleted, errors
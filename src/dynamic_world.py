@@ -2,16 +2,29 @@ import math
 import time
 import warnings
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional, Tuple
+from typing import List, Optional, Tuple
 
 import ee
 import geopandas as gpd
 import numpy as np
 import pandas as pd
-from shapely.geometry import Polygon
+from shapely.geometry import MultiPolygon, Polygon, shape
 from tqdm import tqdm
 
+from src.boundary_store import BoundaryStore
+from src.chip_grid import (
+    GRID_COLUMNS,
+    cell_size,
+    chip_parts,
+    country_chip_grid,
+    geodesic_area_km2,
+    polygon_boundaries,
+    polygon_coordinates,
+)
 from src.DataBaseManager import DBMS
+from src.export_scheduler import ExportScheduler
+from src.geometry_resolver import GeometryResolver, flip_geometry
+from src.raster_change import stack_file_prefix
 from src.utils import authenticate_Google_Earth_Engine as authenticate
 
 warnings.filterwarnings("ignore", category=FutureWarning)
@@ -31,25 +44,45 @@ class DynamicWorldBasemap:
     test_IDs: Optional[List[str]] = False
     testing: bool = False
     grid_size_meters: int = 10000
+    # Compute the chip grid locally with shapely instead of per cell in Earth Engine
+    local_grid: bool = True
+    # LSIB boundaries, fetched from Earth Engine once per country
+    boundary_store: BoundaryStore = field(default_factory=BoundaryStore)
+    # Submits the export tasks, created after authenticating if not given
+    export_scheduler: Optional[ExportScheduler] = None
+    # Wait for the exports to finish, and retry the failed ones, before create returns
+    wait_for_exports: bool = False
+    # Export all date ranges of a chip as one image with a band per year, instead of
+    # an export per date range
+    multi_year_export: bool = False
+    # Client-side copies of the chip ROIs, fetched from Earth Engine in batches
+    geometry_resolver: GeometryResolver = field(default_factory=GeometryResolver)
 
     global_gdf: gpd.GeoDataFrame = field(default_factory=default_global_gdf)
 
     def __post_init__(self):
         authenticate()
 
+        if self.export_scheduler is None:
+            self.export_scheduler = ExportScheduler(ee.batch)
+
         self.DBMS = DBMS()
 
-        params = {"_AREA_": self.area_name, "_NUM_DATES_": str(len(self.date_ranges))}
-        self.existing_chips = self.DBMS.read(
-            "GET_EXISTING_CHIPS", params=params
-        ).chipid.values
+        params = {"area": self.area_name, "num_dates": len(self.date_ranges)}
+        existing_chips = self.DBMS.read("GET_EXISTING_CHIPS", params=params)
 
+        # Sub-polygon chips (1_2_3-a, 1_2_3-b) all count towards their grid cell 1_2_3
         self.existing_chips = sorted(
-            list(set([i.split("-")[0] for i in self.existing_chips]))
+            set(
+                f"{polygon_index}_{lon_idx}_{lat_idx}"
+                for polygon_index, lon_idx, lat_idx in existing_chips[
+                    ["polygon_index", "lon_idx", "lat_idx"]
+                ].itertuples(index=False)
+            )
         )
 
         self.finished_subpolys = self.DBMS.read(
-            "GET_FINISHED_SUBPOLY", {"_AREA_": self.area_name}
+            "GET_FINISHED_SUBPOLY", {"area": self.area_name}
         ).polygon_index.values.tolist()
 
         print(self.existing_chips)
@@ -60,40 +93,40 @@ class DynamicWorldBasemap:
         coords = geometry.coordinates().getInfo()
         return coords
 
-    def create(self) -> (List[Dict], List[List], List[Dict]):
+    def create(self) -> gpd.GeoDataFrame:
         """
         This is the main function to create the Dynamic World classification map for a given area and date range.
+        Returns the chip grid, see get_DW_classification.
         """
 
         # Authenticate Google Earth Engine Project
         authenticate()
 
         # Call the classifcation function
-        return self.get_DW_classification(
+        result = self.get_DW_classification(
             date_ranges=self.date_ranges,
             area_name=self.area_name,
             area_polygons=self.area_polygons,
         )
 
-    def get_country_LSIB_coordinates(self, country_name: str = "Denmark") -> Tuple:
-        # Load the LSIB dataset.
-        lsib = ee.FeatureCollection("USDOS/LSIB_SIMPLE/2017")
-
-        # Filter the dataset for Denmark.
-        denmark_boundary = lsib.filter(ee.Filter.eq("country_na", country_name))
-
-        # Get the geometry of Denmark.
-        denmark_geometry = denmark_boundary.geometry()
+        if self.wait_for_exports:
+            self.export_scheduler.drain()
+        else:
+            print(self.export_scheduler.summary())
 
-        # Function to extract coordinates (this part is conceptual; see explanation below).
+        return result
 
-        # Example usage (be cautious with getInfo() due to potential for large data transfers).
-        denmark_coords = self.get_coordinates(denmark_geometry)
+    def get_country_LSIB_coordinates(self, country_name: str = "Denmark") -> Tuple:
+        """
+        The coordinates of the country's LSIB polygons and the country as an ee.Geometry.
 
-        # Since using getInfo() on large geometries can be inefficient or exceed memory limits,
-        # consider alternative approaches for handling or visualizing large datasets.
+        The coordinates are read from the boundary store, Earth Engine is only contacted
+        the first time a country is used (see src/boundary_store.py).
+        """
+        coords = self.boundary_store.coordinates(country_name)
 
-        return denmark_coords, denmark_geometry
+        # Built client side from the coordinates, no request is made
+        return coords, ee.Geometry.MultiPolygon(coords)
 
     def flip_coords(self, coords):
         return [[coord[1], coord[0]] for coord in coords]
@@ -102,34 +135,25 @@ class DynamicWorldBasemap:
         """
         Flip longitude and latitude coordinates in an ee.Geometry object.
 
+        The geometry is fetched with one getInfo and flipped locally.
+
         Parameters:
         - geometry: An ee.Geometry object
 
         Returns:
         - A new ee.Geometry object with flipped coordinates
         """
-        # Extract coordinates from the original geometry
-
-        coords = geometry.coordinates().getInfo()
-
-        if geometry.getInfo()["type"] == "Polygon":
-            # Flip the coordinates
-            flipped_coords = [
-                [[coord[1], coord[0]] for coord in part] for part in coords
-            ]
-            flipped_geometry = ee.Geometry.Polygon(flipped_coords)
-
-        elif geometry.getInfo()["type"] == "MultiPolygon":
-            flipped_coords = [
-                [[[coord[1], coord[0]] for coord in subpoly] for subpoly in part]
-                for part in coords
-            ]
-
-            flipped_geometry = ee.Geometry.MultiPolygon(flipped_coords)
-
-        # Create a new geometry with the flipped coordinates
-
-        return flipped_geometry
+        return self.to_ee_geometry(flip_geometry(shape(geometry.getInfo())))
+
+    def to_ee_geometry(self, geometry):
+        """An ee.Geometry of a shapely (Multi)Polygon, built client side."""
+        if isinstance(geometry, Polygon):
+            return ee.Geometry.Polygon(polygon_coordinates(geometry))
+        if isinstance(geometry, MultiPolygon):
+            return ee.Geometry.MultiPolygon(
+                [polygon_coordinates(part) for part in geometry.geoms]
+            )
+        raise ValueError(f"Cannot export a {geometry.geom_type}")
 
     def create_polygon(self, coords: List, flip: bool = True):
         if flip:
@@ -138,45 +162,14 @@ class DynamicWorldBasemap:
             return [ee.Geometry.Polygon(coord[0]) for coord in coords]
 
     def get_polygon_boundaries(self, poly_list):
-        max_lon = 0
-        min_lon = 180
-        max_lat = 0
-        min_lat = 180
-
-        for poly in poly_list:
-            for sub_poly in poly:
-                for coord_set in sub_poly:
-                    if coord_set[0] > max_lat:
-                        max_lat = coord_set[0]
-
-                    if coord_set[0] < min_lat:
-                        min_lat = coord_set[0]
-
-                    if coord_set[1] > max_lon:
-                        max_lon = coord_set[1]
-
-                    if coord_set[1] < min_lon:
-                        min_lon = coord_set[1]
-
-        return max_lon, min_lon, max_lat, min_lat
+        return polygon_boundaries(poly_list)
 
     def get_cell_size(self, country_lat: float):
         """
         This function calculates the cell size for the grid based on the grid_size_meters parameter.
         Basically, it needs to convert the desired grid size in meters to degrees for latitude and longitude.
         """
-
-        # Convert meters to degrees for latitude
-        meters_latitude = self.grid_size_meters
-        meters_longitude = self.grid_size_meters
-        degrees_latitude = meters_latitude / 111000
-
-        # Convert meters to degrees for longitude at Copenhagen's latitude
-        degrees_longitude = meters_longitude / (
-            111000 * math.cos(country_lat * (math.pi / 180))
-        )
-
-        return {"lat": degrees_latitude, "lon": degrees_longitude}
+        return cell_size(country_lat, self.grid_size_meters)
 
     def create_chip_boundary(self, lon, lat, cell_size):
         return [
@@ -193,6 +186,8 @@ class DynamicWorldBasemap:
         """
         This function should probably be broken up, but here goes.
 
+        Returns the intersecting ee.Geometry chips, the raw chip ids and chips, and a
+        row of chip_grid.GRID_COLUMNS per intersecting chip with its flipped ROI.
         """
         # The max and min lat and lon are used to calculate the number of grid cells in each direction.
         max_lat = boundaries[0]
@@ -213,6 +208,7 @@ class DynamicWorldBasemap:
 
         raw_chipids = {}
         raw_chips = {}
+        grid_rows = []
 
         # Break all is essentially a test parameter, which allows you to break the loop early.
         break_all = False
@@ -281,7 +277,19 @@ class DynamicWorldBasemap:
 
                 # If the intersection is not empty, save the chip.
                 # The intersection can be empty, if e.g. the grid cell is above open water
-                if len(inter.getInfo()["coordinates"]) > 0:
+                geojson = inter.getInfo()
+                if len(geojson["coordinates"]) > 0:
+                    # Kept, so get_DW_for_polygons does not fetch the ROI again
+                    roi = self.geometry_resolver.add(cur_idx, geojson)
+                    grid_rows.append(
+                        {
+                            "chipid": cur_idx,
+                            "polygon_index": area_polygon_index,
+                            "lon_idx": lon_idx,
+                            "lat_idx": lat_idx,
+                            "geometry": flip_geometry(roi),
+                        }
+                    )
                     cur_intersecting_chips.append(inter)
                     cur_intersecting_chips_ids.append(cur_idx)
                     if self.testing:
@@ -304,10 +312,10 @@ class DynamicWorldBasemap:
 
         self.DBMS.write(
             "INSERT_FINISHED_SUBPOLY",
-            {"_AREA_": self.area_name, "_POLYGON_INDEX_": str(area_polygon_index)},
+            {"area": self.area_name, "polygon_index": int(area_polygon_index)},
         )
 
-        return intersecting_chips, raw_chipids, raw_chips
+        return intersecting_chips, raw_chipids, raw_chips, grid_rows
 
     def export_single_DW_chip(self, dw_image, roi, start_date, ix):
         # Define export parameters.
@@ -321,9 +329,8 @@ class DynamicWorldBasemap:
             "folder": f"{self.area_name}DynamicWorld",
         }
 
-        # Start the export task.
-        export_task = ee.batch.Export.image.toDrive(**export_params)
-        export_task.start()
+        # Start the export task, once the queue has room for it
+        self.export_scheduler.submit(export_params["fileNamePrefix"], export_params)
 
     def get_single_DW_chip(self, ix, start_date, end_date, roi):
         coordinates = self.flip_coords(roi["coordinates"][0])
@@ -335,22 +342,7 @@ class DynamicWorldBasemap:
 
     def get_single_DW_chip(self, ix, start_date, end_date, roi):
         try:
-            tasks = ee.batch.Task.list()
-
-            # Filter for tasks that are in the QUEUED state
-            queued_tasks = [task for task in tasks if task.state in ["QUEUED", "READY"]]
-
-            # If There are more than 3000 queued export tasks, take a breather
-            while len(queued_tasks) > 3000:
-                print("Queue Exceeding 3000 tasks.")
-                print("Chilling for a bit...\n")
-                time.sleep(10)
-
-                queued_tasks = [
-                    task for task in tasks if task.state in ["QUEUED", "READY"]
-                ]
-
-                continue
+            # The export scheduler waits while more than 3000 export tasks are in flight
 
             # Filter the Dynamic World dataset.
             dw_image = (
@@ -372,6 +364,59 @@ class DynamicWorldBasemap:
 
         return 1
 
+    def get_multi_year_DW_chip(self, ix, date_ranges, roi):
+        try:
+            years = [int(start_date[:4]) for start_date, _ in date_ranges]
+            if len(set(years)) != len(years):
+                raise ValueError(f"Multi-year exports need one date range per year, got {years}")
+
+            # One uint8 band of the label mode per year. A year without images is
+            # all 0, which is no data like the areas outside the ROI
+            bands = []
+            for year, (start_date, end_date) in zip(years, date_ranges):
+                collection = (
+                    ee.ImageCollection("GOOGLE/DYNAMICWORLD/V1")
+                    .filterDate(start_date, end_date)
+                    .filterBounds(roi)
+                    .select("label")
+                )
+                mode = ee.Image(
+                    ee.Algorithms.If(
+                        collection.size().gt(0), collection.mode(), ee.Image.constant(0)
+                    )
+                )
+                bands.append(mode.toUint8().rename(f"label_{year}"))
+
+            export_params = {
+                "image": ee.Image.cat(bands).clip(roi),
+                "description": "land_cover_mode",
+                "scale": 10,
+                "region": roi,
+                "fileFormat": "GeoTIFF",
+                "fileNamePrefix": stack_file_prefix(ix, years),
+                "folder": f"{self.area_name}DynamicWorld",
+            }
+            self.export_scheduler.submit(export_params["fileNamePrefix"], export_params)
+
+            return 1
+
+        except Exception as E:
+            print(E)
+            return 0
+
+    def chip_exports(self, date_ranges) -> List[List[Tuple[str, str]]]:
+        """The date ranges of each export of a chip, all in one with multi_year_export."""
+        if self.multi_year_export:
+            return [list(date_ranges)]
+        return [[date_range] for date_range in date_ranges]
+
+    def export_DW_chip(self, ix, date_ranges, roi):
+        """Export one of the chip_exports of a chip."""
+        if self.multi_year_export:
+            return self.get_multi_year_DW_chip(ix, date_ranges, roi)
+        ((start_date, end_date),) = date_ranges
+        return self.get_single_DW_chip(ix, start_date, end_date, roi)
+
     def get_DW_for_polygons(
         self, polygon_list, date_ranges, cur_intersecting_chips_ids
     ):
@@ -379,103 +424,160 @@ class DynamicWorldBasemap:
         succesful_exports = 0
 
         print(f"EXPORTING {len(polygon_list)} CHIPS FOR {len(date_ranges)} DATE RANGES")
-        print(f"TOTAL EXPORTS: {len(polygon_list) * len(date_ranges)}")
+        print(f"TOTAL EXPORTS: {len(polygon_list) * len(self.chip_exports(date_ranges))}")
+
+        # The ROIs of all chips in a few requests, or none if create_country_grid kept them
+        chip_ids = [str(chip_id) for chip_id in cur_intersecting_chips_ids]
+        try:
+            rois = self.geometry_resolver.resolve(chip_ids, polygon_list)
+        except Exception as E:
+            print(E)
+            failed.extend([[ix] * len(date_ranges) for ix in range(len(polygon_list))])
+            return
+
         # Here we loop over each intersection between the chip grid and the area polygon
-        for ix, polygon in tqdm(
-            enumerate(polygon_list), desc="Getting and Exporting Each DW Chip from GEE"
+        for ix, roi in tqdm(
+            enumerate(rois), desc="Getting and Exporting Each DW Chip from GEE"
         ):
-            chip_id = cur_intersecting_chips_ids[ix]
+            chip_id = chip_ids[ix]
             # Scaffold for validation
             has_printed = False
 
-            # Semantic change
-            roi = polygon
-
             try:
                 # Error I "fixed" very early - would like to omit, but afraid of the consequences :(
-                roi = self.flip_polygon(polygon)
-            except:
+                roi = flip_geometry(roi)
+                # Sub-polygons get a letter added to the ID (1-a, 1-b, 1-c, etc.)
+                parts = [
+                    (part_id, part, self.to_ee_geometry(part))
+                    for part_id, part in chip_parts(chip_id, roi)
+                ]
+            except Exception:
                 failed.append([ix] * len(date_ranges))
                 continue
 
-            # Here we loop over each date range
+            # Here we loop over each date range, or over all at once with multi_year_export
             # For each intersecting polygon we get the Dynamic World classifications for each date range
-            for range_index in range(len(date_ranges)):
-                start_date, end_date = (
-                    date_ranges[range_index][0],
-                    date_ranges[range_index][1],
-                )
-
-                # This mighttttt not be necessary now, however, not sure if it's worth the risk to remove it.
-                if roi.getInfo()["type"] == "MultiPolygon":
-                    for number, sub_poly in enumerate(roi.getInfo()["coordinates"]):
-                        sub_roi = ee.Geometry.Polygon(sub_poly)
-                        area_ = sub_roi.area().divide(10**6).getInfo()
-                        if area_ > 100 and not has_printed:
-                            has_printed = True
-                            print(ix, "SUBPOLYGON AREA:", area_)
-
-                        # Here we get the DW classifications for each sub-polygon
-                        # Inside this function the classifications are exported to the Google Drive
-                        succesful_exports += self.get_single_DW_chip(
-                            str(chip_id)
-                            + "-"
-                            + chr(
-                                97 + number
-                            ),  # This ID addition is in case of multiple sub-polygons. This simply adds a letter to the ID (1-a, 1-b, 1-c, etc.)
-                            start_date,
-                            end_date,
-                            sub_roi,
-                        )
-
-                else:
-                    area_ = roi.area().divide(10**6).getInfo()
+            for export_ranges in self.chip_exports(date_ranges):
+                for part_id, part, sub_roi in parts:
+                    area_ = geodesic_area_km2(part)
                     if area_ > 100 and not has_printed:
                         # This is a validation to see if there are any bugs in the design of the grid.
                         # They should.... not be able to exceed 100 km^2, but may very well be smaller.
                         has_printed = True
-                        print(ix, "POLYGON AREA:", area_)
+                        print(ix, "SUBPOLYGON AREA:" if len(parts) > 1 else "POLYGON AREA:", area_)
 
                     # Here we get the DW classifications for each sub-polygon
                     # Inside this function the classifications are exported to the Google Drive
-                    succesful_exports += self.get_single_DW_chip(
-                        chip_id, start_date, end_date, roi
+                    succesful_exports += self.export_DW_chip(part_id, export_ranges, sub_roi)
+
+                # Scaffold for validation
+                if succesful_exports % 50 == 0:
+                    print(f"{succesful_exports} SUCCESSFUL EXPORTS")
+
+        # The exported ROIs are not needed again
+        self.geometry_resolver.forget(chip_ids)
+
+    def export_chip_rois(self, chips: gpd.GeoDataFrame):
+        """
+        Export the Dynamic World classifications of chips from the local grid.
+
+        The ROIs are already in longitude and latitude, and their parts and areas are
+        known locally, so Earth Engine is only called to start the exports.
+        """
+        succesful_exports = 0
+        for chip_id, roi in zip(chips["chipid"], chips.geometry):
+            # Scaffold for validation
+            has_printed = False
+
+            # Sub-polygons are exported as 1-a, 1-b, 1-c, etc. like in get_DW_for_polygons
+            parts = [
+                (part_id, part, ee.Geometry.Polygon(polygon_coordinates(part)))
+                for part_id, part in chip_parts(chip_id, roi)
+            ]
+
+            for export_ranges in self.chip_exports(self.date_ranges):
+                for part_id, part, sub_roi in parts:
+                    area_ = geodesic_area_km2(part)
+                    if area_ > 100 and not has_printed:
+                        # They should.... not be able to exceed 100 km^2, but may very well be smaller.
+                        has_printed = True
+                        print(chip_id, "POLYGON AREA:", area_)
+
+                    succesful_exports += self.export_DW_chip(
+                        part_id, export_ranges, sub_roi
                     )
 
                 # Scaffold for validation
                 if succesful_exports % 50 == 0:
                     print(f"{succesful_exports} SUCCESSFUL EXPORTS")
 
-    def get_sub_area_grid_params(self):
-        cell_sizes = []
-        all_boundaries = []
+        return succesful_exports
 
-        # Looping over each sub-polygon (if present)
-        # and getting the boundaries and cell sizes for each
-        for poly in self.area_polygons:
-            # This simply returns the coordinates of the polygon
-            poly_coords = self.get_coordinates(poly)
+    def get_local_DW_classification_map(self, coords: List) -> gpd.GeoDataFrame:
+        """
+        create_country_grid for all sub-polygons at once, with the grid and its
+        intersections computed locally (src/chip_grid.py). The chips are exported in
+        batches of 10 and each sub-polygon is marked finished after its chips.
+        """
+        chips = country_chip_grid(
+            coords, self.grid_size_meters, skip_polygons=self.finished_subpolys
+        )
+        print(f"{chips.shape[0]} INTERSECTING CHIPS")
 
-            # Getting the max and min lat and lon for the polygon - essentially the bounding box for the maximums size of the grid
-            boundaries = self.get_polygon_boundaries([poly_coords])
-            all_boundaries.append(boundaries)
+        # Test parameter
+        if self.test_IDs:
+            chips = chips[chips["chipid"].isin(self.test_IDs)]
 
-            # Getting the cell size for the grid
-            # While this is done for each sub-polygon, the cell size should, hopefully, be the same for all sub-polygons
-            cell_size = self.get_cell_size(country_lat=np.mean(boundaries[:2]))
-            cell_sizes.append(cell_size)
+        # This is a delta update mechanism, that skips chips that are already correctly saved in the database.
+        if not self.testing:
+            chips = chips[~chips["chipid"].isin(self.existing_chips)]
 
-        return cell_sizes, all_boundaries
+        for sub_area_index in range(len(coords)):
+            if sub_area_index in self.finished_subpolys:
+                print(f"Skipping entire subregion with index {sub_area_index}")
+                continue
+
+            # This is most definitely a test parameter, which allows you to break the loop early.
+            if self.testing and sub_area_index > 5:
+                break
+
+            sub_area_chips = chips[chips["polygon_index"] == sub_area_index]
+            for start in range(0, sub_area_chips.shape[0], 10):
+                print("EXPORTING")
+                if not self.testing:
+                    self.export_chip_rois(sub_area_chips.iloc[start : start + 10])
 
-    def get_sub_area_DW_classification_map(self, cell_sizes, all_boundaries):
+            self.DBMS.write(
+                "INSERT_FINISHED_SUBPOLY",
+                {"area": self.area_name, "polygon_index": int(sub_area_index)},
+            )
+
+        self.chip_grid = chips
+        return chips
+
+    def get_sub_area_grid_params(self):
+        """
+        The cell size and the boundaries (the bounding box for the maximum size of the
+        grid) of each sub-polygon of the area, from the boundary store.
+        """
+        return self.boundary_store.grid_params(self.area_name, self.grid_size_meters)
+
+    def get_sub_area_DW_classification_map(
+        self, cell_sizes, all_boundaries
+    ) -> gpd.GeoDataFrame:
         """
         This essentially takes all the computed polygons so far, and creates the actual grid of 10km x 10km chips over the area.
         It loops over each sub-polygon, and creates the grid for each, and then finds the intersections between the grid and the sub-polygon.
+
+        Returns the chip grid like get_local_DW_classification_map. The raw chips,
+        intersecting chips and raw chip ids per sub-polygon are kept as raw_chips,
+        intersecting_chips and raw_chipids.
         """
 
         all_raw_chips = []
         all_intersecting_chips = []
         all_raw_chipids = []
+        all_grid_rows = []
 
         # Looping over each sub-polygon-Index and creating the grid for each
         for sub_area_index in range(len(cell_sizes)):
@@ -491,30 +593,47 @@ class DynamicWorldBasemap:
             # The Dynamic World classifications are accessed through the Google Earth Engine, and exported to the uses Google Drive
             # The Name of the folder is saved in the Database, such that the listen.py script can access the files, export them
             # transform them, and then upload them to the database.
-            intersecting_chips, raw_chipids, raw_chips = self.create_country_grid(
+            # The flipped sub-polygon is built from the stored coordinates like
+            # flip_polygon would, without fetching them
+            flipped_polygon = ee.Geometry.Polygon(
+                self.flip_coords(self.area_coords[sub_area_index][0])
+            )
+            intersecting_chips, raw_chipids, raw_chips, grid_rows = self.create_country_grid(
                 boundaries,
                 cell_size,
-                self.flip_polygon(self.area_polygons[sub_area_index]),
+                flipped_polygon,
                 sub_area_index,
             )
             all_raw_chips.append(raw_chips)
             all_intersecting_chips.append(intersecting_chips)
             all_raw_chipids.append(raw_chipids)
+            all_grid_rows += grid_rows
 
         self.intersecting_chips = all_intersecting_chips
-        return all_raw_chips, all_intersecting_chips, all_raw_chipids
+        self.raw_chips = all_raw_chips
+        self.raw_chipids = all_raw_chipids
+
+        self.chip_grid = gpd.GeoDataFrame(
+            pd.DataFrame(all_grid_rows, columns=GRID_COLUMNS),
+            geometry="geometry",
+            crs="EPSG:4326",
+        )
+        return self.chip_grid
 
     def get_DW_classification(
         self,
         date_ranges: List[Tuple[str, str]] = [("2023-01-01", "2023-12-31")],
         area_name: str = "Denmark",
         area_polygons: Optional[List[ee.Geometry.Polygon]] = None,
-    ) -> (List[Dict], List[List], List[Dict]):
+    ) -> gpd.GeoDataFrame:
         """
         This Function takes the stated area as well as the assigned date_ranges and performs a series of steps in order to create the LULC classification maps.
         First it'll get the geographical shape of the country, using the LSIB system. If the country shape consists of multiple geographies, it'll create a polygon for each of them.
         Then each polygon will be used in order to create the smallest possible 10km x 10km grid over the geography, and then find the intersections between the grid and the geography.
         These intersections are used as the REGION OF INTEREST (ROI) for the Dynamic World dataset, and then the classification maps are created and exported using the Google Earth Engine.
+
+        Both the local grid and the Earth Engine grid return a GeoDataFrame of
+        chip_grid.GRID_COLUMNS with the ROIs in longitude and latitude.
         """
 
         self.date_ranges = date_ranges
@@ -522,10 +641,15 @@ class DynamicWorldBasemap:
         # Super random case - if you witsh to run the code on a non-country area.
         if isinstance(area_polygons, type(None)):
             # Get the coordinates of the country shape
-            coords = self.get_country_LSIB_coordinates(area_name)
+            coords, _ = self.get_country_LSIB_coordinates(area_name)
+            self.area_coords = coords
 
             print("Got Coordinates")
 
+            if self.local_grid:
+                print("Creating Intersection Chip Grid")
+                return self.get_local_DW_classification_map(coords)
+
             # Create the list of polygons for the country
             self.area_polygons = self.create_polygon(coords, flip=False)
 
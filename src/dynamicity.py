@@ -0,0 +1,182 @@
+"""
+Pixel dynamicity of a chip: how many land cover classes each pixel passes through.
+
+The yearly rasters of a chip are stacked into a (years, H * W) uint8 array and every
+statistic is computed on it with NumPy, instead of building a list of classes per
+pixel. The class sequences of the pixels are packed into integers and counted over
+all chips by a SequenceCounter. Used by scripts/change_sequences.py.
+"""
+
+import os
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Value of a pixel with no data in any year in the _dynamics.tif rasters
+NODATA_DYNAMICS = -99
+
+# Bits per year of a packed class sequence, enough for the 11 classes
+BITS_PER_CLASS = 4
+
+
+def stack_years(chip_data: Dict[int, np.ndarray], years: List[int]) -> np.ndarray:
+    """
+    Stack the yearly rasters of a chip.
+
+    :param chip_data: year -> (H, W) raster, all of the same shape
+    :return: (len(years), H * W) array, one column per pixel
+    """
+    return np.stack([chip_data[year].ravel() for year in years])
+
+
+def distinct_classes(stack: np.ndarray) -> np.ndarray:
+    """Number of distinct classes of every pixel (column) of a stack."""
+    ordered = np.sort(stack, axis=0)
+    return 1 + np.count_nonzero(ordered[1:] != ordered[:-1], axis=0)
+
+
+def dynamics(stack: np.ndarray, shape: Tuple[int, int]) -> Tuple[np.ndarray, Dict]:
+    """
+    Number of class changes of every pixel, and their summary.
+
+    A pixel that never changes class has 0 changes. Pixels with no data (0) in any
+    year are NODATA_DYNAMICS and left out of the summary.
+
+    :param stack: (years, H * W) array from stack_years
+    :param shape: (H, W) of the chip
+    :return: (H, W) int64 raster of changes, and num_changed_tiles, median and max
+    """
+    changes = distinct_classes(stack).astype(np.int64) - 1
+    nodata = (stack == 0).any(axis=0)
+
+    valid_changes = changes[~nodata]
+    summary = {
+        "num_changed_tiles": int(valid_changes.sum()),
+        "median": float(np.median(valid_changes)) if valid_changes.size else np.nan,
+        "max": int(valid_changes.max()) if valid_changes.size else np.nan,
+    }
+
+    changes[nodata] = NODATA_DYNAMICS
+    return changes.reshape(shape), summary
+
+
+def pack_sequences(stack: np.ndarray) -> np.ndarray:
+    """
+    Pack the class sequence of every pixel into one integer, 4 bits per year.
+
+    The first year takes the highest bits, so packed sequences sort like the
+    sequences themselves. 8 years of the 11 classes fit in a uint32.
+
+    :param stack: (years, pixels) array from stack_years
+    :return: (pixels,) uint32 array
+    """
+    n_years = stack.shape[0]
+    if n_years * BITS_PER_CLASS > 32:
+        raise ValueError(f"{n_years} years do not fit in a uint32")
+    if stack.size and stack.max() >= 2**BITS_PER_CLASS:
+        raise ValueError("Classes must be below 16 to be packed")
+
+    packed = np.zeros(stack.shape[1], dtype=np.uint32)
+    for year_values in stack:
+        packed = (packed << BITS_PER_CLASS) | year_values
+    return packed
+
+
+def unpack_sequences(packed: np.ndarray, n_years: int) -> np.ndarray:
+    """Inverse of pack_sequences: (n,) packed integers to (n, years) classes."""
+    packed = np.asarray(packed, dtype=np.uint32)
+    shifts = BITS_PER_CLASS * np.arange(n_years - 1, -1, -1, dtype=np.uint32)
+    return ((packed[:, None] >> shifts) & (2**BITS_PER_CLASS - 1)).astype(np.uint8)
+
+
+class SequenceCounter:
+    """
+    Number of pixels following each class sequence, over all chips counted so far.
+
+    Counts are kept in a dict keyed by the packed sequence, so adding a chip costs
+    time in the number of distinct sequences of that chip only. save and load
+    checkpoint the counts and the counted chips to an .npz file, and to_frame
+    decodes the sequences to one column per year for export.
+
+    Args:
+        years: Years of the sequences, in order.
+    """
+
+    def __init__(self, years: List[int]):
+        self.years = list(years)
+        self.counts: Dict[int, int] = {}
+        self.chips = set()
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def add(self, chipid: str, stack: np.ndarray) -> bool:
+        """
+        Count the sequences of a chip's (years, pixels) stack.
+
+        :return: False if the chip was already counted and is skipped
+        """
+        if chipid in self.chips:
+            return False
+
+        keys, counts = np.unique(pack_sequences(stack), return_counts=True)
+        self.add_counts(keys, counts)
+        self.chips.add(chipid)
+        return True
+
+    def add_counts(self, keys: np.ndarray, counts: np.ndarray):
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            self.counts[key] = self.counts.get(key, 0) + count
+
+    def update(self, other: "SequenceCounter"):
+        """Add the counts of another counter, e.g. a per-chip shard."""
+        if other.years != self.years:
+            raise ValueError("The counters count sequences of different years")
+        self.add_counts(
+            np.fromiter(other.counts.keys(), dtype=np.uint32, count=len(other.counts)),
+            np.fromiter(other.counts.values(), dtype=np.int64, count=len(other.counts)),
+        )
+        self.chips |= other.chips
+
+    def to_frame(self) -> pd.DataFrame:
+        """One row per sequence: a column per year with its class, and num_tiles."""
+        keys = np.array(sorted(self.counts.keys()), dtype=np.uint32)
+        sequences = unpack_sequences(keys, len(self.years))
+
+        frame = pd.DataFrame(
+            sequences.astype(np.int64), columns=[str(year) for year in self.years]
+        )
+        frame["num_tiles"] = [self.counts[key] for key in keys.tolist()]
+        return frame
+
+    def add_frame(self, frame: pd.DataFrame):
+        """Count the rows of a to_frame export, e.g. a change_sequences.csv."""
+        stack = frame[[str(year) for year in self.years]].to_numpy(dtype=np.uint8).T
+        self.add_counts(pack_sequences(stack), frame["num_tiles"].to_numpy(np.int64))
+
+    def save(self, path: Path):
+        """Checkpoint atomically, a crash leaves the previous checkpoint in place."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        keys = np.fromiter(self.counts.keys(), dtype=np.uint32, count=len(self.counts))
+        counts = np.fromiter(self.counts.values(), dtype=np.int64, count=len(self.counts))
+
+        tmp_path = path.with_name(path.stem + ".tmp.npz")
+        np.savez(
+            tmp_path,
+            years=np.array(self.years),
+            keys=keys,
+            counts=counts,
+            chips=np.array(sorted(self.chips), dtype=str),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "SequenceCounter":
+        with np.load(path) as checkpoint:
+            counter = cls(checkpoint["years"].tolist())
+            counter.add_counts(checkpoint["keys"], checkpoint["counts"])
+            counter.chips = set(checkpoint["chips"].tolist())
+        return counter
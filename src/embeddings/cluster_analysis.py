@@ -15,10 +15,11 @@ def LULC_FROM(country: str):
         "Israel",
     ], "Country not in the list"
 
-    DB = DBMS()
+    # Cached on disk, as this runs for every country on import
+    DB = DBMS(cache=True)
     chip_graphs = DB.read(
         "GET_CHIP_GRAPH",
-        {"_AREA_": country, "_YEAR_FROM_": "2016", "_YEAR_TO_": "2023"},
+        {"area": country, "year_from": 2016, "year_to": 2023},
     )
 
     return chip_graphs
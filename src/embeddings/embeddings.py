@@ -12,48 +12,39 @@ import pandas as pd
 from sklearn.cluster import KMeans
 
 from config import COUNTRY_COLORS
-from src.DataBaseManager import DBMS
+from src.DataBaseManager import DBMS, group_chunks
 
 
-def generate(area="Denmark", verbose=True):
+def generate(area="Denmark", verbose=True, chunksize=100_000):
     assert area in ["Denmark", "Estonia", "Netherlands", "Israel"], "Invalid area"
 
     # get all chips
     DB = DBMS()
 
     if verbose:
-        print(f"Reading data for {area}...")
-    chip_graphs = DB.read(
+        print(f"Streaming chip graphs for {area}...")
+
+    # GET_CHIP_GRAPH is ordered by area and chipid, so each chip's rows arrive together
+    # and only one chunk of the result is in memory at a time
+    chunks = DB.iter_read(
         "GET_CHIP_GRAPH",
-        {"_YEAR_FROM_": "2016", "_YEAR_TO_": "2023", "_AREA_": area},
+        {"year_from": 2016, "year_to": 2023, "area": area},
+        chunksize=chunksize,
     )
 
-    if verbose:
-        print("Number of chips: ", chip_graphs.shape[0])
-
-    # Find the distinct chips
-    distinct_chip_ids = chip_graphs[["area", "chipid"]].drop_duplicates()
-
-    if verbose:
-        print("Number of distinct chips: ", distinct_chip_ids.shape[0])
-
     embeddings = defaultdict(dict)
     if verbose:
         print(f"Calculating embeddings for {area}...")
-    for k, row in distinct_chip_ids.iterrows():
-        chip = row["chipid"]
-        country = row["area"]
-
-        view = chip_graphs[
-            (chip_graphs["chipid"] == chip) & (chip_graphs["area"] == country)
-        ]
-
+    for (country, chip), view in group_chunks(chunks, by=["area", "chipid"]):
         # get graph
         A = format_chip_graph(view)
 
         # SVD
         embeddings[country][chip] = A
 
+    if verbose:
+        print("Number of distinct chips: ", len(embeddings[area]))
+
     return embeddings
 
 
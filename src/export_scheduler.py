@@ -0,0 +1,221 @@
+"""
+Submission of Earth Engine export tasks, rate limited by the task queue.
+
+Earth Engine queues at most a few thousand export tasks per account. The scheduler
+keeps its own count of the tasks in flight: the tasks it started that have not
+finished, plus the other active tasks of the account seen at the last poll. The
+task list is polled at most every poll_interval seconds however many chips are
+submitted, and submit blocks while the count is at max_in_flight. Failed tasks are
+started again after an exponential backoff.
+
+The Earth Engine batch module is passed in, so the scheduler can run against a fake
+one (see scripts/benchmarks/export_scheduler.py).
+"""
+
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, List, Optional
+
+import ee
+
+# Task states of ee.batch.Task
+ACTIVE_STATES = {"UNSUBMITTED", "READY", "RUNNING", "CANCEL_REQUESTED"}
+COMPLETED = "COMPLETED"
+FAILED = "FAILED"
+CANCELLED = "CANCELLED"
+
+
+@dataclass
+class ExportJob:
+    name: str
+    params: dict
+    attempts: int = 0
+    task: object = None
+    state: str = "PENDING"
+    next_attempt_at: float = 0.0
+    error: Optional[str] = None
+
+
+@dataclass
+class ExportStats:
+    submitted: int = 0
+    completed: int = 0
+    failed: int = 0
+    retried: int = 0
+    running: int = 0
+    queued: int = 0
+    polls: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    def per_minute(self, now: float) -> Dict[str, float]:
+        minutes = max(now - self.started_at, 1e-9) / 60
+        return {
+            "submitted": self.submitted / minutes,
+            "completed": self.completed / minutes,
+            "failed": self.failed / minutes,
+        }
+
+    def summary(self, now: float) -> str:
+        rates = self.per_minute(now)
+        return (
+            f"{self.submitted} submitted, {self.running} running, {self.queued} queued, "
+            f"{self.completed} completed, {self.failed} failed ({self.retried} retried). "
+            f"Per minute: {rates['submitted']:.1f} submitted, "
+            f"{rates['completed']:.1f} completed, {rates['failed']:.1f} failed"
+        )
+
+
+class ExportScheduler:
+    """
+    Args:
+        batch: The Earth Engine batch module, ee.batch by default, or a fake with
+            the same Export.image.toDrive and Task.list.
+        max_in_flight: Most active tasks at a time, including those of other runs.
+        poll_interval: Seconds between two listings of the task queue.
+        retries: Times a failed task is started again.
+        backoff: Seconds before the first retry of a task, doubled on each retry.
+        clock: Returns the time in seconds, time.monotonic by default.
+        sleep: Waits a number of seconds, time.sleep by default.
+    """
+
+    def __init__(
+        self,
+        batch=None,
+        max_in_flight: int = 3000,
+        poll_interval: float = 30.0,
+        retries: int = 3,
+        backoff: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.batch = ee.batch if batch is None else batch
+        self.max_in_flight = max_in_flight
+        self.poll_interval = poll_interval
+        self.retries = retries
+        self.backoff = backoff
+        self.clock = clock
+        self.sleep = sleep
+
+        self._lock = threading.RLock()
+        # Started tasks that have not finished, by task id
+        self.active: Dict[str, ExportJob] = {}
+        # Failed jobs waiting for their next attempt
+        self.retry_queue: Deque[ExportJob] = deque()
+        self.failed: List[ExportJob] = []
+        # Active tasks of the account that this scheduler did not start
+        self.external_active = 0
+        self.last_poll: Optional[float] = None
+        self.stats = ExportStats(started_at=clock())
+
+    @property
+    def in_flight(self) -> int:
+        return len(self.active) + self.external_active
+
+    def submit(self, name: str, export_params: dict) -> ExportJob:
+        """
+        Start an image export to Drive once there is room in the queue.
+
+        :param name: Name of the export in logs, e.g. its fileNamePrefix
+        :param export_params: Keyword arguments of Export.image.toDrive
+        """
+        job = ExportJob(name=name, params=export_params)
+        with self._lock:
+            self._wait_for_room()
+            self._start(job)
+            self._start_due_retries()
+        return job
+
+    def poll(self, force: bool = False):
+        """List the task queue if poll_interval has passed since the last listing."""
+        with self._lock:
+            now = self.clock()
+            if not force and self.last_poll is not None and now - self.last_poll < self.poll_interval:
+                return
+            self.last_poll = now
+            self.stats.polls += 1
+
+            tasks = self.batch.Task.list()
+            # ee.batch.Task.State is a str enum
+            states = {task.id: str(getattr(task.state, "value", task.state)) for task in tasks}
+
+            external_active = running = queued = 0
+            for task_id, state in states.items():
+                if state not in ACTIVE_STATES:
+                    continue
+                if task_id not in self.active:
+                    external_active += 1
+                if state == "RUNNING":
+                    running += 1
+                else:
+                    queued += 1
+            self.external_active = external_active
+            self.stats.running, self.stats.queued = running, queued
+
+            for task_id, job in list(self.active.items()):
+                # A task just started can be missing from the listing, it stays active
+                state = states.get(task_id, job.state)
+                job.state = state
+                if state == COMPLETED:
+                    del self.active[task_id]
+                    self.stats.completed += 1
+                elif state in (FAILED, CANCELLED):
+                    del self.active[task_id]
+                    self._failed(job, state, retry=state == FAILED)
+
+    def drain(self):
+        """Wait until every started task and every retry has finished."""
+        with self._lock:
+            while self.active or self.retry_queue:
+                self._start_due_retries()
+                if not self.active and not self.retry_queue:
+                    break
+                self.sleep(self.poll_interval)
+                self.poll()
+            print(self.stats.summary(self.clock()))
+
+    def summary(self) -> str:
+        return self.stats.summary(self.clock())
+
+    def _wait_for_room(self):
+        self.poll()
+        while self.in_flight >= self.max_in_flight:
+            print(f"{self.in_flight} export tasks in flight, waiting for the queue")
+            self.sleep(self.poll_interval)
+            self.poll()
+
+    def _start(self, job: ExportJob):
+        job.attempts += 1
+        try:
+            task = self.batch.Export.image.toDrive(**job.params)
+            task.start()
+        except Exception as e:
+            self._failed(job, repr(e), retry=True)
+            return
+
+        job.task, job.state = task, "READY"
+        self.active[task.id] = job
+        self.stats.submitted += 1
+
+    def _failed(self, job: ExportJob, error: str, retry: bool):
+        job.error = error
+        if retry and job.attempts <= self.retries:
+            job.state = "RETRYING"
+            job.next_attempt_at = self.clock() + self.backoff * 2 ** (job.attempts - 1)
+            self.retry_queue.append(job)
+            self.stats.retried += 1
+        else:
+            job.state = FAILED
+            self.failed.append(job)
+            self.stats.failed += 1
+            print(f"Export {job.name} failed after {job.attempts} attempts. Error: {error}")
+
+    def _start_due_retries(self):
+        now = self.clock()
+        for _ in range(len(self.retry_queue)):
+            job = self.retry_queue.popleft()
+            if job.next_attempt_at > now or self.in_flight >= self.max_in_flight:
+                self.retry_queue.append(job)
+                continue
+            self._start(job)
@@ -0,0 +1,66 @@
+"""
+Client-side copies of Earth Engine geometries, fetched in batches.
+
+Every getInfo is a synchronous request, and get_DW_for_polygons used to make several
+per chip for the same geometry: its coordinates and type to flip it, its type again
+per date range, and its area per sub-polygon. The resolver fetches the geometries of
+many chips with one ee.List(...).getInfo() per batch and keeps them as shapely
+geometries, so flipping, splitting into parts and measuring areas happen locally.
+Geometries already fetched elsewhere, like the intersections create_country_grid
+checks for emptiness, are added to the cache without another request.
+"""
+
+from typing import Dict, Iterable, List
+
+import ee
+import shapely
+from shapely.geometry import shape
+from shapely.geometry.base import BaseGeometry
+
+
+def flip_geometry(geometry: BaseGeometry) -> BaseGeometry:
+    """Swap the x and y of every coordinate, as DynamicWorldBasemap.flip_polygon."""
+    return shapely.transform(geometry, lambda coords: coords[:, ::-1])
+
+
+class GeometryResolver:
+    """
+    Args:
+        batch_size: Geometries fetched per request.
+    """
+
+    def __init__(self, batch_size: int = 100):
+        self.batch_size = batch_size
+        self.cache: Dict[str, BaseGeometry] = {}
+        self.requests = 0
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.cache
+
+    def add(self, key: str, geojson: dict) -> BaseGeometry:
+        """Cache a geometry whose getInfo was already fetched."""
+        self.cache[key] = shape(geojson)
+        return self.cache[key]
+
+    def resolve(self, keys: List[str], geometries: List[ee.Geometry]) -> List[BaseGeometry]:
+        """
+        The shapely geometries of ee.Geometry objects, fetching those not cached.
+
+        :param keys: Cache key of each geometry, e.g. its chip id
+        :param geometries: ee.Geometry objects in the same order as keys
+        """
+        missing = [(key, geometry) for key, geometry in zip(keys, geometries) if key not in self.cache]
+
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start : start + self.batch_size]
+            geojsons = ee.List([geometry for _, geometry in batch]).getInfo()
+            self.requests += 1
+            for (key, _), geojson in zip(batch, geojsons):
+                self.add(key, geojson)
+
+        return [self.cache[key] for key in keys]
+
+    def forget(self, keys: Iterable[str]):
+        """Drop geometries that are no longer needed, e.g. once exported."""
+        for key in keys:
+            self.cache.pop(key, None)
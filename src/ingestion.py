@@ -0,0 +1,621 @@
+"""
+Streaming ingestion of Dynamic World GeoTIFF exports into the database.
+
+The files go through three overlapping stages connected by bounded queues:
+
+    source.list_files -> downloaders (threads) -> converter (process pool)
+        -> writer (DBMS.add_land_cover_type) -> source.delete
+
+Downloads keep running while a batch is converted and the previous batch is written,
+and the bounded queues cap how many files and frames are held in memory: a slow
+writer stalls the converter, which stalls the downloaders. A file is only deleted from
+its source once the batch holding it has been committed.
+
+With cube_dir the rasters are also kept as per-chip cubes (src/cube_store.py), once
+their batch is committed. Writing the cubes is best effort: a file that fails it is
+recorded in IngestionStats.cube_failed and does not fail its batch.
+
+Files that fail a stage are kept in a RetryQueue, a JSON lines file written when the
+run ends, and picked up by retry_failed: files that were committed but not deleted are
+only deleted again, the others are ingested again.
+
+A source is Google Drive (DriveSource) or a local directory of .tif files
+(LocalDirectorySource), which allows measuring throughput and backpressure offline:
+
+    python -m src.ingestion data/DW/Denmark/Raster --area Denmark --backend embedded
+"""
+
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from googleapiclient.discovery import build
+from googleapiclient.http import MediaIoBaseDownload
+from tqdm import tqdm
+
+from config import INGESTION_RETRY_PATH
+from src.cube_store import CubeStore
+from src.data_handlers import trace_raster_years, traced2geo
+from src.drive_batch import delete_files, list_folder_files
+
+# Marks the end of the stream on a queue
+_DONE = object()
+
+
+@dataclass(frozen=True)
+class SourceFile:
+    """
+    A file in a source. id is what the source needs to download and delete it, area
+    overrides the pipeline's area for sources spanning several areas.
+    """
+
+    id: str
+    name: str
+    area: Optional[str] = None
+
+
+class LocalDirectorySource:
+    """
+    The .tif files of a directory, as a stand-in for a Drive folder.
+
+    Args:
+        directory: Directory holding the files, named like the Drive exports.
+        pattern: Glob selecting the files.
+        delete: Remove the files once ingested. Off by default so the same
+            directory can be ingested again.
+        latency: Seconds to sleep per download, to emulate the network.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        pattern: str = "*.tif",
+        delete: bool = False,
+        latency: float = 0.0,
+    ):
+        self.directory = Path(directory)
+        self.pattern = pattern
+        self.delete_files = delete
+        self.latency = latency
+
+    def list_files(self) -> Iterator[SourceFile]:
+        for path in sorted(self.directory.glob(self.pattern)):
+            yield SourceFile(id=str(path), name=path.name)
+
+    def download(self, file: SourceFile) -> bytes:
+        if self.latency:
+            time.sleep(self.latency)
+        return Path(file.id).read_bytes()
+
+    def delete(
+        self, files: List[SourceFile]
+    ) -> Tuple[List[SourceFile], Dict[SourceFile, Exception]]:
+        """Returns the deleted files and the errors of the files that were not."""
+        if not self.delete_files:
+            return [], {}
+
+        deleted, errors = [], {}
+        for file in files:
+            try:
+                Path(file.id).unlink(missing_ok=True)
+                deleted.append(file)
+            except OSError as e:
+                errors[file] = e
+        return deleted, errors
+
+
+class DriveSource:
+    """
+    The files of one or more Google Drive folders.
+
+    Listing and deleting go through batch requests, see src/drive_batch.py. The Drive
+    client is not thread safe, so each thread builds its own.
+
+    Args:
+        credentials: Google credentials, e.g. DriveManager.creds.
+        folders: Id of the folder holding the exports, or a dict of folder id to the
+            area of its exports.
+        page_size: Files listed per request.
+    """
+
+    def __init__(
+        self, credentials, folders: Union[str, Dict[str, str]], page_size: int = 100
+    ):
+        self.credentials = credentials
+        self.folders = {folders: None} if isinstance(folders, str) else dict(folders)
+        self.page_size = page_size
+        self._local = threading.local()
+
+    @property
+    def drive(self):
+        if not hasattr(self._local, "drive"):
+            self._local.drive = build("drive", "v3", credentials=self.credentials)
+        return self._local.drive
+
+    def list_files(self) -> Iterator[SourceFile]:
+        for folder_id, file in list_folder_files(
+            self.drive, self.folders.keys(), page_size=self.page_size
+        ):
+            yield SourceFile(id=file["id"], name=file["name"], area=self.folders[folder_id])
+
+    def download(self, file: SourceFile) -> bytes:
+        request = self.drive.files().get_media(fileId=file.id)
+
+        fh = BytesIO()
+        downloader = MediaIoBaseDownload(fh, request)
+        done = False
+        while not done:
+            _, done = downloader.next_chunk()
+
+        return fh.getvalue()
+
+    def delete(
+        self, files: List[SourceFile]
+    ) -> Tuple[List[SourceFile], Dict[SourceFile, Exception]]:
+        """Returns the deleted files and the errors of the files that were not."""
+        by_id = {file.id: file for file in files}
+        deleted, errors = delete_files(self.drive, list(by_id.keys()))
+        return (
+            [by_id[file_id] for file_id in deleted],
+            {by_id[file_id]: error for file_id, error in errors.items()},
+        )
+
+
+class QueuedSource:
+    """A fixed list of files from another source, e.g. the files of a RetryQueue."""
+
+    def __init__(self, source, files: List[SourceFile]):
+        self.source = source
+        self.files = files
+
+    def list_files(self) -> Iterator[SourceFile]:
+        yield from self.files
+
+    def download(self, file: SourceFile) -> bytes:
+        return self.source.download(file)
+
+    def delete(self, files):
+        return self.source.delete(files)
+
+
+class RetryQueue:
+    """
+    Files that failed a stage of the pipeline, persisted as JSON lines.
+
+    Failures are collected in memory and written by save(), so a failing file costs
+    no disk write while the pipeline runs.
+
+    Args:
+        path: The JSON lines file, read if it exists.
+    """
+
+    def __init__(self, path: Path = INGESTION_RETRY_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.entries: Dict[str, dict] = {}
+        if self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[entry["id"]] = entry
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, files: List[SourceFile], stage: str, error: Exception):
+        """Record that files failed stage (download, convert, write or delete)."""
+        with self._lock:
+            for file in files:
+                attempts = self.entries.get(file.id, {}).get("attempts", 0)
+                self.entries[file.id] = {
+                    "id": file.id,
+                    "name": file.name,
+                    "area": file.area,
+                    "stage": stage,
+                    "error": repr(error),
+                    "attempts": attempts + 1,
+                    "failed_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                }
+
+    def resolve(self, files: List[SourceFile]):
+        with self._lock:
+            for file in files:
+                self.entries.pop(file.id, None)
+
+    def pending(self, stage: Optional[str] = None) -> List[SourceFile]:
+        """The queued files, optionally only those that failed stage."""
+        with self._lock:
+            return [
+                SourceFile(id=entry["id"], name=entry["name"], area=entry["area"])
+                for entry in self.entries.values()
+                if stage is None or entry["stage"] == stage
+            ]
+
+    def save(self):
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "w") as f:
+                for entry in self.entries.values():
+                    f.write(json.dumps(entry) + "\n")
+            os.replace(tmp_path, self.path)
+
+
+@dataclass
+class IngestionStats:
+    files_listed: int = 0
+    files_downloaded: int = 0
+    bytes_downloaded: int = 0
+    files_converted: int = 0
+    files_written: int = 0
+    batches_written: int = 0
+    rows_written: int = 0
+    files_deleted: int = 0
+    failed: Dict[str, str] = field(default_factory=dict)
+    # Files committed to the database whose cubes could not be written
+    cube_failed: Dict[str, str] = field(default_factory=dict)
+    # Seconds each stage spent working, and spent blocked on a full queue downstream
+    busy: Dict[str, float] = field(default_factory=dict)
+    blocked: Dict[str, float] = field(default_factory=dict)
+    duration: float = 0.0
+
+    def add(self, counter: Dict[str, float], stage: str, seconds: float):
+        counter[stage] = counter.get(stage, 0.0) + seconds
+
+    def summary(self) -> str:
+        rate = self.files_written / self.duration if self.duration else 0.0
+        lines = [
+            f"{self.files_written}/{self.files_listed} files ingested in "
+            f"{self.duration:.1f} s ({rate:.2f} files/s, "
+            f"{self.bytes_downloaded / 1e6:.1f} MB downloaded)",
+            f"{self.rows_written} rows in {self.batches_written} batches, "
+            f"{self.files_deleted} files deleted, {len(self.failed)} failed",
+        ]
+        if self.cube_failed:
+            lines.append(f"{len(self.cube_failed)} files not written to the cubes")
+        for stage in ["download", "convert", "write"]:
+            lines.append(
+                f"{stage:>8}: busy {self.busy.get(stage, 0.0):7.1f} s, "
+                f"blocked {self.blocked.get(stage, 0.0):7.1f} s"
+            )
+        return "\n".join(lines)
+
+
+class IngestionPipeline:
+    """
+    Args:
+        source: LocalDirectorySource, DriveSource or anything with the same methods.
+        writer: Object with an add_land_cover_type(gdf) method committing the frame,
+            normally a DBMS.
+        area: Area the chips belong to.
+        download_workers: Concurrent downloads.
+        convert_workers: Processes converting rasters to polygons, defaults to the
+            number of CPUs.
+        batch_files: Files per database write, and so per transaction.
+        max_buffered_batches: Batches that may wait between two stages. Together with
+            batch_files this bounds the memory held by the pipeline.
+        max_files: Stop after this many files, e.g. for a test run.
+        retry_queue: Where failed files are recorded, saved when the run ends.
+        cube_dir: Also keep the rasters in the cube stores (src/cube_store.py) of
+            this directory, e.g. CUBE_STORE_DIR.
+    """
+
+    def __init__(
+        self,
+        source,
+        writer,
+        area: str = "Denmark",
+        download_workers: int = 8,
+        convert_workers: Optional[int] = None,
+        batch_files: int = 100,
+        max_buffered_batches: int = 2,
+        max_files: Optional[int] = None,
+        retry_queue: Optional[RetryQueue] = None,
+        cube_dir: Optional[Path] = None,
+    ):
+        self.source = source
+        self.writer = writer
+        self.area = area
+        self.download_workers = download_workers
+        self.convert_workers = convert_workers or os.cpu_count() or 1
+        self.batch_files = batch_files
+        self.max_files = max_files
+        self.retry_queue = retry_queue
+        self.cube_dir = Path(cube_dir) if cube_dir is not None else None
+        self._cubes = {}
+
+        self.listed = queue.Queue(maxsize=batch_files * max_buffered_batches)
+        self.downloaded = queue.Queue(maxsize=batch_files * max_buffered_batches)
+        self.converted = queue.Queue(maxsize=max_buffered_batches)
+
+        self.stats = IngestionStats()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._progress = None
+
+    def _put(self, target: queue.Queue, item, stage: str) -> bool:
+        """Put on a bounded queue, giving up if the pipeline is stopping."""
+        start_time = time.time()
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=0.5)
+                break
+            except queue.Full:
+                continue
+        with self._lock:
+            self.stats.add(self.stats.blocked, stage, time.time() - start_time)
+        return not self._stop.is_set()
+
+    def _fail(self, files: List[SourceFile], error: Exception, stage: str):
+        with self._lock:
+            for file in files:
+                self.stats.failed[file.name] = repr(error)
+        if self.retry_queue is not None:
+            self.retry_queue.add(files, stage, error)
+
+    def _list(self):
+        try:
+            for ix, file in enumerate(self.source.list_files()):
+                if self.max_files is not None and ix >= self.max_files:
+                    break
+                with self._lock:
+                    self.stats.files_listed += 1
+                if not self._put(self.listed, file, "list"):
+                    return
+        except Exception as e:
+            print(f"Listing the source failed: {e}")
+            self._stop.set()
+        finally:
+            for _ in range(self.download_workers):
+                self._put(self.listed, _DONE, "list")
+
+    def _download(self):
+        while True:
+            try:
+                file = self.listed.get(timeout=0.5)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+            if file is _DONE:
+                self._put(self.downloaded, _DONE, "download")
+                return
+
+            start_time = time.time()
+            try:
+                content = self.source.download(file)
+            except Exception as e:
+                self._fail([file], e, "download")
+                continue
+            with self._lock:
+                self.stats.files_downloaded += 1
+                self.stats.bytes_downloaded += len(content)
+                self.stats.add(self.stats.busy, "download", time.time() - start_time)
+
+            if not self._put(self.downloaded, (file, content), "download"):
+                return
+
+    def _next_batch(self, finished_downloaders: List[int]):
+        """The next batch_files downloaded files, fewer at the end of the stream."""
+        batch = []
+        while len(batch) < self.batch_files:
+            if finished_downloaders[0] == self.download_workers:
+                break
+            try:
+                item = self.downloaded.get(timeout=0.5)
+            except queue.Empty:
+                if self._stop.is_set():
+                    break
+                continue
+            if item is _DONE:
+                finished_downloaders[0] += 1
+            else:
+                batch.append(item)
+        return batch
+
+    def _convert(self):
+        finished_downloaders = [0]
+        try:
+            with ProcessPoolExecutor(max_workers=self.convert_workers) as executor:
+                while not self._stop.is_set():
+                    batch = self._next_batch(finished_downloaders)
+                    if not batch:
+                        break
+
+                    start_time = time.time()
+                    futures = [
+                        (file, executor.submit(trace_raster_years, file.name, content))
+                        for file, content in batch
+                    ]
+                    # A corrupt file only fails itself, not its batch
+                    files, year_files, areas, contents = [], [], [], []
+                    for (file, future), (_, content) in zip(futures, batch):
+                        try:
+                            years = future.result()
+                        except Exception as e:
+                            self._fail([file], e, "convert")
+                            continue
+                        files.append(file)
+                        contents.append(content)
+                        # A multi-year export has a traced raster per year
+                        year_files.extend(years)
+                        areas.extend([file.area or self.area] * len(years))
+                    if not files:
+                        continue
+
+                    try:
+                        frame = traced2geo(
+                            [name for name, _ in year_files],
+                            [traced for _, traced in year_files],
+                            area=areas,
+                        )
+                    except Exception as e:
+                        self._fail(files, e, "convert")
+                        continue
+                    with self._lock:
+                        self.stats.files_converted += len(files)
+                        self.stats.add(self.stats.busy, "convert", time.time() - start_time)
+
+                    if not self._put(
+                        self.converted, (files, frame, contents), "convert"
+                    ):
+                        return
+        except Exception as e:
+            print(f"Conversion stopped: {e}")
+            self._stop.set()
+        finally:
+            self._put(self.converted, _DONE, "convert")
+
+    def _write_cubes(self, files: List[SourceFile], contents: List[bytes]):
+        """Write a committed batch to the cube stores, recording the files that fail."""
+        by_area = defaultdict(dict)
+        for file, content in zip(files, contents):
+            by_area[file.area or self.area][file.name] = content
+
+        errors = {}
+        for area, rasters in by_area.items():
+            try:
+                if area not in self._cubes:
+                    self._cubes[area] = CubeStore(area, path=self.cube_dir / f"{area}.zarr")
+                _, area_errors = self._cubes[area].write_rasters(rasters)
+            except Exception as e:
+                area_errors = {filename: e for filename in rasters}
+            errors.update(area_errors)
+
+        with self._lock:
+            for filename, error in errors.items():
+                self.stats.cube_failed[filename] = repr(error)
+
+    def _write(self):
+        while True:
+            try:
+                item = self.converted.get(timeout=0.5)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+            if item is _DONE:
+                return
+
+            files, frame, contents = item
+            start_time = time.time()
+            try:
+                # add_land_cover_type returns once the transaction is committed
+                self.writer.add_land_cover_type(frame)
+            except Exception as e:
+                self._fail(files, e, "write")
+                continue
+            if self.retry_queue is not None:
+                self.retry_queue.resolve(files)
+
+            if self.cube_dir is not None:
+                self._write_cubes(files, contents)
+
+            deleted, errors = self.source.delete(files)
+            for file, error in errors.items():
+                self._fail([file], error, "delete")
+
+            with self._lock:
+                self.stats.batches_written += 1
+                self.stats.files_written += len(files)
+                self.stats.rows_written += frame.shape[0]
+                self.stats.files_deleted += len(deleted)
+                self.stats.add(self.stats.busy, "write", time.time() - start_time)
+            self._progress.update(len(files))
+
+    def run(self) -> IngestionStats:
+        start_time = time.time()
+        self._progress = tqdm(desc="Ingesting files", unit="file")
+
+        threads = [threading.Thread(target=self._list, name="list")]
+        threads += [
+            threading.Thread(target=self._download, name=f"download-{ix}")
+            for ix in range(self.download_workers)
+        ]
+        threads.append(threading.Thread(target=self._convert, name="convert"))
+
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            # The writer runs here, so a KeyboardInterrupt stops the pipeline
+            self._write()
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            self._progress.close()
+            if self.retry_queue is not None:
+                self.retry_queue.save()
+
+        self.stats.duration = time.time() - start_time
+        print(self.stats.summary())
+        return self.stats
+
+
+def retry_failed(source, writer, retry_queue: RetryQueue, **pipeline_kwargs):
+    """
+    Work off a retry queue against the source the files came from.
+
+    Files that were committed but not deleted are only deleted, the others go
+    through the pipeline again.
+
+    :param pipeline_kwargs: Passed on to IngestionPipeline
+    :return: IngestionStats of the re-ingestion
+    """
+    undeleted = retry_queue.pending("delete")
+    if undeleted:
+        deleted, errors = source.delete(undeleted)
+        retry_queue.resolve(deleted)
+        for file, error in errors.items():
+            retry_queue.add([file], "delete", error)
+        print(f"Deleted {len(deleted)} of {len(undeleted)} already ingested files")
+
+    failed = [
+        file
+        for stage in ["download", "convert", "write"]
+        for file in retry_queue.pending(stage)
+    ]
+    return IngestionPipeline(
+        QueuedSource(source, failed), writer, retry_queue=retry_queue, **pipeline_kwargs
+    ).run()
+
+
+if __name__ == "__main__":
+    from src.DataBaseManager import DBMS
+
+    parser = argparse.ArgumentParser(
+        description="Ingest a directory of Dynamic World GeoTIFFs into the database"
+    )
+    parser.add_argument("directory", type=Path)
+    parser.add_argument("--area", default="Denmark")
+    parser.add_argument("--backend", default=None, help="postgres or embedded")
+    parser.add_argument("--download-workers", type=int, default=8)
+    parser.add_argument("--convert-workers", type=int, default=None)
+    parser.add_argument("--batch-files", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--delete", action="store_true")
+    parser.add_argument("--cube-dir", type=Path, default=None)
+    args = parser.parse_args()
+
+    with DBMS(backend=args.backend) as db:
+        IngestionPipeline(
+            LocalDirectorySource(args.directory, delete=args.delete, latency=args.latency),
+            db,
+            area=args.area,
+            download_workers=args.download_workers,
+            convert_workers=args.convert_workers,
+            batch_files=args.batch_files,
+            cube_dir=args.cube_dir,
+        ).run()
@@ -5,9 +5,16 @@ sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 import time
 import traceback
 
+import pandas as pd
 from tqdm import tqdm
 
+from config import EPSG_MAPPING
 from src.DataBaseManager import DBMS
+from src.raster_change import (
+    index_rasters,
+    land_use_change_from_rasters,
+    read_satlas_footprints,
+)
 
 
 def get_all_chips_from_area(area_name, year_from, year_to):
@@ -20,7 +27,7 @@ def get_all_chips_from_area(area_name, year_from, year_to):
 
     chips = dbms.read(
         "GET_CHIPIDS_FROM_AREA",
-        {"_AREA_": area_name, "_YEAR_FROM_": str(year_from), "_YEAR_TO_": str(year_to)},
+        {"area": area_name, "year_from": year_from, "year_to": year_to},
     )["chipid"].tolist()
 
     return chips
@@ -37,22 +44,6 @@ def upload_results(gdf):
     dbms.add_land_use_change(gdf)
 
 
-def sql_list_from_list(list):
-    """
-    Convert a list to a SQL list
-    :param list: List
-    :return: SQL list
-    """
-    sql_list = "("
-    for i in range(len(list)):
-        sql_list += f"'{list[i]}'"
-        if i != len(list) - 1:
-            sql_list += ","
-    sql_list += ")"
-
-    return sql_list
-
-
 def calculate_lulc_polygon_intersection(area_name, from_year, to_year, chipids):
     """
     Calculate the intersection of LULC polygons with a polygon
@@ -64,16 +55,17 @@ def calculate_lulc_polygon_intersection(area_name, from_year, to_year, chipids):
     """
     dbms = DBMS()
 
-    chipid_sql_list = sql_list_from_list(chipids)
-
     land_use_change_gdf = dbms.read(
         "CALCULATE_LULC_INTERSECTION",
         {
-            "_AREA_": area_name,
-            "_FROM_YEAR_": str(from_year),
-            "_TO_YEAR_": str(to_year),
-            "_CHIPID_LIST_": chipid_sql_list,
+            "area": area_name,
+            "from_year": from_year,
+            "to_year": to_year,
+            "chipid_list": chipids,
+            "epsg": EPSG_MAPPING.get(area_name, EPSG_MAPPING["World"]),
         },
+        geom_query=True,
+        geom_col="land_use_change",
     )
 
     return land_use_change_gdf
@@ -81,7 +73,8 @@ def calculate_lulc_polygon_intersection(area_name, from_year, to_year, chipids):
 
 def format_for_db(gdf, area, from_year, to_year):
     """
-    Format the GeoDataFrame for the database
+    Format the GeoDataFrame for the database.
+    area_km2 and percent_change are added by DBMS.add_land_use_change
     :param gdf: GeoDataFrame
     :return: Formatted GeoDataFrame
     """
@@ -92,12 +85,11 @@ def format_for_db(gdf, area, from_year, to_year):
         "year_to",
         "lulc_category_from",
         "lulc_category_to",
-        "area_km2",
         "from_category_area_sq_km",
-        "percent_change",
         "geom",
     ]
 
+    gdf = pd.DataFrame(gdf)
     gdf["area"] = area
     gdf["year_from"] = from_year
     gdf["year_to"] = to_year
@@ -106,7 +98,6 @@ def format_for_db(gdf, area, from_year, to_year):
             "land_use_change": "geom",
             "preceding_year_name": "lulc_category_from",
             "current_year_name": "lulc_category_to",
-            "intersection_area_sq_km": "area_km2",
             "preceding_area_sq_km": "from_category_area_sq_km",
         }
     )
@@ -158,6 +149,39 @@ def calculate_lulc_for_country(country_name, years, chunk_size=8):
             upload_results(gdf)
 
 
+def calculate_lulc_for_country_from_rasters(country_name, years, raster_dir):
+    """
+    Calculate the LULC for a country from its Dynamic World GeoTIFFs
+    :param country_name: Name of the country
+    :param years: Consecutive years to compare
+    :param raster_dir: Directory of the exported GeoTIFFs ({chipid}_{year}...tif)
+    :return: None
+    """
+    dbms = DBMS()
+    rasters = index_rasters(raster_dir)
+
+    for year_from, year_to in tqdm(zip(years[:-1], years[1:]), desc="from year"):
+        chips = [
+            chipid
+            for chipid in get_all_chips_from_area(country_name, year_from, year_to)
+            if year_from in rasters.get(chipid, {}) and year_to in rasters.get(chipid, {})
+        ]
+        print(f"got {len(chips)} chips with rasters for {country_name}....")
+
+        for chip_chunk in tqdm(create_chip_chunks(chips, 500), desc="Chunks of chips"):
+            footprints = read_satlas_footprints(
+                dbms, country_name, chip_chunk, [year_from, year_to]
+            )
+            df = land_use_change_from_rasters(
+                country_name,
+                [year_from, year_to],
+                rasters,
+                footprints=footprints,
+                chipids=chip_chunk,
+            )
+            dbms.add_land_use_change(df)
+
+
 # Create a function that sends an email with the exception from my try except statement
 
 
@@ -0,0 +1,331 @@
+"""
+On-disk cache of catalog query results.
+
+Results are stored as Parquet (GeoParquet for geometry queries) under QUERY_CACHE_DIR,
+keyed by the query name and its normalized bind parameters. An index.json next to the
+files keeps, per entry, the tables the query reads and the area/years it is restricted
+to, so DBMS writes only invalidate the entries they can have changed. The cache is
+bounded in bytes and evicts the least recently used entries first.
+
+Several processes can share a cache, e.g. the ingestion and a notebook reading with
+cache=True. Every change of the index happens under a file lock, and the index keeps
+a generation that each invalidation increments: a read records it before querying,
+and its result is not stored if a write has invalidated the cache in the meantime,
+as the result may predate that write. Hits only update the access times in memory,
+they are written with the next change of the index or by flush.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import geopandas as gpd
+import pandas as pd
+
+from config import QUERY_CACHE_DIR
+
+# Tables a cached query can depend on
+CACHED_TABLES = ["lulc", "lulc_dissolved", "land_use_change", "sub_polygons", "drive_folders"]
+
+# Bind parameters that restrict a query to an area, and to one or more years
+AREA_PARAMS = ["area", "country"]
+YEAR_PARAMS = ["year", "from_year", "to_year", "year_from", "year_to"]
+YEAR_RANGE_PARAMS = [("start_year", "end_year")]
+
+# Hits whose access times are kept in memory before they are written to the index
+ACCESS_FLUSH_HITS = 100
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    bytes_saved: int = 0  # size of the cached results served instead of querying
+    evictions: int = 0
+    invalidations: int = 0
+
+
+def read_tables(sql: str) -> List[str]:
+    """Tables a query reads from."""
+    tables = re.findall(r"\b(?:FROM|JOIN)\s+(\w+)", sql, flags=re.IGNORECASE)
+    return sorted(set(table.lower() for table in tables) & set(CACHED_TABLES))
+
+
+def written_tables(sql: str) -> List[str]:
+    """Tables a statement writes to."""
+    tables = re.findall(
+        r"\b(?:INSERT\s+INTO|DELETE\s+FROM|UPDATE)\s+(\w+)", sql, flags=re.IGNORECASE
+    )
+    return sorted(set(table.lower() for table in tables))
+
+
+def query_area(params: Dict) -> Optional[str]:
+    for name in AREA_PARAMS:
+        if name in params:
+            return str(params[name])
+    return None
+
+
+def query_years(params: Dict) -> Optional[List[int]]:
+    """The years a query is restricted to, or None if it reads every year."""
+    years = set()
+    for name in YEAR_PARAMS:
+        if name in params:
+            years.add(int(params[name]))
+    for start_name, end_name in YEAR_RANGE_PARAMS:
+        if start_name in params and end_name in params:
+            years.update(range(int(params[start_name]), int(params[end_name]) + 1))
+
+    return sorted(years) if years else None
+
+
+def normalize_params(params: Dict) -> Dict:
+    """JSON-able params where the order of array parameters does not matter."""
+    normalized = {}
+    for name, value in params.items():
+        if isinstance(value, bytes):
+            value = value.hex()
+        elif isinstance(value, (list, tuple)):
+            value = sorted(str(item) for item in value)
+        else:
+            value = str(value)
+        normalized[name] = value
+    return normalized
+
+
+class QueryCache:
+    """
+    Size bounded LRU cache of query results on disk.
+
+    Args:
+        cache_dir: Directory holding the Parquet files and index.json.
+        max_bytes: Total size of the cached files before the least recently used
+            entries are evicted.
+    """
+
+    def __init__(self, cache_dir: Path = QUERY_CACHE_DIR, max_bytes: int = 5 * 1024**3):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.index_path = self.cache_dir / "index.json"
+        self.lock_path = self.cache_dir / "index.lock"
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        # Access times of hits not yet written to the index
+        self._accessed: Dict[str, float] = {}
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # Created right away, so writers in other processes find the cache and
+        # invalidate it while this one's first reads are running
+        with self._locked():
+            if not self.index_path.exists():
+                self._save_index(self._load_index())
+
+    @classmethod
+    def existing(cls, cache_dir: Path = QUERY_CACHE_DIR) -> Optional["QueryCache"]:
+        """The cache in cache_dir if one has been created, used to invalidate on writes."""
+        if not (Path(cache_dir) / "index.json").exists():
+            return None
+        return cls(cache_dir)
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive access to the index, across threads and processes."""
+        with self._lock, open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_index(self) -> Dict:
+        if not self.index_path.exists():
+            return {"generation": 0, "entries": {}}
+        with open(self.index_path) as f:
+            index = json.load(f)
+        if "entries" not in index:
+            # An index from before generations, only holding the entries
+            index = {"generation": 0, "entries": index}
+        return index
+
+    def _save_index(self, index: Dict):
+        for key, last_access in self._accessed.items():
+            if key in index["entries"]:
+                index["entries"][key]["last_access"] = last_access
+        self._accessed.clear()
+
+        # Write and rename so a crash never leaves a half written index
+        tmp_path = self.index_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def generation(self) -> int:
+        """The invalidation generation, to record before a read and pass to put."""
+        with self._locked():
+            return self._load_index()["generation"]
+
+    def flush(self):
+        """Write the access times of the hits kept in memory."""
+        with self._locked():
+            if self._accessed:
+                self._save_index(self._load_index())
+
+    def key(self, query_name: str, params: Dict, geom_col: Optional[str] = None) -> str:
+        payload = json.dumps(
+            [query_name, normalize_params(params), geom_col], sort_keys=True
+        )
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def get(self, query_name: str, params: Dict, geom_col: Optional[str] = None):
+        """The cached result, or None on a miss."""
+        key = self.key(query_name, params, geom_col)
+
+        with self._locked():
+            entry = self._load_index()["entries"].get(key)
+            path = self.cache_dir / f"{key}.parquet"
+
+            if entry is None or not path.exists():
+                self.stats.misses += 1
+                return None
+
+            # Read under the lock, so an invalidation cannot remove the file meanwhile
+            if entry["geom_col"] is not None:
+                frame = gpd.read_parquet(path)
+            else:
+                frame = pd.read_parquet(path)
+
+            self._accessed[key] = time.time()
+            if len(self._accessed) >= ACCESS_FLUSH_HITS:
+                self._save_index(self._load_index())
+
+        self.stats.hits += 1
+        self.stats.bytes_saved += entry["bytes"]
+        return frame
+
+    def put(
+        self,
+        query_name: str,
+        sql: str,
+        params: Dict,
+        frame: pd.DataFrame,
+        geom_col: Optional[str] = None,
+        generation: Optional[int] = None,
+    ) -> bool:
+        """
+        Store a query result together with what it depends on.
+
+        :param generation: The generation recorded before the query ran. The result
+            is not stored if the cache has been invalidated since.
+        :return: Whether the result was stored
+        """
+        key = self.key(query_name, params, geom_col)
+        path = self.cache_dir / f"{key}.parquet"
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+
+        # GeoDataFrame.to_parquet writes GeoParquet
+        frame.to_parquet(tmp_path, index=False)
+
+        with self._locked():
+            index = self._load_index()
+            if generation is not None and index["generation"] != generation:
+                tmp_path.unlink(missing_ok=True)
+                return False
+
+            os.replace(tmp_path, path)
+            index["entries"][key] = {
+                "query_name": query_name,
+                "tables": read_tables(sql),
+                "area": query_area(params),
+                "years": query_years(params),
+                "geom_col": geom_col,
+                "bytes": path.stat().st_size,
+                "last_access": time.time(),
+            }
+            self._evict(index)
+            self._save_index(index)
+        return True
+
+    def _remove(self, index: Dict, key: str):
+        index["entries"].pop(key)
+        self._accessed.pop(key, None)
+        (self.cache_dir / f"{key}.parquet").unlink(missing_ok=True)
+
+    def _evict(self, index: Dict):
+        entries = index["entries"]
+        last_access = {
+            key: self._accessed.get(key, entry["last_access"]) for key, entry in entries.items()
+        }
+        total_bytes = sum(entry["bytes"] for entry in entries.values())
+        for key in sorted(entries, key=last_access.get):
+            if total_bytes <= self.max_bytes:
+                break
+            total_bytes -= entries[key]["bytes"]
+            self._remove(index, key)
+            self.stats.evictions += 1
+
+    def invalidate(
+        self,
+        tables: Iterable[str],
+        area: Optional[str] = None,
+        years: Optional[Iterable[int]] = None,
+    ) -> int:
+        """
+        Drop the entries a write to tables for area and years may have changed.
+
+        An area or years of None means the write is not restricted to one, and so
+        affects every cached query on those tables.
+
+        Returns:
+            int: Number of entries dropped.
+        """
+        tables = set(tables)
+        years = None if years is None else set(int(year) for year in years)
+
+        with self._locked():
+            index = self._load_index()
+            # Reads running now may have fetched the rows before this write
+            index["generation"] += 1
+            stale = []
+            for key, entry in index["entries"].items():
+                if not tables & set(entry["tables"]):
+                    continue
+                if area is not None and entry["area"] is not None and entry["area"] != area:
+                    continue
+                if (
+                    years is not None
+                    and entry["years"] is not None
+                    and not years & set(entry["years"])
+                ):
+                    continue
+                stale.append(key)
+
+            for key in stale:
+                self._remove(index, key)
+            self._save_index(index)
+
+        self.stats.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self):
+        with self._locked():
+            index = self._load_index()
+            index["generation"] += 1
+            for key in list(index["entries"]):
+                self._remove(index, key)
+            self._save_index(index)
+
+    def cache_stats(self) -> Dict:
+        stats = asdict(self.stats)
+        with self._locked():
+            entries = self._load_index()["entries"]
+        stats["entries"] = len(entries)
+        stats["bytes"] = sum(entry["bytes"] for entry in entries.values())
+        return stats
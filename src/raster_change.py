@@ -0,0 +1,388 @@
+"""
+Land use change computed on the Dynamic World rasters instead of their polygons.
+
+CALCULATE_LULC_INTERSECTION dissolves the polygonized rasters per class, subtracts the
+SATLAS footprints and intersects every pair of classes in PostGIS. The rasters of two
+years of a chip are already co-registered, so the same transition areas are a single
+weighted bincount over the pixel pairs:
+
+    areas = np.bincount(from * 11 + to, weights=pixel_area).reshape(11, 11)
+
+SATLAS footprints are burned into the rasters as classes 9 (Wind Turbine) and 10
+(Solar Panel), wind over solar over Dynamic World, as the query orders them. Pixel
+areas are measured in the equal-area CRS of the country (EPSG_MAPPING) like
+calculate_area_km2, so the rows match what DBMS.add_land_use_change stores for the
+SQL path. scripts/raster_change_parity.py compares the two.
+
+The rows carry no geometry, the change polygons are only needed for maps.
+"""
+
+import re
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import rasterio
+from pyproj import CRS, Transformer
+from rasterio.features import rasterize
+from rasterio.io import MemoryFile
+
+from config import EPSG_MAPPING, LAND_COVER_LEGEND
+
+N_CLASSES = len(LAND_COVER_LEGEND)
+WIND_TURBINE = 9
+SOLAR_PANEL = 10
+NAME_TO_CLASS = {name: ix for ix, name in LAND_COVER_LEGEND.items()}
+
+# {polygon_index}_{lon_idx}_{lat_idx}[-a|-b|-c...], the sub-polygons of chip_parts
+CHIPID_REGEX = r"\d+_\d+_\d+(?:-[a-z])?"
+# {chipid}_{year}..., as exported to Drive
+RASTER_NAME_PATTERN = re.compile(rf"^({CHIPID_REGEX})_(\d{{4}})")
+# {chipid}_years_{year}-{year}-..., one band per year, see stack_file_prefix
+STACK_NAME_PATTERN = re.compile(rf"^({CHIPID_REGEX})_years_(\d{{4}}(?:-\d{{4}})*)")
+
+LAND_USE_CHANGE_COLUMNS = [
+    "area",
+    "chipid",
+    "year_from",
+    "year_to",
+    "lulc_category_from",
+    "lulc_category_to",
+    "area_km2",
+    "from_category_area_sq_km",
+    "percent_change",
+    "geom",
+]
+
+
+class RasterBand(NamedTuple):
+    """A band of a GeoTIFF on disk, e.g. a year of a multi-year export."""
+
+    path: Path
+    band: int
+
+
+def stack_file_prefix(chipid: str, years: List[int]) -> str:
+    """Drive file name of a chip's multi-year export, one band per year in order."""
+    return f"{chipid}_years_{'-'.join(str(year) for year in years)}"
+
+
+def raster_years(filename: str) -> Optional[Tuple[str, List[int]]]:
+    """
+    The chip id and the years of the bands of a Drive export.
+
+    :return: (chipid, [year]) for a single year export, (chipid, years) for a
+        multi-year export, None if the name is neither
+    """
+    name = Path(filename).name
+    match = STACK_NAME_PATTERN.match(name)
+    if match is not None:
+        return match.group(1), [int(year) for year in match.group(2).split("-")]
+
+    match = RASTER_NAME_PATTERN.match(name)
+    if match is not None:
+        return match.group(1), [int(match.group(2))]
+    return None
+
+
+def read_raster(raster: Union[bytes, Path, str, tuple], nodata: int = 0, band: int = 1):
+    """
+    Read a band of a Dynamic World GeoTIFF, the first one by default.
+
+    :param raster: GeoTIFF bytes as downloaded from Drive, a path, a RasterBand, or an
+        already read (image, transform, crs) tuple such as CubeStore.get returns
+    :param nodata: Class treated as no data, 0 like polygonize
+    :return: image (uint8), valid pixel mask, transform and crs
+    """
+    if isinstance(raster, RasterBand):
+        raster, band = raster.path, raster.band
+    elif isinstance(raster, tuple):
+        image, transform, crs = raster
+        return image.astype(np.uint8), image != nodata, transform, crs
+
+    if isinstance(raster, bytes):
+        with MemoryFile(raster) as memfile, memfile.open() as src:
+            image, mask = src.read(band), src.read_masks(band)
+            transform, crs = src.transform, src.crs
+    else:
+        with rasterio.open(raster) as src:
+            image, mask = src.read(band), src.read_masks(band)
+            transform, crs = src.transform, src.crs
+
+    valid = (mask > 0) & (image != nodata)
+    return image.astype(np.uint8), valid, transform, crs
+
+
+def pixel_areas_km2(transform, shape: Tuple[int, int], crs, area: str) -> np.ndarray:
+    """
+    Area of every pixel in km2, measured in the equal-area CRS of the area.
+
+    The pixel corners are reprojected in one pyproj call and each pixel's area is
+    the shoelace area of its four projected corners.
+    """
+    height, width = shape
+    epsg = EPSG_MAPPING.get(area, EPSG_MAPPING["World"])
+
+    cols, rows = np.meshgrid(
+        np.arange(width + 1, dtype=np.float64), np.arange(height + 1, dtype=np.float64)
+    )
+    xs, ys = transform * (cols, rows)
+
+    if CRS.from_user_input(crs) != CRS.from_epsg(epsg):
+        transformer = Transformer.from_crs(crs, f"EPSG:{epsg}", always_xy=True)
+        xs, ys = transformer.transform(xs, ys)
+
+    # Corners in ring order: upper left, upper right, lower right, lower left
+    x = [xs[:-1, :-1], xs[:-1, 1:], xs[1:, 1:], xs[1:, :-1]]
+    y = [ys[:-1, :-1], ys[:-1, 1:], ys[1:, 1:], ys[1:, :-1]]
+    twice_area = sum(x[i] * y[(i + 1) % 4] - x[(i + 1) % 4] * y[i] for i in range(4))
+
+    return np.abs(twice_area) / 2 / 10**6
+
+
+def burn_in_footprints(
+    image: np.ndarray, valid: np.ndarray, transform, footprints: Optional[gpd.GeoDataFrame]
+):
+    """
+    Burn SATLAS footprints into a raster as their classes, wind over solar.
+
+    :param footprints: GeoDataFrame with a name column ('Wind Turbine' or 'Solar Panel')
+        and geometries in the raster's CRS
+    :return: image and valid mask with the footprints burned in
+    """
+    if footprints is None or footprints.shape[0] == 0:
+        return image, valid
+
+    image, valid = image.copy(), valid.copy()
+    for name in ["Solar Panel", "Wind Turbine"]:
+        geometries = footprints.geometry[footprints["name"] == name]
+        geometries = geometries[~geometries.is_empty & geometries.notna()]
+        if geometries.shape[0] == 0:
+            continue
+
+        burned = rasterize(
+            geometries.values,
+            out_shape=image.shape,
+            transform=transform,
+            fill=0,
+            default_value=1,
+            dtype=np.uint8,
+        ).astype(bool)
+        image[burned] = NAME_TO_CLASS[name]
+        valid |= burned
+
+    return image, valid
+
+
+def transition_areas(
+    image_from: np.ndarray,
+    valid_from: np.ndarray,
+    image_to: np.ndarray,
+    valid_to: np.ndarray,
+    pixel_area: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Area of every class transition between two co-registered rasters.
+
+    :return: (N_CLASSES, N_CLASSES) km2 changed from row class to column class, and
+        the km2 of each class in the from raster
+    """
+    both = valid_from & valid_to
+    codes = image_from[both].astype(np.intp) * N_CLASSES + image_to[both]
+    transitions = np.bincount(
+        codes, weights=pixel_area[both], minlength=N_CLASSES * N_CLASSES
+    ).reshape(N_CLASSES, N_CLASSES)
+
+    from_area = np.bincount(
+        image_from[valid_from], weights=pixel_area[valid_from], minlength=N_CLASSES
+    )
+    return transitions, from_area
+
+
+def chip_land_use_change(
+    area: str,
+    chipid: str,
+    year_from: int,
+    year_to: int,
+    raster_from,
+    raster_to,
+    footprints_from: Optional[gpd.GeoDataFrame] = None,
+    footprints_to: Optional[gpd.GeoDataFrame] = None,
+    nodata: int = 0,
+) -> pd.DataFrame:
+    """
+    land_use_change rows of one chip and year pair.
+
+    :param raster_from: The chip in year_from, anything read_raster takes
+    :param raster_to: The chip in year_to
+    :param footprints_from: SATLAS footprints of year_from, see burn_in_footprints
+    :param footprints_to: SATLAS footprints of year_to
+    :return: One row per transition with area, like the SQL path without geom
+    """
+    image_from, valid_from, transform, crs = read_raster(raster_from, nodata=nodata)
+    image_to, valid_to, transform_to, _ = read_raster(raster_to, nodata=nodata)
+
+    if image_from.shape != image_to.shape or not transform.almost_equals(transform_to):
+        raise ValueError(
+            f"The {year_from} and {year_to} rasters of chip {chipid} are not co-registered"
+        )
+
+    image_from, valid_from = burn_in_footprints(
+        image_from, valid_from, transform, _to_crs(footprints_from, crs)
+    )
+    image_to, valid_to = burn_in_footprints(
+        image_to, valid_to, transform, _to_crs(footprints_to, crs)
+    )
+
+    transitions, from_area = transition_areas(
+        image_from,
+        valid_from,
+        image_to,
+        valid_to,
+        pixel_areas_km2(transform, image_from.shape, crs, area),
+    )
+
+    class_from, class_to = np.nonzero(transitions)
+    area_km2 = transitions[class_from, class_to]
+    from_category_area = from_area[class_from]
+
+    return pd.DataFrame(
+        {
+            "area": area,
+            "chipid": chipid,
+            "year_from": year_from,
+            "year_to": year_to,
+            "lulc_category_from": [LAND_COVER_LEGEND[ix] for ix in class_from],
+            "lulc_category_to": [LAND_COVER_LEGEND[ix] for ix in class_to],
+            "area_km2": area_km2,
+            "from_category_area_sq_km": from_category_area,
+            "percent_change": area_km2 / from_category_area * 100,
+            "geom": None,
+        },
+        columns=LAND_USE_CHANGE_COLUMNS,
+    )
+
+
+def _to_crs(footprints: Optional[gpd.GeoDataFrame], crs):
+    if footprints is None or footprints.crs is None:
+        return footprints
+    return footprints.to_crs(crs)
+
+
+def read_raster_years(filename: str, raster: Union[bytes, Path, str], nodata: int = 0):
+    """
+    Read every year of a Drive export, single or multi-year.
+
+    :return: chip id and year -> (image, valid, transform, crs) as read_raster returns
+    """
+    parsed = raster_years(filename)
+    if parsed is None:
+        raise ValueError(f"Cannot tell the chip and years of {filename}")
+    chipid, years = parsed
+
+    if isinstance(raster, bytes):
+        with MemoryFile(raster) as memfile, memfile.open() as src:
+            images, masks = src.read(), src.read_masks()
+            transform, crs = src.transform, src.crs
+    else:
+        with rasterio.open(raster) as src:
+            images, masks = src.read(), src.read_masks()
+            transform, crs = src.transform, src.crs
+
+    if images.shape[0] != len(years):
+        raise ValueError(f"{filename} has {images.shape[0]} bands for {len(years)} years")
+
+    return chipid, {
+        year: (
+            images[ix].astype(np.uint8),
+            (masks[ix] > 0) & (images[ix] != nodata),
+            transform,
+            crs,
+        )
+        for ix, year in enumerate(years)
+    }
+
+
+def index_rasters(raster_dir: Path) -> Dict[str, Dict[int, Union[Path, RasterBand]]]:
+    """
+    Chip id -> year -> GeoTIFF for the Drive exports in a directory. The years of a
+    multi-year export are RasterBands of the same file.
+    """
+    rasters = defaultdict(dict)
+    for path in sorted(Path(raster_dir).glob("*.tif")):
+        parsed = raster_years(path.name)
+        if parsed is None:
+            continue
+        chipid, years = parsed
+        if STACK_NAME_PATTERN.match(path.name):
+            for band, year in enumerate(years, start=1):
+                rasters[chipid][year] = RasterBand(path, band)
+        else:
+            rasters[chipid][years[0]] = path
+    return dict(rasters)
+
+
+def land_use_change_from_rasters(
+    area: str,
+    years: List[int],
+    rasters: Dict[str, Dict[int, Union[bytes, Path, RasterBand]]],
+    footprints: Optional[gpd.GeoDataFrame] = None,
+    chipids: Optional[Iterable[str]] = None,
+) -> pd.DataFrame:
+    """
+    land_use_change rows of every chip for each consecutive pair of years.
+
+    :param rasters: Chip id -> year -> raster, e.g. index_rasters(dir) or a CubeStore
+    :param footprints: SATLAS footprints with chipid, year (int) and name columns, e.g.
+        read_satlas_footprints
+    :param chipids: Only these chips, defaults to all in rasters
+    """
+    if footprints is not None:
+        footprints = footprints.set_index(["chipid", "year"]).sort_index()
+
+    def chip_footprints(chipid, year):
+        if footprints is None or (chipid, year) not in footprints.index:
+            return None
+        return footprints.loc[[(chipid, year)]]
+
+    frames = []
+    for chipid in chipids if chipids is not None else rasters.keys():
+        chip_rasters = rasters.get(chipid, {})
+        for year_from, year_to in zip(years[:-1], years[1:]):
+            if year_from not in chip_rasters or year_to not in chip_rasters:
+                continue
+            frames.append(
+                chip_land_use_change(
+                    area,
+                    chipid,
+                    year_from,
+                    year_to,
+                    chip_rasters[year_from],
+                    chip_rasters[year_to],
+                    footprints_from=chip_footprints(chipid, year_from),
+                    footprints_to=chip_footprints(chipid, year_to),
+                )
+            )
+
+    if not frames:
+        return pd.DataFrame(columns=LAND_USE_CHANGE_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def read_satlas_footprints(dbms, area: str, chipids: List[str], years: List[int]):
+    """SATLAS footprints of the chips from lulc_dissolved, with an integer year column."""
+    footprints = dbms.read(
+        "GET_SATLAS_FOOTPRINTS",
+        {
+            "area": area,
+            "chipid_list": list(chipids),
+            "year_list": [f"{year}-01-01" for year in years],
+        },
+        geom_query=True,
+        geom_col="geom",
+    )
+    footprints["year"] = pd.to_datetime(footprints["year"]).dt.year
+    return footprints
@@ -0,0 +1,37 @@
+-- Tables as they were originally created by DataFrame.to_sql, made explicit
+
+CREATE EXTENSION IF NOT EXISTS postgis;
+
+CREATE TABLE IF NOT EXISTS lulc (
+    data_origins VARCHAR(255),
+    name VARCHAR(255),
+    year DATE,
+    chipid VARCHAR(255),
+    area VARCHAR(100),
+    object_id VARCHAR(100),
+    geometries GEOMETRY(GEOMETRY, 4326)
+);
+
+CREATE TABLE IF NOT EXISTS land_use_change (
+    area VARCHAR(255),
+    chipid VARCHAR(255),
+    year_from INTEGER,
+    year_to INTEGER,
+    lulc_category_from VARCHAR(255),
+    lulc_category_to VARCHAR(255),
+    area_km2 DOUBLE PRECISION,
+    from_category_area_sq_km DOUBLE PRECISION,
+    percent_change DOUBLE PRECISION,
+    object_id VARCHAR(100),
+    geom GEOMETRY(GEOMETRY, 4326)
+);
+
+CREATE TABLE IF NOT EXISTS sub_polygons (
+    area VARCHAR(100),
+    polygon_index INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS drive_folders (
+    area VARCHAR(100),
+    foldername VARCHAR(255)
+);
@@ -0,0 +1,19 @@
+-- Equal-area km2 per row, measured in each country's EPSG_MAPPING CRS.
+-- New rows get it from DBMS.add_land_cover_type / add_land_use_change.
+
+ALTER TABLE lulc ADD COLUMN IF NOT EXISTS area_km2 DOUBLE PRECISION;
+
+UPDATE lulc
+SET area_km2 = ST_Area(ST_Transform(geometries, COALESCE(
+        (SELECT srid FROM (VALUES __AREA_EPSG_VALUES__) AS epsg (area, srid) WHERE epsg.area = lulc.area),
+        __DEFAULT_EPSG__))) / 1000000.0
+WHERE area_km2 IS NULL;
+
+-- land_use_change areas used to be measured in EPSG:25832 for every country
+UPDATE land_use_change
+SET area_km2 = ST_Area(ST_Transform(geom, COALESCE(
+        (SELECT srid FROM (VALUES __AREA_EPSG_VALUES__) AS epsg (area, srid) WHERE epsg.area = land_use_change.area),
+        __DEFAULT_EPSG__))) / 1000000.0;
+
+UPDATE land_use_change
+SET percent_change = area_km2 / NULLIF(from_category_area_sq_km, 0) * 100;
@@ -0,0 +1,30 @@
+-- Integer chip coordinates parsed from chipid ({polygon_index}_{lon_idx}_{lat_idx}[-a]).
+-- New rows get them from data_handlers.chip_coordinates at upload.
+
+ALTER TABLE lulc
+    ADD COLUMN IF NOT EXISTS polygon_index INTEGER,
+    ADD COLUMN IF NOT EXISTS lon_idx INTEGER,
+    ADD COLUMN IF NOT EXISTS lat_idx INTEGER,
+    ADD COLUMN IF NOT EXISTS sub_part INTEGER;
+
+ALTER TABLE land_use_change
+    ADD COLUMN IF NOT EXISTS polygon_index INTEGER,
+    ADD COLUMN IF NOT EXISTS lon_idx INTEGER,
+    ADD COLUMN IF NOT EXISTS lat_idx INTEGER,
+    ADD COLUMN IF NOT EXISTS sub_part INTEGER;
+
+UPDATE lulc
+SET polygon_index = CAST(split_part(split_part(chipid, '_', 1), '-', 1) AS INTEGER),
+    lon_idx = CAST(split_part(split_part(chipid, '_', 2), '-', 1) AS INTEGER),
+    lat_idx = CAST(split_part(split_part(chipid, '_', 3), '-', 1) AS INTEGER),
+    sub_part = CASE WHEN position('-' IN chipid) > 0
+                    THEN ascii(split_part(chipid, '-', 2)) - ascii('a') END
+WHERE polygon_index IS NULL;
+
+UPDATE land_use_change
+SET polygon_index = CAST(split_part(split_part(chipid, '_', 1), '-', 1) AS INTEGER),
+    lon_idx = CAST(split_part(split_part(chipid, '_', 2), '-', 1) AS INTEGER),
+    lat_idx = CAST(split_part(split_part(chipid, '_', 3), '-', 1) AS INTEGER),
+    sub_part = CASE WHEN position('-' IN chipid) > 0
+                    THEN ascii(split_part(chipid, '-', 2)) - ascii('a') END
+WHERE polygon_index IS NULL;
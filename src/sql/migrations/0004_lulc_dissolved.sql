@@ -0,0 +1,26 @@
+-- One ST_Union'ed geometry per area/chip/year/origin/category, kept up to date by
+-- DBMS.refresh_lulc_dissolved whenever add_land_cover_type appends chips.
+
+CREATE TABLE IF NOT EXISTS lulc_dissolved (
+    area VARCHAR(100),
+    chipid VARCHAR(255),
+    year DATE,
+    data_origins VARCHAR(255),
+    name VARCHAR(255),
+    geom GEOMETRY(GEOMETRY, 4326),
+    area_km2 DOUBLE PRECISION
+);
+
+INSERT INTO lulc_dissolved (area, chipid, year, data_origins, name, geom, area_km2)
+SELECT area,
+       chipid,
+       year,
+       data_origins,
+       name,
+       ST_Union(geometries),
+       ST_Area(ST_Transform(ST_Union(geometries), COALESCE(
+           (SELECT srid FROM (VALUES __AREA_EPSG_VALUES__) AS epsg (area, srid) WHERE epsg.area = lulc.area),
+           __DEFAULT_EPSG__))) / 1000000.0
+FROM lulc
+WHERE NOT EXISTS (SELECT 1 FROM lulc_dissolved)
+GROUP BY area, chipid, year, data_origins, name;
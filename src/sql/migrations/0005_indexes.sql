@@ -0,0 +1,22 @@
+-- GiST indexes for the spatial predicates and B-tree indexes for the filter columns
+-- the catalog queries use.
+
+CREATE INDEX IF NOT EXISTS lulc_geometries_gist_idx
+    ON lulc USING GIST (geometries);
+CREATE INDEX IF NOT EXISTS lulc_area_year_origin_chip_idx
+    ON lulc (area, year, data_origins, chipid);
+CREATE INDEX IF NOT EXISTS lulc_area_chip_coordinates_idx
+    ON lulc (area, polygon_index, lat_idx, lon_idx);
+
+CREATE INDEX IF NOT EXISTS lulc_dissolved_geom_idx
+    ON lulc_dissolved USING GIST (geom);
+CREATE INDEX IF NOT EXISTS lulc_dissolved_lookup_idx
+    ON lulc_dissolved (area, year, data_origins, chipid);
+
+CREATE INDEX IF NOT EXISTS land_use_change_geom_gist_idx
+    ON land_use_change USING GIST (geom);
+CREATE INDEX IF NOT EXISTS land_use_change_area_years_chip_idx
+    ON land_use_change (area, year_from, year_to, chipid);
+
+CREATE INDEX IF NOT EXISTS sub_polygons_area_idx
+    ON sub_polygons (area);
@@ -0,0 +1,55 @@
+-- Declarative partitioning of lulc: a LIST partition per area, each split into
+-- yearly RANGE partitions. Areas and years without a partition land in the
+-- DEFAULT partitions, so new countries can be uploaded before they get their own.
+
+ALTER TABLE lulc RENAME TO lulc_unpartitioned;
+
+CREATE TABLE lulc (LIKE lulc_unpartitioned INCLUDING DEFAULTS) PARTITION BY LIST (area);
+
+DO $$
+DECLARE
+    area_name TEXT;
+    area_table TEXT;
+    partition_year INTEGER;
+BEGIN
+    FOR area_name IN
+        SELECT DISTINCT area FROM lulc_unpartitioned WHERE area IS NOT NULL
+        UNION
+        SELECT unnest(ARRAY[__AREAS__])
+    LOOP
+        area_table := 'lulc_' || lower(regexp_replace(area_name, '[^a-zA-Z0-9]+', '_', 'g'));
+
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF lulc FOR VALUES IN (%L) PARTITION BY RANGE (year)',
+            area_table, area_name
+        );
+
+        FOR partition_year IN 2015..2025 LOOP
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                area_table || '_' || partition_year,
+                area_table,
+                make_date(partition_year, 1, 1),
+                make_date(partition_year + 1, 1, 1)
+            );
+        END LOOP;
+
+        EXECUTE format('CREATE TABLE %I PARTITION OF %I DEFAULT', area_table || '_default', area_table);
+    END LOOP;
+END $$;
+
+CREATE TABLE lulc_default PARTITION OF lulc DEFAULT;
+
+INSERT INTO lulc SELECT * FROM lulc_unpartitioned;
+
+DROP TABLE lulc_unpartitioned;
+
+-- Indexes created on the parent are created on every partition
+CREATE INDEX lulc_geometries_gist_idx
+    ON lulc USING GIST (geometries);
+CREATE INDEX lulc_area_year_origin_chip_idx
+    ON lulc (area, year, data_origins, chipid);
+CREATE INDEX lulc_area_chip_coordinates_idx
+    ON lulc (area, polygon_index, lat_idx, lon_idx);
+
+ANALYZE lulc;
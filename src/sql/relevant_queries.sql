@@ -1,13 +1,15 @@
 
-CREATE INDEX landcover_index
-ON lulv USING GIST (geometries);
+-- Superseded by src/sql/migrations/0005_indexes.sql (this targeted the misspelled "lulv"
+-- and was never created). Run `python -m src.migrations` instead.
+-- CREATE INDEX landcover_index
+-- ON lulv USING GIST (geometries);
 
 
 
 
 SELECT area,year, CAST(SUM(area_in_square_kilometers) AS INT) as area_in_square_kilometers FROM(
 
-select year, area , ST_Area(ST_Transform(geometries, 25832)) / 1000000.0 as area_in_square_kilometers from lulc 
+select year, area , area_km2 as area_in_square_kilometers from lulc 
 where data_origins = 'DynamicWorld'
 ) iq
 GROUP BY year, area
@@ -18,7 +20,7 @@ ORDER BY year desc
 SELECT * FROM (
 	SELECT area,year,chipid, CAST(SUM(area_in_square_kilometers) AS INT) as area_in_square_kilometers FROM(
 
-select year, area, chipid , ST_Area(ST_Transform(geometries, 25832)) / 1000000.0 as area_in_square_kilometers from lulc 
+select year, area, chipid , area_km2 as area_in_square_kilometers from lulc 
 where data_origins = 'DynamicWorld'
 ) iq
 GROUP BY year, area, chipid
@@ -87,7 +89,7 @@ FROM
 SELECT * FROM (
 	SELECT area,year,polygon_id, CAST(SUM(area_in_square_kilometers) AS INT) as area_in_square_kilometers FROM(
 
-select year, area, CAST(split_part(split_part(chipid, '_', 1), '-', 1) AS INT) as polygon_id, ST_Area(ST_Transform(geometries,25832))/1000000 as area_in_square_kilometers from lulc 
+select year, area, CAST(split_part(split_part(chipid, '_', 1), '-', 1) AS INT) as polygon_id, area_km2 as area_in_square_kilometers from lulc 
 where data_origins = 'DynamicWorld'
 ) iq
 GROUP BY year, area, polygon_id
@@ -101,7 +103,7 @@ ORDER BY area,polygon_id,year;
 SELECT * FROM (
 SELECT area,year,chipid, SUM(area_in_square_kilometers)  as area_in_square_kilometers FROM(
 
-select year, area, chipid , ST_Area(ST_Transform(geometries, 25832)) / 1000000.0 as area_in_square_kilometers from lulc 
+select year, area, chipid , area_km2 as area_in_square_kilometers from lulc 
 where data_origins = 'SATLAS'
 ) iq
 GROUP BY year, area, chipid
@@ -113,7 +115,7 @@ ORDER BY area_in_square_kilometers desc;
 SELECT * FROM (
 SELECT area,year, SUM(area_in_square_kilometers)  as area_in_square_kilometers FROM(
 
-select year, area , ST_Area(ST_Transform(geometries, 25832)) / 1000000.0 as area_in_square_kilometers from lulc 
+select year, area , area_km2 as area_in_square_kilometers from lulc 
 where data_origins = 'SATLAS'
 ) iq
 GROUP BY year, area
@@ -125,7 +127,7 @@ ORDER BY area_in_square_kilometers desc;
 
 
 -- Find the area used per name in a specific area for all years
-SELECT area,name,year,ST_Area(ST_Transform(ST_Union(geometries), 25832)) / 1000000.0 AS result_geom_area_km2 from lulc WHERE area = "BLAH" AND WHERE data_origins = 'SATLAS' or data_origins = 'DynamicWorld' group by area,name,year;
+SELECT area,name,year,SUM(area_km2) AS result_geom_area_km2 from lulc_dissolved WHERE area = 'BLAH' AND (data_origins = 'SATLAS' or data_origins = 'DynamicWorld') group by area,name,year;
 
 SELECT ST_Area(ST_Transform(ST_Difference(DynamicWorld.lulc_polygon, SATLAS.lulc_polygon), 25832)) / 1000000.0 AS result_geom_area_km2
 
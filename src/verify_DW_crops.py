@@ -26,17 +26,13 @@ def get_all_chips_from_area(area_name):
     """
     dbms = DBMS()
 
-    chips = dbms.read("GET_ONLY_CHIPIDS_FROM_AREA", {"_AREA_": area_name})[
+    chips = dbms.read("GET_ONLY_CHIPIDS_FROM_AREA", {"area": area_name})[
         "chipid"
     ].tolist()
 
     return chips
 
 
-def sql_list_strings(list_):
-    return ",".join(["'" + str(i) + "'" for i in list_])
-
-
 DB = DBMS()
 
 
@@ -44,10 +40,10 @@ def get_DW_chips(chip_ids, year, DB=DB):
     results = DB.read(
         "GET_ONLY_DW_LANDCOVER",
         {
-            "_CHIPIDS_": sql_list_strings(chip_ids),
-            "_AREA_": "Denmark",
-            "_START_YEAR_": year,
-            "_END_YEAR_": year,
+            "chipids": chip_ids,
+            "area": "Denmark",
+            "start_year": year,
+            "end_year": year,
         },
         geom_query=True,
     )
@@ -55,14 +51,13 @@ def get_DW_chips(chip_ids, year, DB=DB):
     return results
 
 
-def verify_DW_crops(year=2016):
+def verify_DW_crops(year=2016, chunksize=100_000):
     print("Getting chips from", year)
 
     gdfs = []
 
     # get all chips
     chips = get_all_chips_from_area(area_name="Denmark")
-    chip_chunks = create_chip_chunks(chips, 20)
 
     print("Reading LandbrugsGIS data")
     dpath = f"data/LandbrugsGIS/Markblokke{year}.shp"
@@ -71,9 +66,21 @@ def verify_DW_crops(year=2016):
 
     df.sindex
 
-    for chip_chunk in tqdm(chip_chunks, desc="Looping through chunks..."):
-        print("Getting DW data")
-        DW_data = get_DW_chips(chip_chunk, str(year))
+    # The DW polygons of all chips are streamed in chunks of at most chunksize rows.
+    # Polygons do not overlap, so the intersecting areas can be summed across chunks.
+    DW_chunks = DB.iter_read(
+        "GET_ONLY_DW_LANDCOVER",
+        {
+            "chipids": chips,
+            "area": "Denmark",
+            "start_year": year,
+            "end_year": year,
+        },
+        chunksize=chunksize,
+        geom_query=True,
+    )
+
+    for DW_data in tqdm(DW_chunks, desc="Looping through chunks..."):
         # dissolve the data by name
         print("Dissolving...")
         DW_data_dissolved = DW_data.dissolve(by="name").reset_index()
@@ -7,7 +7,6 @@ from src.data_handlers import (
     process_wind_turbines,
 )
 from src.DataBaseManager import DBMS
-from sqlalchemy import create_engine
 import geopandas as gpd
 import pandas as pd
 from tqdm import tqdm
@@ -44,20 +43,10 @@ def load_SATLAS_wind():
         AND name = 'Wind Turbine'
         """
 
-    DB.server.start()
-    local_port = str(DB.server.local_bind_port)
-
-    engine = create_engine(
-        "postgresql://{}:{}@{}:{}/{}".format(
-            DB.username, DB.password, "127.0.0.1", local_port, DB.db_name
-        )
-    )
-
-    SATLAS_turbines = gpd.GeoDataFrame.from_postgis(
-        Q, engine, geom_col="geometries"
-    ).drop_duplicates(subset=["object_id"])
-
-    DB.server.stop()
+    with DB.connect() as conn:
+        SATLAS_turbines = DB.backend.read_frame(
+            conn, Q, {}, geom_col="geometries"
+        ).drop_duplicates(subset=["object_id"])
 
     SATLAS_turbines = SATLAS_turbines[["object_id", "geometries"]]
     SATLAS_turbines.set_geometry("geometries", inplace=True)